@@ -1,6 +1,10 @@
-from flask import Flask, jsonify
+from flask import Flask, jsonify, Response
 from flask_cors import CORS
-from config.database import init_db, test_connection
+from config.database import test_connection, get_pool_stats, init_request_scope
+from utils.metrics import init_metrics, render_metrics
+from utils.query_debug import init_query_debug
+from utils.health import health_checker
+from models.sales_rollup import rollup_refresher
 import os
 from dotenv import load_dotenv
 
@@ -23,6 +27,21 @@ app.config['JSON_AS_ASCII'] = False
 app.config['JSON_SORT_KEYS'] = False
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
 
+# 每個 request 共用一條資料庫連線與交易
+init_request_scope(app)
+
+# HTTP 延遲與每個 request 的 SQL 數量統計
+init_metrics(app)
+
+# 開發模式：偵測 N+1 與重複查詢
+init_query_debug(app)
+
+# 背景健康檢查 (供 /readyz 使用)
+health_checker.ensure_started()
+
+# 背景更新每日銷售彙總 (SALES_ROLLUP_INTERVAL=0 時改由排程執行 manage.py refresh-sales-rollups)
+rollup_refresher.ensure_started()
+
 # 註冊路由
 app.register_blueprint(auth_bp)
 app.register_blueprint(designer_bp)
@@ -42,13 +61,37 @@ def home():
 
 @app.route('/health')
 def health_check():
-    db_status = init_db()
+    """整體狀態 (使用背景檢查的快取結果，不會每次都連資料庫)"""
+    health_checker.ensure_started()
+    ready, checks = health_checker.snapshot()
+    db_status = checks['database']['ok']
     return jsonify({
-        'status': 'healthy' if db_status else 'unhealthy',
+        'status': 'healthy' if ready else 'unhealthy',
         'database': 'connected' if db_status else 'disconnected',
+        'pool': get_pool_stats(),
         'environment': os.getenv('FLASK_ENV', 'production')
     })
 
+@app.route('/livez')
+def liveness_check():
+    """存活探針：process 能回應就算活著，不檢查相依服務"""
+    return jsonify({'status': 'alive'})
+
+@app.route('/readyz')
+def readiness_check():
+    """就緒探針：回傳背景檢查器的快取結果 (含最近一次延遲與失敗次數)"""
+    health_checker.ensure_started()
+    ready, checks = health_checker.snapshot()
+    return jsonify({
+        'status': 'ready' if ready else 'not_ready',
+        'checks': checks
+    }), 200 if ready else 503
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus 格式的指標 (HTTP 延遲、SQL 延遲、慢查詢、連線池)"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/test-db')
 def test_db():
     """測試資料庫連線的詳細資訊"""
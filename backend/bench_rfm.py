@@ -0,0 +1,114 @@
+"""
+RFM 評分的效能比較 (不需要資料庫；正確性由 test_rfm.py 檢查)
+比較 AnalysisService.segment_customer 逐筆評分與 utils/rfm.py 整批評分的結果與速度
+執行: python bench_rfm.py
+"""
+import random
+import timeit
+from decimal import Decimal
+from models.analysis import AnalysisService
+from utils import rfm
+from utils.rfm import LEGACY_THRESHOLDS, quantile_thresholds, score_batch, score_rows
+
+
+def legacy_rows(rows):
+    return [
+        AnalysisService.segment_customer(row['recency_days'], row['frequency'], row['monetary'])
+        for row in rows
+    ]
+
+def make_rows(count, rng):
+    """隨機顧客 (金額為 Decimal，與資料庫查回的型態相同)"""
+    return [
+        {
+            'recency_days': rng.randrange(0, 800),
+            'frequency': rng.randrange(1, 30),
+            'monetary': Decimal(rng.randrange(100, 60000)) + Decimal('0.50') * rng.randrange(2),
+        }
+        for _ in range(count)
+    ]
+
+def boundary_rows():
+    """每個門檻本身與前後一點，所有組合"""
+    def around(cuts):
+        values = {0, 1}
+        for cut in cuts:
+            values.update((cut - 1, cut, cut + 1))
+        return sorted(values)
+
+    return [
+        {'recency_days': r, 'frequency': f, 'monetary': Decimal(m)}
+        for r in around(LEGACY_THRESHOLDS['recency'])
+        for f in around(LEGACY_THRESHOLDS['frequency'])
+        for m in around(LEGACY_THRESHOLDS['monetary'])
+    ] + [{'recency_days': 60, 'frequency': 10, 'monetary': Decimal('19999.99')}]
+
+
+def bench(label, func, number):
+    seconds = timeit.timeit(func, number=number) / number
+    print(f"  {label:<28} {seconds * 1e3:10.2f} ms")
+    return seconds
+
+
+def check_legacy(rng):
+    print("\n🔍 固定門檻與 segment_customer 結果比對")
+    for label, rows in (('門檻邊界', boundary_rows()), ('隨機顧客', make_rows(20000, rng))):
+        expected = [{**row, **info} for row, info in zip(rows, legacy_rows(rows))]
+        assert score_rows(rows) == expected, f'{label}: 結果與 segment_customer 不同'
+        # 沒有 numpy 時的 bisect 版本也要相同
+        backend, rfm.np = rfm.np, None
+        try:
+            assert score_rows(rows) == expected, f'{label}: bisect 版本結果不同'
+        finally:
+            rfm.np = backend
+        print(f"  {label:<28} {len(rows):>6} 筆一致")
+
+def check_quantile(rng):
+    print("\n🔍 五分位數門檻")
+    rows = make_rows(10000, rng)
+    columns = ([row['recency_days'] for row in rows], [row['frequency'] for row in rows],
+               [row['monetary'] for row in rows])
+    thresholds = quantile_thresholds(*columns)
+    backend, rfm.np = rfm.np, None
+    try:
+        assert quantile_thresholds(*columns) == thresholds or all(
+            abs(a - b) < 1e-6 for name in thresholds for a, b in zip(thresholds[name], quantile_thresholds(*columns)[name])
+        ), 'bisect 版本門檻不同'
+    finally:
+        rfm.np = backend
+    scores = score_batch(*columns, thresholds=thresholds)
+    for name in ('r_score', 'm_score'):
+        counts = [scores[name].count(score) for score in range(1, 6)]
+        # 連續分布下每個分數約佔 1/5
+        assert all(abs(count - len(rows) / 5) < len(rows) * 0.02 for count in counts), f'{name} 分布不均: {counts}'
+        print(f"  {name:<28} {counts}")
+    assert quantile_thresholds([], [], []) == LEGACY_THRESHOLDS, '沒有資料時應使用固定門檻'
+
+def bench_scoring(rng):
+    print(f"\n📈 評分速度 (numpy: {'有' if rfm.np is not None else '無，使用 bisect'})")
+    for count in (1000, 20000, 100000):
+        rows = make_rows(count, rng)
+        columns = ([row['recency_days'] for row in rows], [row['frequency'] for row in rows],
+                   [row['monetary'] for row in rows])
+        print(f"{count} 位顧客，只評分")
+        old = bench('segment_customer 逐筆', lambda: legacy_rows(rows), 3)
+        new = bench('rfm.score_batch 整批', lambda: score_batch(*columns), 3)
+        print(f"  {'加速':<28} {old / new:10.1f} x")
+        # 端點實際的工作：評分並合併成回應的每一列 (建立 dict 的成本兩邊相同)
+        print(f"{count} 位顧客，評分 + 合併資料列")
+        old = bench('segment_customer 逐筆', lambda: [
+            {**row, **info} for row, info in zip(rows, legacy_rows(rows))
+        ], 3)
+        new = bench('rfm.score_rows 整批', lambda: score_rows(rows), 3)
+        print(f"  {'加速':<28} {old / new:10.1f} x")
+
+
+if __name__ == '__main__':
+    rng = random.Random(42)
+    print("=" * 60)
+    print("⏱️ RFM 評分測試")
+    print("=" * 60)
+    check_legacy(rng)
+    check_quantile(rng)
+    bench_scoring(rng)
+    print("\n✅ 固定門檻結果與 segment_customer 一致")
@@ -0,0 +1,74 @@
+"""
+銷售儀表板查詢的效能比較 (需要有資料的資料庫，只讀取不寫入)
+比較舊的逐項查詢 (get_monthly_kpi ... get_monthly_trend)、直接查 reservation 的 SalesModel.get_dashboard_live
+與讀每日彙總表的 SalesModel.get_dashboard 的 SQL 次數、延遲與結果
+執行: python bench_sales.py [--runs 5] (彙總表需已更新：python manage.py refresh-sales-rollups)
+"""
+import argparse
+import statistics
+import time
+from models.sales import SalesModel
+from utils.query_debug import track_queries
+
+
+def legacy_dashboard():
+    """舊寫法：/api/manager/analysis/sales 原本依序呼叫的五個方法"""
+    retention_rate = SalesModel.get_retention_rate()
+    return {
+        'kpi': SalesModel.get_monthly_kpi(),
+        'metrics': {
+            'avg_interval_days': SalesModel.get_purchase_interval(),
+            'acquisition_rate': SalesModel.get_acquisition_rate(),
+            'retention_rate': retention_rate,
+            'churn_rate': round(100 - retention_rate, 2)
+        },
+        'trend': SalesModel.get_monthly_trend()
+    }
+
+def measure(label, func, runs):
+    with track_queries() as recorder:
+        result = func()
+    queries = recorder.count
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    median = statistics.median(timings)
+    print(f"  {label:<24} SQL {queries:>3} 次  中位數 {median * 1000:8.1f} ms  (最快 {min(timings) * 1000:.1f} ms)")
+    return result, queries, median
+
+def compare(old, new):
+    """
+    列出兩邊的數值 (以今天為 as_of)
+    定義差異：舊的本月 KPI 取「兩個月內最新有資料的月份」、趨勢從 6 個月前的同一天開始；
+    新的固定以 as_of 所在月份與前一個月計算、趨勢從完整月份開始
+    """
+    print("\n🔍 結果比對 (舊 / 新)")
+    for section in ('kpi', 'metrics'):
+        for key, value in new[section].items():
+            mark = '  ' if old[section].get(key) == value else '≠ '
+            print(f"  {mark}{section}.{key:<22} {old[section].get(key)!s:>12} / {value!s:<12}")
+    old_trend = {row['month']: (row['revenue'], row['order_count']) for row in old['trend']}
+    for row in new['trend']:
+        previous = old_trend.get(row['month'])
+        mark = '  ' if previous == (row['revenue'], row['order_count']) else '≠ '
+        print(f"  {mark}trend {row['month']:<18} {previous!s:>12} / {(row['revenue'], row['order_count'])!s}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='每種寫法執行幾次取中位數')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("⏱️ 銷售儀表板查詢效能比較")
+    print("=" * 60)
+    old, old_queries, old_time = measure('舊寫法 (逐項查詢)', legacy_dashboard, args.runs)
+    live, live_queries, live_time = measure('get_dashboard_live', SalesModel.get_dashboard_live, args.runs)
+    new, new_queries, new_time = measure('get_dashboard (彙總表)', SalesModel.get_dashboard, args.runs)
+    print(f"  {'SQL 次數':<24} {old_queries} -> {live_queries} -> {new_queries}")
+    print(f"  {'加速 (相對舊寫法)':<24} {old_time / live_time:.1f} x -> {old_time / new_time:.1f} x")
+    compare(old, new)
+    # 彙總表與直接計算的結果應完全相同 (彙總表有待重算日期時可能不同)
+    print(f"\n{'✅' if live == new else '❌'} 彙總表與直接計算的結果{'一致' if live == new else '不同'}")
@@ -0,0 +1,145 @@
+"""
+預約時段計算的效能測試 (不需要資料庫)
+比較舊的「每個 slot 掃過所有預約」寫法與 utils/scheduling.py 的結果與速度
+執行: python bench_scheduling.py
+"""
+import random
+import timeit
+from datetime import date, datetime, timedelta
+from utils.scheduling import (
+    SHOP_OPEN, SHOP_CLOSE, busy_intervals, day_slots, day_windows, has_conflict, minutes_of_day, overlaps,
+    slot_grid, sweep_available
+)
+
+DAY = date(2030, 1, 7)
+NOW = datetime(2030, 1, 1, 9, 0)
+
+
+def legacy_slots(day, duration_min, reservations, step_min):
+    """舊寫法：每個 slot 重新掃過所有預約 (O(slots x 預約))"""
+    date_str = day.isoformat()
+    current_slot = datetime.strptime(f"{date_str} {SHOP_OPEN}", "%Y-%m-%d %H:%M")
+    shop_close_time = datetime.strptime(f"{date_str} {SHOP_CLOSE}", "%Y-%m-%d %H:%M")
+    available_slots = []
+    while current_slot + timedelta(minutes=duration_min) <= shop_close_time:
+        slot_start = current_slot
+        slot_end = current_slot + timedelta(minutes=duration_min)
+        is_conflict = False
+        for res in reservations:
+            res_start = res['reserved_time']
+            res_end = res_start + timedelta(minutes=res['duration_min'])
+            if slot_start < res_end and slot_end > res_start:
+                is_conflict = True
+                break
+        if not is_conflict:
+            available_slots.append(slot_start.strftime("%H:%M"))
+        current_slot += timedelta(minutes=step_min)
+    return available_slots
+
+def legacy_conflict(start_time, duration_min, reservations):
+    end_time = start_time + timedelta(minutes=duration_min)
+    for res in reservations:
+        exist_start = res['reserved_time']
+        exist_end = exist_start + timedelta(minutes=res['duration_min'])
+        if start_time < exist_end and end_time > exist_start:
+            return True
+    return False
+
+
+def make_day(day, count, rng):
+    """產生一天內 count 筆隨機預約 (可能重疊，模擬多張座位或資料異常)"""
+    opening = datetime.combine(day, datetime.min.time()) + timedelta(hours=11)
+    return [
+        {
+            'reservation_id': index,
+            'reserved_time': opening + timedelta(minutes=rng.randrange(0, 480, 5)),
+            'duration_min': rng.choice([15, 30, 60, 90]),
+        }
+        for index in range(count)
+    ]
+
+def bench(label, func, number):
+    seconds = timeit.timeit(func, number=number) / number
+    print(f"  {label:<28} {seconds * 1e6:10.1f} µs")
+    return seconds
+
+
+def bench_dense_days(rng):
+    print("\n📈 單日：預約數 x 時段間隔")
+    for step_min in (30, 5):
+        for count in (5, 50, 200):
+            reservations = sorted(make_day(DAY, count, rng), key=lambda res: res['reserved_time'])
+            expected = legacy_slots(DAY, 30, reservations, step_min)
+            actual = day_slots(DAY, 30, reservations, now=NOW, step_min=step_min, buffer_min=0)
+            assert actual == expected, '結果與舊寫法不同'
+            print(f"step={step_min} 分, {count} 筆預約")
+            old = bench('舊寫法', lambda: legacy_slots(DAY, 30, reservations, step_min), 200)
+            new = bench('scheduling.day_slots', lambda: day_slots(
+                DAY, 30, reservations, now=NOW, step_min=step_min, buffer_min=0), 200)
+            print(f"  {'加速':<28} {old / new:10.1f} x")
+
+def bench_conflict(rng):
+    print("\n📈 衝突檢查")
+    for count in (5, 50, 200):
+        reservations = make_day(DAY, count, rng)
+        starts = [datetime.combine(DAY, datetime.min.time()) + timedelta(minutes=m) for m in range(660, 1140, 5)]
+        for start in starts:
+            assert has_conflict(start, 30, reservations, buffer_min=0) == legacy_conflict(start, 30, reservations)
+        minutes = [minutes_of_day(s, DAY) for s in starts]
+
+        def prebuilt():
+            busy = busy_intervals(reservations, DAY, buffer_min=0)
+            return [overlaps(busy, m, m + 30) for m in minutes]
+
+        assert prebuilt() == [legacy_conflict(s, 30, reservations) for s in starts], '結果與舊寫法不同'
+
+        # 建立預約時只檢查一次 (舊寫法遇到第一個衝突就停，單次檢查差異不大)
+        print(f"{count} 筆預約，單次檢查 (最晚的時段)")
+        last = starts[-1]
+        bench('舊寫法', lambda: legacy_conflict(last, 30, reservations), 200)
+        bench('scheduling.has_conflict', lambda: has_conflict(last, 30, reservations, buffer_min=0), 200)
+        # 同一天檢查多次 (系列預約、批次檢查) 時先建好區間
+        print(f"{count} 筆預約 x {len(starts)} 次檢查")
+        old = bench('舊寫法', lambda: [legacy_conflict(s, 30, reservations) for s in starts], 20)
+        new = bench('busy_intervals + overlaps', prebuilt, 20)
+        print(f"  {'加速':<28} {old / new:10.1f} x")
+
+def bench_long_range(rng):
+    print("\n📈 多天 x 多位設計師 (不指定設計師查詢)")
+    for designers, days in ((5, 7), (20, 31)):
+        schedule = {
+            (designer_id, DAY + timedelta(days=offset)): make_day(DAY + timedelta(days=offset), 12, rng)
+            for designer_id in range(designers)
+            for offset in range(days)
+        }
+
+        def per_designer_legacy():
+            for offset in range(days):
+                day = DAY + timedelta(days=offset)
+                for designer_id in range(designers):
+                    legacy_slots(day, 60, schedule[(designer_id, day)], 30)
+
+        def sweep():
+            for offset in range(days):
+                day = DAY + timedelta(days=offset)
+                windows = {
+                    designer_id: day_windows(day, 60, schedule[(designer_id, day)], buffer_min=0)
+                    for designer_id in range(designers)
+                }
+                sweep_available(windows, slot_grid(day, NOW, step_min=30))
+
+        print(f"{designers} 位設計師 x {days} 天")
+        old = bench('舊寫法 (逐位設計師)', per_designer_legacy, 5)
+        new = bench('scheduling sweep line', sweep, 5)
+        print(f"  {'加速':<28} {old / new:10.1f} x")
+
+
+if __name__ == '__main__':
+    rng = random.Random(42)
+    print("=" * 60)
+    print("⏱️ 預約時段計算效能測試")
+    print("=" * 60)
+    bench_dense_days(rng)
+    bench_conflict(rng)
+    bench_long_range(rng)
+    print("\n✅ 結果與舊寫法一致")
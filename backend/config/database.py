@@ -1,11 +1,114 @@
 import pymysql
 from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
 import os
+import re
+import threading
+import time
 from dotenv import load_dotenv
+from flask import current_app, g, has_request_context
+from utils.metrics import Counter, Gauge, Histogram
 
 # 載入環境變數
 load_dotenv()
 
+# 超過此毫秒數的查詢會被記錄到慢查詢 log
+SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', 500))
+
+DB_QUERY_SECONDS = Histogram('db_query_duration_seconds', 'SQL 執行時間 (依正規化後的 SQL 分類)', ('query',))
+DB_SLOW_QUERIES = Counter('db_slow_queries_total', '超過門檻的慢查詢次數', ('query',))
+
+_FINGERPRINT_RULES = [
+    (re.compile(r'/\*.*?\*/', re.S), ' '),              # 區塊註解
+    (re.compile(r'--[^\n]*'), ' '),                     # 行尾註解
+    (re.compile(r"'(?:[^'\\]|\\.|'')*'"), '?'),        # 字串常數
+    (re.compile(r'%\(\w+\)s|%s'), '?'),                  # 參數佔位符
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),            # 數字常數
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?+)'),  # IN (?, ?, ...) 視為同一種查詢
+    (re.compile(r'\s+'), ' '),
+]
+_fingerprint_cache = {}
+
+def fingerprint_sql(sql):
+    """把 SQL 正規化 (去掉常數、參數與空白)，相同結構的查詢會得到相同字串"""
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf8', 'replace')
+    cached = _fingerprint_cache.get(sql)
+    if cached is not None:
+        return cached
+    fingerprint = sql
+    for pattern, replacement in _FINGERPRINT_RULES:
+        fingerprint = pattern.sub(replacement, fingerprint)
+    fingerprint = fingerprint.strip()[:200]
+    if len(_fingerprint_cache) < 2000:
+        _fingerprint_cache[sql] = fingerprint
+    return fingerprint
+
+def _redact_params(args):
+    """慢查詢 log 不輸出參數內容 (可能有個資)，只留型別"""
+    if args is None:
+        return None
+    if isinstance(args, dict):
+        return {key: type(value).__name__ for key, value in args.items()}
+    if isinstance(args, (list, tuple)):
+        return [type(value).__name__ for value in args]
+    return type(args).__name__
+
+# 其他模組可註冊的查詢監聽器：fn(fingerprint, sql, args, elapsed)
+_query_listeners = []
+
+def add_query_listener(listener):
+    """註冊查詢監聽器 (例如開發模式的 N+1 偵測)"""
+    if listener not in _query_listeners:
+        _query_listeners.append(listener)
+
+def _record_query(sql, args, elapsed):
+    """記錄單次 SQL 的延遲、request 累計數量與慢查詢"""
+    fingerprint = fingerprint_sql(sql)
+    for listener in _query_listeners:
+        listener(fingerprint, sql, args, elapsed)
+    DB_QUERY_SECONDS.observe(elapsed, query=fingerprint)
+    if has_request_context():
+        g._db_query_count = g.get('_db_query_count', 0) + 1
+        g._db_query_seconds = g.get('_db_query_seconds', 0.0) + elapsed
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        DB_SLOW_QUERIES.inc(query=fingerprint)
+        print(f"🐢 慢查詢 {elapsed * 1000:.1f}ms: {fingerprint} 參數: {_redact_params(args)}")
+
+
+class _InstrumentedCursorMixin:
+    """包住 execute / executemany，記錄每次查詢的耗時"""
+    _in_executemany = False
+
+    def execute(self, query, args=None):
+        if self._in_executemany:
+            # executemany 內部會呼叫 execute，只在外層記錄一次
+            return super().execute(query, args)
+        start = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            _record_query(query, args, time.perf_counter() - start)
+
+    def executemany(self, query, args):
+        start = time.perf_counter()
+        self._in_executemany = True
+        try:
+            return super().executemany(query, args)
+        finally:
+            self._in_executemany = False
+            _record_query(query, None, time.perf_counter() - start)
+
+
+class InstrumentedDictCursor(_InstrumentedCursorMixin, pymysql.cursors.DictCursor):
+    pass
+
+
+class InstrumentedSSDictCursor(_InstrumentedCursorMixin, pymysql.cursors.SSDictCursor):
+    pass
+
+
 # 資料庫配置 - 從環境變數讀取
 DB_CONFIG = {
     'host': os.getenv('DB_HOST'),
@@ -14,28 +117,485 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD'),
     'database': os.getenv('DB_NAME'),
     'charset': 'utf8mb4',
-    'cursorclass': pymysql.cursors.DictCursor,
+    'cursorclass': InstrumentedDictCursor,
     'ssl': {
         'ssl_mode': 'VERIFY_IDENTITY'
     }  # TiDB Cloud 需要 SSL 連線
 }
 
-@contextmanager
+# 讀寫分離 - 標記為唯讀的 Model 方法改走讀取端點
+# primary : 不分流 (預設)
+# replica : 連到 DB_READ_HOST (另一個讀取用端點)
+# follower: 同一端點，但開啟 TiDB follower read (強一致，分擔 leader 負載)
+# stale   : 同一端點，依各方法容忍的延遲使用 TiDB stale read
+DB_READ_MODE = os.getenv('DB_READ_MODE') or ('replica' if os.getenv('DB_READ_HOST') else 'primary')
+
+READ_DB_CONFIG = {
+    **DB_CONFIG,
+    'host': os.getenv('DB_READ_HOST') or DB_CONFIG['host'],
+    'port': int(os.getenv('DB_READ_PORT', DB_CONFIG['port'])),
+    'user': os.getenv('DB_READ_USER') or DB_CONFIG['user'],
+    'password': os.getenv('DB_READ_PASSWORD') or DB_CONFIG['password'],
+    'autocommit': True,  # 唯讀連線不開交易，stale read 也需要在交易外執行
+}
+if DB_READ_MODE == 'follower':
+    READ_DB_CONFIG['init_command'] = f"SET SESSION tidb_replica_read = '{os.getenv('DB_REPLICA_READ', 'follower')}'"
+
+# 連線池配置 - 重用 TCP/TLS 連線，避免每次查詢都重新握手
+POOL_CONFIG = {
+    # 每個 process 最多開幾條連線；request 從頭到尾佔用一條連線，所以至少要與 gunicorn 執行緒數相同
+    # 未設定 DB_POOL_SIZE 時依 GUNICORN_THREADS
+    'max_size': int(os.getenv('DB_POOL_SIZE') or os.getenv('GUNICORN_THREADS') or 5),
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),              # 連線用完時最多等待秒數
+    'max_age': float(os.getenv('DB_POOL_MAX_AGE', 1800)),            # 連線最長壽命 (秒)，超過就回收
+    'idle_timeout': float(os.getenv('DB_POOL_IDLE_TIMEOUT', 300)),   # 閒置超過此秒數就回收
+    'ping_interval': float(os.getenv('DB_POOL_PING_INTERVAL', 10)),  # 閒置超過此秒數，借出前先 ping
+}
+
+
+class PoolTimeoutError(Exception):
+    """等待連線池超時"""
+    pass
+
+
+class ConnectionPool:
+    """
+    執行緒安全、有上限的資料庫連線池
+    - 借出前驗證連線 (閒置一段時間才 ping，減少來回)
+    - 依最長壽命與閒置時間回收連線
+    - fork 之後 (gunicorn worker) 自動丟棄父程序的連線，不共用 socket
+    """
+
+    def __init__(self, config, max_size=5, timeout=30, max_age=1800, idle_timeout=300, ping_interval=10):
+        self.config = config
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+        self._reset()
+
+    def _reset(self):
+        """(重新) 初始化池內狀態，fork 後也會呼叫"""
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+        self._idle = []      # 閒置連線 (LIFO，最近用過的優先借出)
+        self._size = 0       # 目前開啟中的連線數 (閒置 + 借出)
+        self._stats = {
+            'checkouts': 0,
+            'created': 0,
+            'recycled': 0,
+            'ping_failures': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'wait_time_total_ms': 0.0,
+            'wait_time_max_ms': 0.0,
+        }
+
+    def _check_pid(self):
+        # fork 後的子程序不可使用父程序的連線 (socket 是共用的)
+        # 直接丟棄即可：pymysql 回收物件時只關閉本地 socket，不會送出 QUIT
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _connect(self):
+        conn = pymysql.connect(**self.config)
+        now = time.monotonic()
+        conn._pool_created_at = now
+        conn._pool_last_used = now
+        self._stats['created'] += 1
+        return conn
+
+    def _is_expired(self, conn, now):
+        if self.max_age and now - conn._pool_created_at > self.max_age:
+            return True
+        if self.idle_timeout and now - conn._pool_last_used > self.idle_timeout:
+            return True
+        return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """借出一條連線，池滿時等待，超過 timeout 則拋出 PoolTimeoutError"""
+        self._check_pid()
+        start = time.monotonic()
+        waited = False
+        conn = None
+        expired = []
+
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._idle:
+                    candidate = self._idle.pop()
+                    if self._is_expired(candidate, now):
+                        expired.append(candidate)
+                        self._size -= 1
+                        self._stats['recycled'] += 1
+                        continue
+                    conn = candidate
+                    break
+                if conn is not None:
+                    break
+                if self._size < self.max_size:
+                    self._size += 1  # 先佔位，在鎖外建立連線
+                    break
+
+                remaining = self.timeout - (now - start)
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(f"等待資料庫連線超過 {self.timeout} 秒")
+                waited = True
+                self._cond.wait(remaining)
+
+            wait_ms = (time.monotonic() - start) * 1000
+            self._stats['checkouts'] += 1
+            if waited:
+                self._stats['waits'] += 1
+            self._stats['wait_time_total_ms'] += wait_ms
+            self._stats['wait_time_max_ms'] = max(self._stats['wait_time_max_ms'], wait_ms)
+
+        for old in expired:
+            self._close_quietly(old)
+
+        try:
+            if conn is not None and time.monotonic() - conn._pool_last_used > self.ping_interval:
+                try:
+                    conn.ping(reconnect=False)
+                except Exception:
+                    self._stats['ping_failures'] += 1
+                    self._close_quietly(conn)
+                    conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            # 建立連線失敗，釋放佔位
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def release(self, conn, discard=False):
+        """歸還連線；discard=True 表示連線已不可靠，直接關閉"""
+        if self._pid != os.getpid():
+            # fork 前借出的連線，不歸還也不關閉
+            return
+        now = time.monotonic()
+        if not discard and (not conn.open or self._is_expired(conn, now)):
+            discard = True
+        with self._cond:
+            if discard:
+                self._size -= 1
+                self._stats['recycled'] += 1
+            else:
+                conn._pool_last_used = now
+                self._idle.append(conn)
+            self._cond.notify()
+        if discard:
+            self._close_quietly(conn)
+
+    def close_all(self):
+        """關閉所有閒置連線"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        """連線池狀態 (大小與等待時間)"""
+        self._check_pid()
+        with self._cond:
+            data = dict(self._stats)
+            data['max_size'] = self.max_size
+            data['size'] = self._size
+            data['idle'] = len(self._idle)
+            data['in_use'] = self._size - len(self._idle)
+        data['wait_time_total_ms'] = round(data['wait_time_total_ms'], 2)
+        data['wait_time_max_ms'] = round(data['wait_time_max_ms'], 2)
+        data['wait_time_avg_ms'] = round(data['wait_time_total_ms'] / data['checkouts'], 2) if data['checkouts'] else 0
+        return data
+
+
+_pools = {}
+_pool_lock = threading.Lock()
+
+def get_pool(name='primary'):
+    """取得 (lazy 建立) 全域連線池，name: 'primary' 或 'read'"""
+    pool = _pools.get(name)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                config = READ_DB_CONFIG if name == 'read' else DB_CONFIG
+                pool = _pools[name] = ConnectionPool(config, **POOL_CONFIG)
+    return pool
+
+def get_pool_stats(name='primary'):
+    """回傳連線池統計資料"""
+    return get_pool(name).stats()
+
+def _collect_pool_stats():
+    for name, pool in list(_pools.items()):
+        stats = pool.stats()
+        for key in ('size', 'idle', 'in_use', 'max_size', 'checkouts', 'waits', 'timeouts', 'created', 'recycled'):
+            yield {'pool': name, 'stat': key}, stats[key]
+        yield {'pool': name, 'stat': 'wait_time_total_ms'}, stats['wait_time_total_ms']
+
+DB_POOL_STATS = Gauge('db_pool', '連線池狀態 (大小、等待次數與時間)', ('pool', 'stat'), collect_fn=_collect_pool_stats)
+
+def _reset_pool_after_fork():
+    # gunicorn 在 fork worker 後，子程序的鎖與連線都要重建
+    global _pool_lock
+    _pool_lock = threading.Lock()
+    for pool in _pools.values():
+        pool._reset()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+def _request_scope_active():
+    """目前是否在已啟用 unit of work 的 HTTP request 中"""
+    return has_request_context() and current_app.extensions.get('db_request_scope', False)
+
+# 目前呼叫堆疊中唯讀方法容忍的延遲秒數 (None 表示不是唯讀)
+_read_only_staleness = ContextVar('read_only_staleness', default=None)
+
+def read_only(max_staleness=0):
+    """
+    裝飾器：宣告 Model 方法為唯讀，可容忍 max_staleness 秒內的舊資料
+    啟用讀寫分離時改走讀取端點；同一個 request 已經用過主要連線 (可能寫入過) 時，仍走主要資料庫
+
+    使用方式：
+    @staticmethod
+    @read_only(max_staleness=60)
+    def get_monthly_trend(): ...
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            token = _read_only_staleness.set(max_staleness)
+            try:
+                return f(*args, **kwargs)
+            finally:
+                _read_only_staleness.reset(token)
+        return decorated
+    return decorator
+
+def _read_routing_staleness():
+    """若這次查詢應走讀取端點，回傳容忍秒數；否則回傳 None"""
+    staleness = _read_only_staleness.get()
+    if staleness is None or DB_READ_MODE == 'primary':
+        return None
+    # read-after-write：同一 request 已使用主要連線，就繼續用它，才看得到自己剛寫的資料
+    if _request_scope_active() and g.get('_db_conn') is not None:
+        return None
+    return staleness
+
 def get_db_connection():
-    """取得資料庫連線的 context manager"""
+    """
+    取得資料庫連線的 context manager
+    - 在 HTTP request 中：整個 request 共用同一條連線與交易，request 結束時統一 commit/rollback
+    - 其他情況 (腳本、背景執行緒)：從連線池借出，區塊結束即 commit 並歸還
+    - 在 @read_only 方法內且啟用讀寫分離：改用讀取端點的連線
+    """
+    staleness = _read_routing_staleness()
+    if staleness is not None:
+        return _read_connection(staleness)
+    if _request_scope_active():
+        return _request_connection()
+    return _pooled_connection()
+
+@contextmanager
+def _pooled_connection():
+    """從連線池借出連線，結束後 commit 並歸還"""
+    pool = get_pool()
     connection = None
+    broken = False
     try:
-        connection = pymysql.connect(**DB_CONFIG)
+        connection = pool.acquire()
         yield connection
         connection.commit()
     except Exception as e:
         if connection:
-            connection.rollback()
+            try:
+                connection.rollback()
+            except Exception:
+                broken = True  # rollback 失敗代表連線已壞，不放回池中
         print(f"資料庫錯誤: {str(e)}")
         raise e
     finally:
         if connection:
-            connection.close()
+            pool.release(connection, discard=broken)
+
+@contextmanager
+def _request_connection():
+    """request 範圍的連線：第一次使用時才借出，之後的 Model 呼叫都共用"""
+    connection = g.get('_db_conn')
+    if connection is None:
+        connection = get_pool().acquire()
+        g._db_conn = connection
+    try:
+        yield connection
+    except Exception as e:
+        # 只要有任何一段資料庫操作失敗，整個 request 的交易就回滾
+        g._db_failed = True
+        print(f"資料庫錯誤: {str(e)}")
+        raise e
+
+def _apply_staleness(connection, max_staleness):
+    """stale 模式：依方法容忍的延遲設定 tidb_read_staleness (值沒變就不重送)"""
+    if DB_READ_MODE != 'stale':
+        return
+    value = f"-{int(max_staleness)}" if max_staleness else ''
+    if getattr(connection, '_read_staleness', None) == value:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SET @@tidb_read_staleness = %s", (value,))
+    connection._read_staleness = value
+
+@contextmanager
+def _read_connection(max_staleness):
+    """讀取端點的連線 (autocommit)；在 request 中共用一條，讀取端點連不上時退回主要資料庫"""
+    in_request = _request_scope_active()
+    pool = get_pool('read')
+    connection = g.get('_db_read_conn') if in_request else None
+    owned = False
+
+    if connection is None:
+        try:
+            connection = pool.acquire()
+        except Exception as e:
+            print(f"⚠️ 讀取端點無法連線，改用主要資料庫: {str(e)}")
+            connection = None
+        if connection is not None:
+            if in_request:
+                g._db_read_conn = connection
+            else:
+                owned = True
+
+    if connection is None:
+        with (_request_connection() if in_request else _pooled_connection()) as primary:
+            yield primary
+        return
+
+    try:
+        _apply_staleness(connection, max_staleness)
+        yield connection
+    except Exception as e:
+        print(f"資料庫錯誤 (讀取端點): {str(e)}")
+        raise e
+    finally:
+        if owned:
+            pool.release(connection)
+
+def stream_query(sql, params=None, batch_size=500):
+    """
+    以 unbuffered 的 SSDictCursor 逐批讀取大量資料 (generator，一次一列)
+    - 使用獨立的連線，不佔用 request 共用的交易 (unbuffered 結果讀完前連線不能做別的事)
+    - 在 @read_only 方法內呼叫時同樣走讀取端點
+    - 讀到一半被中斷 (例如前端斷線) 時直接關閉連線，不放回連線池
+    """
+    staleness = _read_routing_staleness()
+    pool_name = 'read' if staleness is not None else 'primary'
+    return _stream_rows(pool_name, staleness, sql, params, batch_size)
+
+def _stream_rows(pool_name, staleness, sql, params, batch_size):
+    pool = get_pool(pool_name)
+    connection = pool.acquire()
+    finished = False
+    try:
+        if staleness is not None:
+            _apply_staleness(connection, staleness)
+        with connection.cursor(InstrumentedSSDictCursor) as cursor:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        if not connection.get_autocommit():
+            connection.rollback()  # 結束唯讀交易
+        finished = True
+    except Exception as e:
+        print(f"資料庫錯誤 (串流查詢): {str(e)}")
+        raise e
+    finally:
+        pool.release(connection, discard=not finished)
+
+def after_commit(callback):
+    """
+    交易成功 commit 後才執行 callback (例如清除快取)
+    在 request 中會等到 request 的交易 commit；否則立即執行
+    """
+    if _request_scope_active():
+        g.setdefault('_db_after_commit', []).append(callback)
+    else:
+        callback()
+
+def _run_after_commit_callbacks():
+    for callback in g.pop('_db_after_commit', []):
+        try:
+            callback()
+        except Exception as e:
+            print(f"⚠️ commit 後續處理失敗: {str(e)}")
+
+def init_request_scope(app):
+    """
+    註冊 request 範圍的 unit of work
+    - after_request: 回應送出前 commit (失敗就回傳 500，避免前端以為成功)
+    - teardown_request: 未 commit 的交易 rollback，並把連線還給連線池
+    """
+    app.extensions['db_request_scope'] = True
+    app.after_request(_commit_request_connection)
+    app.teardown_request(_teardown_request_connection)
+
+def _commit_request_connection(response):
+    connection = g.get('_db_conn')
+    if connection is None or g.get('_db_failed'):
+        return response
+    if response.status_code >= 500:
+        # 伺服器錯誤的回應不保留寫到一半的資料
+        g._db_failed = True
+        return response
+    try:
+        connection.commit()
+        g._db_committed = True
+        _run_after_commit_callbacks()
+    except Exception as e:
+        g._db_failed = True
+        print(f"資料庫錯誤 (commit 失敗): {str(e)}")
+        response = current_app.response_class(
+            current_app.json.dumps({'error': '伺服器內部錯誤', 'status': 500}),
+            status=500,
+            mimetype='application/json'
+        )
+    return response
+
+def _teardown_request_connection(exc):
+    read_connection = g.pop('_db_read_conn', None)
+    if read_connection is not None:
+        get_pool('read').release(read_connection)
+
+    connection = g.pop('_db_conn', None)
+    if connection is None:
+        return
+    committed = g.pop('_db_committed', False)
+    g.pop('_db_failed', None)
+    broken = False
+    if not committed:
+        try:
+            connection.rollback()
+        except Exception:
+            broken = True
+    get_pool().release(connection, discard=broken)
 
 def init_db():
     """初始化資料庫連線測試"""
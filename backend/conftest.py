@@ -0,0 +1,154 @@
+"""
+pytest 共用 fixture
+
+query_budget：限制某個 API 最多只能執行幾次 SQL，避免 N+1 回歸
+    def test_designer_portfolio(client, fake_db, query_budget):
+        fake_db.respond('FROM portfolio', [{...}])
+        with query_budget(2):
+            client.get('/api/portfolio/designer/1')
+
+client：Flask 測試用 client，資料庫換成 fake_db (不需要真的資料庫)
+fake_db：記錄執行的 SQL，依 SQL 片段回傳預先設定的資料列；查詢仍經過 config.database 的計數與 N+1 偵測
+"""
+import os
+
+# 測試中不啟動背景彙總 (需要 import app 之前設定)
+os.environ.setdefault('SALES_ROLLUP_INTERVAL', '0')
+
+import pytest
+import config.database as database
+from utils.cache import MemoryBackend, set_backend
+from utils.query_debug import assert_max_queries
+
+# 手動執行的腳本 (需要真的資料庫)，不是測試
+collect_ignore = ['test_db.py']
+
+
+class FakeCursor:
+    """DictCursor 的替身：執行的 SQL 記到 FakeDB，結果依 FakeDB.respond 的規則回傳"""
+
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+        self.rowcount = 0
+        self.lastrowid = None
+
+    def execute(self, query, args=None):
+        self.db.queries.append((query, args))
+        self.rows = list(self.db.rows_for(query, args))
+        self.rowcount = len(self.rows) or 1
+        self.lastrowid = len(self.db.queries)
+        return len(self.rows)
+
+    def executemany(self, query, args):
+        for params in args:
+            self.execute(query, params)
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class InstrumentedFakeCursor(database._InstrumentedCursorMixin, FakeCursor):
+    """與正式的 InstrumentedDictCursor 相同，每次查詢都會經過 _record_query"""
+    pass
+
+
+class FakeConnection:
+    open = True
+
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self, cursor_class=None):
+        return InstrumentedFakeCursor(self.db)
+
+    def commit(self):
+        self.db.commits += 1
+
+    def rollback(self):
+        self.db.rollbacks += 1
+
+    def get_autocommit(self):
+        return False
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakePool:
+    def __init__(self, db):
+        self.db = db
+
+    def acquire(self):
+        return FakeConnection(self.db)
+
+    def release(self, conn, discard=False):
+        pass
+
+    def stats(self):
+        return {}
+
+
+class FakeDB:
+    """
+    respond(片段, rows)：SQL 含有該片段時回傳 rows (可為 callable(sql, args) -> rows)，先設定的規則優先
+    沒有符合的規則時回傳空結果
+    """
+
+    def __init__(self):
+        self.rules = []
+        self.queries = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def respond(self, fragment, rows):
+        self.rules.append((fragment, rows))
+
+    def rows_for(self, query, args):
+        for fragment, rows in self.rules:
+            if fragment in query:
+                return rows(query, args) if callable(rows) else [dict(row) for row in rows]
+        return []
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeDB()
+    pool = FakePool(db)
+    monkeypatch.setattr(database, 'get_pool', lambda name='primary': pool)
+    # 每個測試使用新的快取，避免前一個測試的結果讓查詢次數變少
+    set_backend(MemoryBackend())
+    return db
+
+
+@pytest.fixture
+def client(fake_db):
+    from app import app
+    app.config['TESTING'] = True
+    with app.test_client() as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def query_budget():
+    return assert_max_queries
@@ -0,0 +1,122 @@
+"""
+後端維運指令
+執行: python manage.py <指令>
+
+  migrate          套用尚未執行的資料庫遷移
+  migrate-status   列出遷移與套用狀態
+  explain          EXPLAIN 熱門查詢，確認有使用索引
+  rebuild-occupancy  依 reservation 表重建設計師佔用位元圖
+  rebuild-customer-stats  依 reservation 表重建顧客 RFM 統計
+  refresh-sales-rollups   重算待處理 (或指定區間) 的每日銷售彙總
+  rebuild-sales-rollups   依 reservation 表重建每日銷售彙總
+"""
+import argparse
+import sys
+
+
+def cmd_migrate(args):
+    import migrations
+    done = migrations.upgrade(target=args.target)
+    if not done:
+        print("ℹ️  資料庫已是最新版本")
+    return 0
+
+def cmd_migrate_status(args):
+    import migrations
+    for version, name, applied, description in migrations.status():
+        mark = '✅' if applied else '⏳'
+        print(f"{mark} {name}  {description}")
+    return 0
+
+def cmd_explain(args):
+    from migrations.explain import check_index_usage
+    failed = 0
+    for name, ok, scans in check_index_usage():
+        if ok:
+            print(f"✅ {name}")
+        else:
+            failed += 1
+            print(f"❌ {name}: 全表掃描 {', '.join(scans)}")
+    return 1 if failed else 0
+
+def cmd_rebuild_occupancy(args):
+    from datetime import date
+    from config.database import get_db_connection
+    from models.occupancy import Occupancy
+    start = None if args.all else (args.start or date.today().isoformat())
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            result = Occupancy.rebuild(cursor, start_date=start, end_date=args.end)
+    print(f"✅ 檢查 {result['checked']} 天，更新 {result['fixed']} 天，清除 {result['removed']} 天")
+    return 0
+
+def cmd_rebuild_customer_stats(args):
+    from config.database import get_db_connection
+    from models.customer_stats import CustomerStats
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            result = CustomerStats.rebuild(cursor)
+    print(f"✅ 更新 {result['customers']} 位顧客，清除 {result['removed']} 筆")
+    return 0
+
+def cmd_refresh_sales_rollups(args):
+    from config.database import get_db_connection
+    from models.sales_rollup import SalesRollup, rollup_refresher
+    if args.start:
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                result = SalesRollup.refresh_range(cursor, args.start, args.end or args.start)
+        print(f"✅ 重算 {result['days']} 天")
+    else:
+        days = rollup_refresher.run_once()
+        print(f"✅ 重算 {days} 天，水位 {SalesRollup.status()['watermark']}")
+    return 0
+
+def cmd_rebuild_sales_rollups(args):
+    from config.database import get_db_connection
+    from models.sales_rollup import SalesRollup
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            result = SalesRollup.rebuild(cursor)
+    print(f"✅ 寫入 {result['rows']} 筆彙總，水位 {result['watermark']}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='奧創髮藝管理系統 維運指令')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrate = subparsers.add_parser('migrate', help='套用資料庫遷移')
+    migrate.add_argument('--target', type=int, default=None, help='只套用到指定版本')
+    migrate.set_defaults(func=cmd_migrate)
+
+    subparsers.add_parser('migrate-status', help='列出遷移狀態').set_defaults(func=cmd_migrate_status)
+    subparsers.add_parser('explain', help='檢查熱門查詢的索引使用').set_defaults(func=cmd_explain)
+
+    rebuild = subparsers.add_parser('rebuild-occupancy', help='重建設計師佔用位元圖')
+    rebuild.add_argument('--start', default=None, help='起始日期 YYYY-MM-DD (預設今天)')
+    rebuild.add_argument('--end', default=None, help='結束日期 YYYY-MM-DD (含，預設不限)')
+    rebuild.add_argument('--all', action='store_true', help='重建所有日期')
+    rebuild.set_defaults(func=cmd_rebuild_occupancy)
+
+    subparsers.add_parser(
+        'rebuild-customer-stats', help='重建顧客 RFM 統計 (可每天排程執行以更新分群)'
+    ).set_defaults(func=cmd_rebuild_customer_stats)
+
+    refresh = subparsers.add_parser(
+        'refresh-sales-rollups', help='重算每日銷售彙總 (SALES_ROLLUP_INTERVAL=0 時以排程執行)'
+    )
+    refresh.add_argument('--start', default=None, help='重算指定區間的起始日期 YYYY-MM-DD (預設只處理待重算的日期)')
+    refresh.add_argument('--end', default=None, help='結束日期 YYYY-MM-DD (含，預設同 --start)')
+    refresh.set_defaults(func=cmd_refresh_sales_rollups)
+
+    subparsers.add_parser(
+        'rebuild-sales-rollups', help='重建每日銷售彙總'
+    ).set_defaults(func=cmd_rebuild_sales_rollups)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
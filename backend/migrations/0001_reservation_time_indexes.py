@@ -0,0 +1,10 @@
+from migrations import create_index
+
+DESCRIPTION = "reservation 時間區間查詢用的複合索引"
+
+
+def up(cursor):
+    # 設計師排程 / 衝突檢查: WHERE designer_id = ? AND reserved_time >= ? AND reserved_time < ?
+    create_index(cursor, 'reservation', 'idx_reservation_designer_time', ['designer_id', 'reserved_time', 'status'])
+    # 銷售報表: WHERE status = '已完成' AND reserved_time >= ? AND reserved_time < ?
+    create_index(cursor, 'reservation', 'idx_reservation_status_time', ['status', 'reserved_time'])
@@ -0,0 +1,17 @@
+DESCRIPTION = "設計師每日佔用位元圖 designer_occupancy (並依現有預約建立資料)"
+
+
+def up(cursor):
+    # 每位設計師每天一列，bits 為 288 格 x 5 分鐘的位元圖 (36 bytes)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS designer_occupancy (
+            designer_id INT NOT NULL,
+            occupancy_date DATE NOT NULL,
+            bits BINARY(36) NOT NULL,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (designer_id, occupancy_date)
+        )
+    """)
+    from models.occupancy import Occupancy
+    result = Occupancy.rebuild(cursor)
+    print(f"   已建立 {result['fixed']} 天的佔用資料")
@@ -0,0 +1,39 @@
+DESCRIPTION = "營業時間、特定日期調整、封鎖時段 (全店與個別設計師)"
+
+
+def up(cursor):
+    # 每週固定營業時間；同一天可以有多段 (例如午休前後)
+    # designer_id 為 NULL 表示全店；weekday 0 = 週一 ... 6 = 週日
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS business_hours (
+            hours_id INT AUTO_INCREMENT PRIMARY KEY,
+            designer_id INT NULL,
+            weekday TINYINT NOT NULL,
+            open_time TIME NOT NULL,
+            close_time TIME NOT NULL,
+            KEY idx_business_hours_scope (designer_id, weekday)
+        )
+    """)
+    # 特定日期的營業時間 (取代當天的每週設定)；open_time / close_time 為 NULL 表示整天休息
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS calendar_override (
+            override_id INT AUTO_INCREMENT PRIMARY KEY,
+            designer_id INT NULL,
+            override_date DATE NOT NULL,
+            open_time TIME NULL,
+            close_time TIME NULL,
+            note VARCHAR(255) NULL,
+            KEY idx_calendar_override_date (override_date, designer_id)
+        )
+    """)
+    # 封鎖時段 (教育訓練、請假半天...)，從工作時段中扣除
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS blocked_range (
+            block_id INT AUTO_INCREMENT PRIMARY KEY,
+            designer_id INT NULL,
+            start_at DATETIME NOT NULL,
+            end_at DATETIME NOT NULL,
+            reason VARCHAR(255) NULL,
+            KEY idx_blocked_range_end (end_at)
+        )
+    """)
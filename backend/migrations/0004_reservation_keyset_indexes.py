@@ -0,0 +1,15 @@
+from migrations import create_index, drop_index
+
+DESCRIPTION = "預約列表 keyset 分頁用的複合索引 (取代 0001 的設計師時間索引)"
+
+
+def up(cursor):
+    # 顧客預約紀錄: WHERE customer_id = ? [AND reserved_time 區間] ORDER BY reserved_time, reservation_id
+    create_index(cursor, 'reservation', 'idx_reservation_customer_keyset',
+                 ['customer_id', 'reserved_time', 'reservation_id'])
+    # 設計師後台列表: WHERE designer_id = ? [AND reserved_time 區間] ORDER BY reserved_time, reservation_id
+    # 排程 / 衝突檢查也用這個索引 (status 放最後，仍可在索引內過濾已取消)，
+    # 所以取代 0001 的 (designer_id, reserved_time, status)，reservation 每次寫入少維護一個索引
+    create_index(cursor, 'reservation', 'idx_reservation_designer_keyset',
+                 ['designer_id', 'reserved_time', 'reservation_id', 'status'])
+    drop_index(cursor, 'reservation', 'idx_reservation_designer_time')
@@ -0,0 +1,23 @@
+DESCRIPTION = "顧客 RFM 統計 customer_stats (並依現有已完成預約建立資料)"
+
+
+def up(cursor):
+    # 每位顧客一列：最近一次完成的時間、完成次數、累計消費，以及最近一次計算的 RFM 分數與分群
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS customer_stats (
+            customer_id INT NOT NULL PRIMARY KEY,
+            last_visit DATETIME NULL,
+            completed_count INT NOT NULL DEFAULT 0,
+            lifetime_spend DECIMAL(12, 2) NOT NULL DEFAULT 0,
+            r_score TINYINT NULL,
+            f_score TINYINT NULL,
+            m_score TINYINT NULL,
+            segment VARCHAR(20) NULL,
+            scored_at DATETIME NULL,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            KEY idx_customer_stats_spend (lifetime_spend)
+        )
+    """)
+    from models.customer_stats import CustomerStats
+    result = CustomerStats.rebuild(cursor)
+    print(f"   已建立 {result['customers']} 位顧客的統計資料")
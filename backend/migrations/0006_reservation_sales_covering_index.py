@@ -0,0 +1,12 @@
+from migrations import create_index, drop_index
+
+DESCRIPTION = "銷售儀表板用的覆蓋索引 (取代 0001 的狀態時間索引)"
+
+
+def up(cursor):
+    # SalesModel.DASHBOARD_SQL: WHERE status = '已完成' AND reserved_time < ?，只讀 customer_id / final_price
+    # 需要的欄位都在索引內，區間掃描不必回表
+    create_index(cursor, 'reservation', 'idx_reservation_sales_covering',
+                 ['status', 'reserved_time', 'customer_id', 'final_price'])
+    # 0001 的 (status, reserved_time) 是這個索引的前綴，原本的查詢都能改用它
+    drop_index(cursor, 'reservation', 'idx_reservation_status_time')
@@ -0,0 +1,44 @@
+DESCRIPTION = "每日銷售彙總 sales_daily、待重算日期佇列 (並依現有已完成預約建立資料)"
+
+
+def up(cursor):
+    # 每天 x 設計師 x 服務一列 (見 models/sales_rollup.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sales_daily (
+            sale_date DATE NOT NULL,
+            designer_id INT NOT NULL,
+            service_id INT NOT NULL,
+            revenue DECIMAL(12, 2) NOT NULL DEFAULT 0,
+            completed_orders INT NOT NULL DEFAULT 0,
+            customers INT NOT NULL DEFAULT 0,
+            new_customers INT NOT NULL DEFAULT 0,
+            repeat_orders INT NOT NULL DEFAULT 0,
+            gap_days BIGINT NOT NULL DEFAULT 0,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (sale_date, designer_id, service_id)
+        )
+    """)
+    # 預約進出「已完成」時標記的日期，由背景工作重算後刪除
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sales_dirty_day (
+            sale_date DATE NOT NULL PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 1,
+            marked_at DATETIME(6) NOT NULL
+        )
+    """)
+    # 水位：此時間以前的異動都已反映在 sales_daily；run_id 每次寫入遞增
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sales_rollup_state (
+            name VARCHAR(32) NOT NULL PRIMARY KEY,
+            watermark DATETIME(6) NULL,
+            refreshed_at DATETIME NULL,
+            run_id BIGINT NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        INSERT INTO sales_rollup_state (name) VALUES ('sales_daily')
+        ON DUPLICATE KEY UPDATE name = name
+    """)
+    from models.sales_rollup import SalesRollup
+    result = SalesRollup.rebuild(cursor)
+    print(f"   已建立 {result['rows']} 筆每日銷售彙總")
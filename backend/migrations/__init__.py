@@ -0,0 +1,100 @@
+"""
+版本化的資料庫 schema / 索引遷移
+
+每個遷移是 migrations/ 底下的 NNNN_說明.py，需定義：
+- DESCRIPTION: 說明
+- up(cursor): 套用變更 (DDL 請盡量寫成可重複執行，例如 CREATE TABLE IF NOT EXISTS)
+  索引請用 create_index / drop_index：MySQL 8 不支援 CREATE INDEX IF NOT EXISTS，
+  改為先查 information_schema.statistics，TiDB 與 MySQL 都能執行
+
+已套用的版本記錄在 schema_migrations 資料表。
+執行: python manage.py migrate
+"""
+import importlib
+import os
+import re
+from config.database import get_db_connection
+
+MIGRATION_TABLE = 'schema_migrations'
+_FILENAME_PATTERN = re.compile(r'^(\d{4})_\w+\.py$')
+
+
+def discover():
+    """依版本號排序回傳 [(version, module_name, module), ...]"""
+    directory = os.path.dirname(__file__)
+    found = []
+    for filename in sorted(os.listdir(directory)):
+        match = _FILENAME_PATTERN.match(filename)
+        if not match:
+            continue
+        module_name = filename[:-3]
+        module = importlib.import_module(f'{__name__}.{module_name}')
+        found.append((int(match.group(1)), module_name, module))
+    return found
+
+def _ensure_table(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MIGRATION_TABLE} (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def index_exists(cursor, table, name):
+    """目前資料庫的 table 是否已有名為 name 的索引"""
+    cursor.execute("""
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        LIMIT 1
+    """, (table, name))
+    return cursor.fetchone() is not None
+
+def create_index(cursor, table, name, columns):
+    """索引不存在時建立，columns 為欄位名稱列表"""
+    if index_exists(cursor, table, name):
+        return False
+    cursor.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+    return True
+
+def drop_index(cursor, table, name):
+    """索引存在時刪除"""
+    if not index_exists(cursor, table, name):
+        return False
+    cursor.execute(f"DROP INDEX {name} ON {table}")
+    return True
+
+def applied_versions():
+    """已套用的版本號集合"""
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            _ensure_table(cursor)
+            cursor.execute(f"SELECT version FROM {MIGRATION_TABLE}")
+            return {row['version'] for row in cursor.fetchall()}
+
+def status():
+    """回傳 [(version, name, 是否已套用, 說明), ...]"""
+    applied = applied_versions()
+    return [
+        (version, name, version in applied, getattr(module, 'DESCRIPTION', ''))
+        for version, name, module in discover()
+    ]
+
+def upgrade(target=None):
+    """依序套用尚未執行的遷移，回傳本次套用的名稱列表"""
+    applied = applied_versions()
+    done = []
+    for version, name, module in discover():
+        if version in applied or (target is not None and version > target):
+            continue
+        print(f"⏳ 套用遷移 {name}: {getattr(module, 'DESCRIPTION', '')}")
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                module.up(cursor)
+                cursor.execute(
+                    f"INSERT INTO {MIGRATION_TABLE} (version, name) VALUES (%s, %s)",
+                    (version, name)
+                )
+        print(f"✅ {name} 完成")
+        done.append(name)
+    return done
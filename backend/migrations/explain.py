@@ -0,0 +1,104 @@
+"""
+對熱門查詢執行 EXPLAIN，確認 reservation 的時間區間查詢有用到索引
+執行: python manage.py explain
+"""
+from datetime import datetime
+from config.database import get_db_connection
+from models.reservation import Reservation
+from models.sales import SalesModel
+from utils.time_range import day_range, month_range
+
+# 只檢查這些資料表是否被全表掃描 (含 SQL 中的別名)
+WATCHED_TABLES = ('reservation', 'r')
+
+
+def hot_queries():
+    """回傳 [(名稱, SQL, 參數), ...]，參數只要是合理的範例值即可"""
+    today = datetime.now()
+    day_start, day_end = day_range(today)
+    dashboard_window = SalesModel._dashboard_window(today)
+    month_start, month_end = month_range(today)
+    return [
+        (
+            'Reservation.get_designer_daily_schedule',
+            Reservation.DAILY_SCHEDULE_SQL,
+            (1, day_start, day_end),
+        ),
+        (
+            'Reservation.get_for_designer_management (date)',
+            """
+                SELECT r.reservation_id FROM reservation r
+                WHERE r.designer_id = %s AND r.reserved_time >= %s AND r.reserved_time < %s
+                ORDER BY r.reserved_time ASC
+            """,
+            (1, day_start, day_end),
+        ),
+        (
+            'Reservation.page_by_customer (keyset)',
+            """
+                SELECT reservation_id FROM reservation
+                WHERE customer_id = %s
+                AND (reserved_time < %s OR (reserved_time = %s AND reservation_id < %s))
+                ORDER BY reserved_time DESC, reservation_id DESC
+                LIMIT %s
+            """,
+            (1, day_end, day_end, 0, 21),
+        ),
+        (
+            'Reservation.page_for_designer (keyset)',
+            """
+                SELECT reservation_id FROM reservation
+                WHERE designer_id = %s AND reserved_time >= %s
+                AND (reserved_time > %s OR (reserved_time = %s AND reservation_id > %s))
+                ORDER BY reserved_time ASC, reservation_id ASC
+                LIMIT %s
+            """,
+            (1, day_start, day_start, day_start, 0, 21),
+        ),
+        (
+            'SalesModel 本月已完成訂單',
+            """
+                SELECT COUNT(DISTINCT customer_id) as total
+                FROM reservation
+                WHERE status='已完成' AND reserved_time >= %s AND reserved_time < %s
+            """,
+            (month_start, month_end),
+        ),
+        (
+            'SalesModel.get_dashboard_live',
+            SalesModel.DASHBOARD_SQL,
+            dashboard_window,
+        ),
+        (
+            'SalesModel.get_dashboard 本月與上月顧客',
+            SalesModel.ACTIVE_CUSTOMERS_SQL,
+            dashboard_window,
+        ),
+    ]
+
+def _full_scans(plan_rows):
+    """從 EXPLAIN 結果找出被全表掃描的資料表 (同時支援 TiDB 與 MySQL 格式)"""
+    scans = []
+    for row in plan_rows:
+        # TiDB: id = 'TableFullScan_5', access object = 'table:reservation'
+        operator = str(row.get('id', ''))
+        access = str(row.get('access object', ''))
+        if operator.startswith('TableFullScan'):
+            table = access.split(',')[0].replace('table:', '').strip()
+            if table in WATCHED_TABLES:
+                scans.append(table)
+        # MySQL: type = 'ALL'
+        if row.get('type') == 'ALL' and row.get('table') in WATCHED_TABLES:
+            scans.append(row['table'])
+    return scans
+
+def check_index_usage():
+    """回傳 [(名稱, 是否通過, 全表掃描的資料表), ...]"""
+    results = []
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            for name, sql, params in hot_queries():
+                cursor.execute("EXPLAIN " + sql, params)
+                scans = _full_scans(cursor.fetchall())
+                results.append((name, not scans, scans))
+    return results
@@ -1,40 +1,160 @@
-from config.database import get_db_connection
+from config.database import get_db_connection, read_only, stream_query
+from utils.cache import cached
+from utils.pagination import encode_sort_cursor
+from utils.rfm import SEGMENTS, page_after, score_batch, select, thresholds_for
 
 class AnalysisService:
+    # 讀取預先計算的 customer_stats (見 models/customer_stats.py)，不再每次彙總全部預約
+    # recency 依 last_visit 即時計算，分群也在讀取時重算，不會因為時間經過而過期
+    RFM_SQL = """
+        SELECT 
+            c.customer_id,
+            c.name,
+            c.phone,
+            c.email,
+            s.last_visit as last_purchase_date,
+            DATEDIFF(NOW(), s.last_visit) as recency_days,
+            s.completed_count as frequency,
+            s.lifetime_spend as monetary
+        FROM customer_stats s
+        JOIN customer c ON c.customer_id = s.customer_id
+        WHERE s.completed_count > 0  -- 只計算有已完成交易的顧客
+        ORDER BY s.lifetime_spend DESC
+    """
+
     @staticmethod
+    @read_only(max_staleness=60)
     def get_rfm_data():
         """
-        計算所有顧客的 RFM 原始數據
+        取得所有顧客的 RFM 原始數據 (來自 customer_stats)
         R (Recency): 距離上次消費天數
         F (Frequency): 總消費次數 (只算已完成)
         M (Monetary): 總消費金額 (只算已完成)
         """
         with get_db_connection() as conn:
             with conn.cursor() as cursor:
-                sql = """
-                    SELECT 
-                        c.customer_id,
-                        c.name,
-                        c.phone,
-                        c.email,
-                        MAX(r.reserved_time) as last_purchase_date,
-                        DATEDIFF(NOW(), MAX(r.reserved_time)) as recency_days,
-                        COUNT(r.reservation_id) as frequency,
-                        SUM(r.final_price) as monetary
-                    FROM customer c
-                    JOIN reservation r ON c.customer_id = r.customer_id
-                    WHERE r.status = '已完成'  -- 只計算已完成的交易
-                    GROUP BY c.customer_id
-                    ORDER BY monetary DESC
-                """
-                cursor.execute(sql)
+                cursor.execute(AnalysisService.RFM_SQL)
                 return cursor.fetchall()
 
+    @staticmethod
+    @read_only(max_staleness=60)
+    def iter_rfm_data():
+        """串流讀取 RFM 原始數據 (逐筆產生，不一次載入全部)"""
+        return stream_query(AnalysisService.RFM_SQL)
+
+    # 篩選、排序、統計摘要只需要這幾欄，不 JOIN customer、不帶聯絡資料
+    RFM_METRICS_SQL = """
+        SELECT customer_id,
+               DATEDIFF(NOW(), last_visit) as recency_days,
+               completed_count as frequency,
+               lifetime_spend as monetary
+        FROM customer_stats
+        WHERE completed_count > 0
+    """
+
+    @staticmethod
+    @cached(ttl=60, tags=('customer_stats',))
+    def get_rfm_metrics():
+        """
+        所有顧客的 R / F / M，以欄位格式回傳 (體積小，可快取，翻頁時不重查)
+        從主要資料庫讀 (不加 @read_only)：讀取端點的舊資料存進快取後會維持整個 TTL
+        {'customer_id': [...], 'recency_days': [...], 'frequency': [...], 'monetary': [...]}
+        """
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(AnalysisService.RFM_METRICS_SQL)
+                rows = cursor.fetchall()
+        return {
+            name: [row[name] for row in rows]
+            for name in ('customer_id', 'recency_days', 'frequency', 'monetary')
+        }
+
+    @staticmethod
+    @read_only(max_staleness=60)
+    def get_rfm_customers(customer_ids):
+        """一頁顧客的聯絡資料，回傳 {customer_id: row}"""
+        if not customer_ids:
+            return {}
+        placeholders = ', '.join(['%s'] * len(customer_ids))
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT c.customer_id, c.name, c.phone, c.email, s.last_visit as last_purchase_date
+                    FROM customer_stats s
+                    JOIN customer c ON c.customer_id = s.customer_id
+                    WHERE s.customer_id IN ({placeholders})
+                """, tuple(customer_ids))
+                return {row['customer_id']: row for row in cursor.fetchall()}
+
+    @staticmethod
+    def get_rfm_summary(mode='legacy'):
+        """
+        儀表板摘要：總營收、顧客數、活躍 / 流失風險人數、各分群人數與使用的門檻
+        只用 get_rfm_metrics 的欄位計算，不回傳顧客列表
+        """
+        metrics = AnalysisService.get_rfm_metrics()
+        recency, frequency, monetary = metrics['recency_days'], metrics['frequency'], metrics['monetary']
+        thresholds = thresholds_for(mode, recency, frequency, monetary)
+        segments = dict.fromkeys(SEGMENTS, 0)
+        for segment in score_batch(recency, frequency, monetary, thresholds)['segment']:
+            segments[segment] += 1
+        return {
+            'summary': {
+                'total_revenue': sum(monetary),
+                'total_customers': len(recency),
+                'active_customers': sum(1 for r in recency if r <= 90),  # R <= 90
+                'churn_risk': sum(1 for r, f in zip(recency, frequency) if r > 180 and f >= 3),  # R > 180 & F >= 3
+            },
+            'segments': segments,
+            'thresholds': thresholds,
+        }
+
+    @staticmethod
+    def page_rfm(limit, cursor=None, segments=(), score_ranges=None, sort='monetary', descending=True,
+                 mode='legacy'):
+        """
+        篩選、排序後的 RFM 顧客列表 (keyset 分頁)
+        評分與篩選在快取的 R / F / M 欄位上做，只有這一頁的顧客才查聯絡資料
+        回傳 {'items': [...], 'next_cursor': ..., 'has_more': bool, 'thresholds': ...}
+        第一頁 (沒有 cursor) 另外附上 summary: {'total': 符合的人數, 'by_segment': {分群: 人數}}
+        """
+        metrics = AnalysisService.get_rfm_metrics()
+        thresholds = thresholds_for(mode, metrics['recency_days'], metrics['frequency'], metrics['monetary'])
+        scores = score_batch(metrics['recency_days'], metrics['frequency'], metrics['monetary'], thresholds)
+        ordered = select(metrics, scores, segments, score_ranges, sort)
+        page, has_more = page_after(ordered, cursor, limit, descending)
+
+        details = AnalysisService.get_rfm_customers([customer_id for _, customer_id, _ in page])
+        items = []
+        for _, customer_id, index in page:
+            if customer_id not in details:
+                continue  # 快取之後顧客被刪除
+            items.append({
+                **details[customer_id],
+                'recency_days': metrics['recency_days'][index],
+                'frequency': metrics['frequency'][index],
+                'monetary': metrics['monetary'][index],
+                **{name: scores[name][index] for name in ('r_score', 'f_score', 'm_score', 'segment', 'color')},
+            })
+
+        result = {'items': items, 'has_more': has_more, 'next_cursor': None, 'thresholds': thresholds}
+        if has_more:
+            value, customer_id, _ = page[-1]
+            result['next_cursor'] = encode_sort_cursor(value, customer_id)
+        if cursor is None:
+            by_segment = {}
+            for _, _, index in ordered:
+                segment = scores['segment'][index]
+                by_segment[segment] = by_segment.get(segment, 0) + 1
+            result['summary'] = {'total': len(ordered), 'by_segment': by_segment}
+        return result
+
     @staticmethod
     def segment_customer(r, f, m):
         """
         [商業邏輯] RFM 分群規則
         這裡採用簡化的評分機制
+        整批評分請用 utils/rfm.py (固定門檻時結果與這裡相同)
         """
         # 給分 (1-5分)
         # Recency (越小越好)
@@ -0,0 +1,245 @@
+from config.database import get_db_connection
+from datetime import datetime, timedelta
+from utils.cache import cached, invalidate
+from utils.scheduling import (
+    default_windows, format_minutes, intersect_windows, minutes_of_day, parse_minutes, subtract_windows
+)
+from utils.time_range import to_date
+
+
+def _time_minutes(value):
+    """TIME 欄位 (PyMySQL 回傳 timedelta) -> 當天第幾分鐘"""
+    if isinstance(value, timedelta):
+        return int(value.total_seconds() // 60)
+    return parse_minutes(str(value)[:5])
+
+def _scope(designer_id):
+    """designer_id 統一成 int，None 表示全店"""
+    return None if designer_id in (None, '') else int(designer_id)
+
+
+class Calendar:
+    """
+    營業時間設定 (business_hours / calendar_override / blocked_range) 與每日工作時段
+    工作時段 = 全店時段 ∩ 設計師時段 - 封鎖時段
+    - 特定日期設定優先於每週設定
+    - 全店沒有任何每週設定時使用預設營業時間 (utils/scheduling.py)
+    - 設計師沒有任何每週設定時跟隨全店；有設定但當天沒有時段表示休假
+    """
+
+    @staticmethod
+    @cached(ttl=300, tags=('calendar',))
+    def get_compiled():
+        """
+        把所有設定整理成查詢用的索引 (整份快取，修改設定時失效)，只載入昨天以後的特定日期與封鎖時段
+        {
+            'weekly': {(designer_id, weekday): [(開始, 結束), ...]},   designer_id 為 None 表示全店
+            'weekly_scopes': {有每週設定的 designer_id, ...},
+            'overrides': {(designer_id, 'YYYY-MM-DD'): [(開始, 結束), ...]},   空列表表示休息
+            'blocks': {designer_id: [(開始, 結束), ...]},   datetime
+        }
+        """
+        since = datetime.now().date() - timedelta(days=1)
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT designer_id, weekday, open_time, close_time FROM business_hours")
+                hours = cursor.fetchall()
+                cursor.execute("""
+                    SELECT designer_id, override_date, open_time, close_time
+                    FROM calendar_override WHERE override_date >= %s
+                """, (since,))
+                overrides = cursor.fetchall()
+                cursor.execute("""
+                    SELECT designer_id, start_at, end_at
+                    FROM blocked_range WHERE end_at >= %s
+                """, (since,))
+                blocks = cursor.fetchall()
+
+        compiled = {'weekly': {}, 'weekly_scopes': set(), 'overrides': {}, 'blocks': {}}
+        for row in hours:
+            compiled['weekly_scopes'].add(row['designer_id'])
+            compiled['weekly'].setdefault((row['designer_id'], row['weekday']), []).append(
+                (_time_minutes(row['open_time']), _time_minutes(row['close_time']))
+            )
+        for row in overrides:
+            windows = compiled['overrides'].setdefault((row['designer_id'], row['override_date'].isoformat()), [])
+            if row['open_time'] is not None and row['close_time'] is not None:
+                windows.append((_time_minutes(row['open_time']), _time_minutes(row['close_time'])))
+        for row in blocks:
+            compiled['blocks'].setdefault(row['designer_id'], []).append((row['start_at'], row['end_at']))
+        for windows in list(compiled['weekly'].values()) + list(compiled['overrides'].values()):
+            windows.sort()
+        return compiled
+
+    @staticmethod
+    def _scope_windows(compiled, scope, day):
+        """單一層級 (全店或設計師) 當天的時段，沒有任何設定回傳 None"""
+        override = compiled['overrides'].get((scope, day.isoformat()))
+        if override is not None:
+            return override
+        if scope in compiled['weekly_scopes']:
+            return compiled['weekly'].get((scope, day.weekday()), [])
+        return None
+
+    @staticmethod
+    def resolve(compiled, designer_id, day):
+        """由編譯好的設定計算設計師當天的工作時段 [(開始, 結束), ...] (分鐘數)"""
+        scope = _scope(designer_id)
+        windows = Calendar._scope_windows(compiled, None, day)
+        if windows is None:
+            windows = default_windows()
+        designer_windows = Calendar._scope_windows(compiled, scope, day)
+        if designer_windows is not None:
+            windows = intersect_windows(windows, designer_windows)
+
+        blocked = []
+        for start_at, end_at in compiled['blocks'].get(None, []) + compiled['blocks'].get(scope, []):
+            start, end = minutes_of_day(start_at, day), minutes_of_day(end_at, day)
+            if end > 0 and start < 24 * 60:
+                blocked.append((start, end))
+        return subtract_windows(windows, blocked)
+
+    @staticmethod
+    def get_working_windows(designer_id, day):
+        """設計師某一天的工作時段"""
+        return Calendar.resolve(Calendar.get_compiled(), designer_id, to_date(day))
+
+    @staticmethod
+    def get_working_windows_for(designer_ids, start_date, end_date):
+        """多位設計師、多天的工作時段，回傳 {(designer_id, date): [(開始, 結束), ...]}"""
+        compiled = Calendar.get_compiled()
+        start_date, end_date = to_date(start_date), to_date(end_date)
+        result = {}
+        day = start_date
+        while day <= end_date:
+            for designer_id in designer_ids:
+                result[(designer_id, day)] = Calendar.resolve(compiled, designer_id, day)
+            day += timedelta(days=1)
+        return result
+
+    @staticmethod
+    def fits(designer_id, start_time, duration_min):
+        """start_time 開始、持續 duration_min 是否完全落在設計師的工作時段內"""
+        day = start_time.date()
+        start = minutes_of_day(start_time, day)
+        return any(
+            open_time <= start and start + duration_min <= close_time
+            for open_time, close_time in Calendar.get_working_windows(designer_id, day)
+        )
+
+    # --- 管理 ---
+
+    @staticmethod
+    def get_settings():
+        """管理頁面用：每週設定、今天以後的特定日期與封鎖時段"""
+        today = datetime.now().date()
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT hours_id, designer_id, weekday, open_time, close_time
+                    FROM business_hours ORDER BY designer_id, weekday, open_time
+                """)
+                hours = cursor.fetchall()
+                cursor.execute("""
+                    SELECT override_id, designer_id, override_date, open_time, close_time, note
+                    FROM calendar_override WHERE override_date >= %s
+                    ORDER BY override_date, designer_id, open_time
+                """, (today,))
+                overrides = cursor.fetchall()
+                cursor.execute("""
+                    SELECT block_id, designer_id, start_at, end_at, reason
+                    FROM blocked_range WHERE end_at >= %s
+                    ORDER BY start_at
+                """, (today,))
+                blocks = cursor.fetchall()
+
+        for row in hours + overrides:
+            for field in ('open_time', 'close_time'):
+                if row[field] is not None:
+                    row[field] = format_minutes(_time_minutes(row[field]))
+        for row in overrides:
+            row['override_date'] = row['override_date'].isoformat()
+        for row in blocks:
+            row['start_at'] = row['start_at'].strftime('%Y-%m-%d %H:%M')
+            row['end_at'] = row['end_at'].strftime('%Y-%m-%d %H:%M')
+        return {'hours': hours, 'overrides': overrides, 'blocks': blocks}
+
+    @staticmethod
+    def set_weekly_hours(designer_id, weekday, windows):
+        """
+        設定每週某一天的營業時間 (取代原本的設定)
+        windows = [('11:00', '14:00'), ('15:00', '19:00')]；空列表表示當天休息
+        """
+        scope = _scope(designer_id)
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "DELETE FROM business_hours WHERE designer_id <=> %s AND weekday = %s",
+                    (scope, weekday)
+                )
+                if windows:
+                    cursor.executemany("""
+                        INSERT INTO business_hours (designer_id, weekday, open_time, close_time)
+                        VALUES (%s, %s, %s, %s)
+                    """, [(scope, weekday, open_time, close_time) for open_time, close_time in windows])
+                invalidate('calendar')
+                return True
+
+    @staticmethod
+    def clear_weekly_hours(designer_id):
+        """刪除所有每週設定 (設計師改回跟隨全店，全店改回預設營業時間)"""
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM business_hours WHERE designer_id <=> %s", (_scope(designer_id),))
+                invalidate('calendar')
+                return cursor.rowcount
+
+    @staticmethod
+    def set_override(designer_id, date_str, windows, note=None):
+        """設定特定日期的營業時間 (取代原本的設定)；windows 為空列表表示整天休息"""
+        scope = _scope(designer_id)
+        day = to_date(date_str)
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "DELETE FROM calendar_override WHERE designer_id <=> %s AND override_date = %s",
+                    (scope, day)
+                )
+                rows = [(scope, day, open_time, close_time, note) for open_time, close_time in windows]
+                cursor.executemany("""
+                    INSERT INTO calendar_override (designer_id, override_date, open_time, close_time, note)
+                    VALUES (%s, %s, %s, %s, %s)
+                """, rows or [(scope, day, None, None, note)])
+                invalidate('calendar')
+                return True
+
+    @staticmethod
+    def delete_override(designer_id, date_str):
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "DELETE FROM calendar_override WHERE designer_id <=> %s AND override_date = %s",
+                    (_scope(designer_id), to_date(date_str))
+                )
+                invalidate('calendar')
+                return cursor.rowcount > 0
+
+    @staticmethod
+    def add_block(designer_id, start_at, end_at, reason=None):
+        """新增封鎖時段，回傳 block_id"""
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO blocked_range (designer_id, start_at, end_at, reason)
+                    VALUES (%s, %s, %s, %s)
+                """, (_scope(designer_id), start_at, end_at, reason))
+                invalidate('calendar')
+                return cursor.lastrowid
+
+    @staticmethod
+    def delete_block(block_id):
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM blocked_range WHERE block_id = %s", (block_id,))
+                invalidate('calendar')
+                return cursor.rowcount > 0
@@ -0,0 +1,123 @@
+from datetime import datetime
+from models.analysis import AnalysisService
+from utils.cache import invalidate
+
+
+class CustomerStats:
+    """
+    顧客 RFM 統計 (customer_stats)
+    由 Reservation 的狀態變更維護 (進出「已完成」時重算該顧客)，RFM 報表只讀這張表
+    寫入方法都接收呼叫端的 cursor，與預約異動在同一個交易內
+    r_score / segment 會隨時間變舊 (recency 每天增加)，報表讀取時依 last_visit 重新計算，
+    表中的分數是 scored_at 當下的結果，可用 rebuild 定期更新
+    """
+
+    UPSERT_SQL = """
+        INSERT INTO customer_stats
+        (customer_id, last_visit, completed_count, lifetime_spend, r_score, f_score, m_score, segment, scored_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            last_visit = VALUES(last_visit),
+            completed_count = VALUES(completed_count),
+            lifetime_spend = VALUES(lifetime_spend),
+            r_score = VALUES(r_score),
+            f_score = VALUES(f_score),
+            m_score = VALUES(m_score),
+            segment = VALUES(segment),
+            scored_at = VALUES(scored_at)
+    """
+
+    # 全量重建時每批寫入的筆數
+    REBUILD_BATCH_SIZE = 1000
+
+    @staticmethod
+    def _row(customer_id, last_visit, completed_count, lifetime_spend, now):
+        """統計值 -> UPSERT_SQL 的參數 (含 RFM 分數)"""
+        recency_days = (now.date() - last_visit.date()).days
+        scores = AnalysisService.segment_customer(recency_days, completed_count, lifetime_spend)
+        return (
+            customer_id, last_visit, completed_count, lifetime_spend,
+            scores['r_score'], scores['f_score'], scores['m_score'], scores['segment'], now
+        )
+
+    @staticmethod
+    def lock(cursor, customer_ids):
+        """
+        鎖定顧客的統計列 (不存在時先建立空的列)，同一位顧客的狀態變更依序處理
+        依 customer_id 順序上鎖避免 deadlock；需在鎖定預約列之前呼叫
+        """
+        customer_ids = sorted(set(customer_ids))
+        if not customer_ids:
+            return
+        cursor.executemany("""
+            INSERT INTO customer_stats (customer_id) VALUES (%s)
+            ON DUPLICATE KEY UPDATE customer_id = customer_id
+        """, [(customer_id,) for customer_id in customer_ids])
+        placeholders = ', '.join(['%s'] * len(customer_ids))
+        cursor.execute(f"""
+            SELECT customer_id FROM customer_stats
+            WHERE customer_id IN ({placeholders})
+            ORDER BY customer_id
+            FOR UPDATE
+        """, tuple(customer_ids))
+        cursor.fetchall()
+
+    @staticmethod
+    def refresh(cursor, customer_ids):
+        """
+        依 reservation 表重算這些顧客的統計 (需先 lock)
+        只讀這幾位顧客已完成的預約 (customer_id 索引)，與歷史總量無關
+        使用 FOR UPDATE 讀取最新已 commit 的資料，不受交易快照影響
+        回傳 {'customers': 有統計的顧客數, 'removed': 刪除統計列的顧客數}
+        """
+        customer_ids = sorted(set(customer_ids))
+        if not customer_ids:
+            return {'customers': 0, 'removed': 0}
+        placeholders = ', '.join(['%s'] * len(customer_ids))
+        cursor.execute(f"""
+            SELECT customer_id, reserved_time, final_price FROM reservation
+            WHERE customer_id IN ({placeholders}) AND status = '已完成'
+            FOR UPDATE
+        """, tuple(customer_ids))
+        totals = {}
+        for row in cursor.fetchall():
+            last_visit, count, spend = totals.get(row['customer_id'], (row['reserved_time'], 0, 0))
+            totals[row['customer_id']] = (
+                max(last_visit, row['reserved_time']), count + 1, spend + (row['final_price'] or 0)
+            )
+
+        now = datetime.now()
+        if totals:
+            cursor.executemany(CustomerStats.UPSERT_SQL, [
+                CustomerStats._row(customer_id, *values, now) for customer_id, values in totals.items()
+            ])
+        # 已經沒有完成的預約 (例如誤按完成後改回)：刪除統計列
+        removed = [customer_id for customer_id in customer_ids if customer_id not in totals]
+        if removed:
+            placeholders = ', '.join(['%s'] * len(removed))
+            cursor.execute(f"DELETE FROM customer_stats WHERE customer_id IN ({placeholders})", tuple(removed))
+        invalidate('customer_stats')
+        return {'customers': len(totals), 'removed': len(removed)}
+
+    @staticmethod
+    def rebuild(cursor):
+        """
+        從 reservation 表全量重建 (初次建立、修正不一致、定期更新 RFM 分數)
+        與狀態變更相同：每批顧客先 lock 再 refresh，依 customer_id 順序處理，
+        執行期間同時發生的狀態變更會等待或在之後重算，不會被舊的結果蓋掉
+        回傳 {'customers': 有統計的顧客數, 'removed': 刪除的列數}
+        """
+        cursor.execute("""
+            SELECT customer_id FROM reservation WHERE status = '已完成'
+            UNION
+            SELECT customer_id FROM customer_stats
+        """)
+        customer_ids = sorted(row['customer_id'] for row in cursor.fetchall())
+        result = {'customers': 0, 'removed': 0}
+        for index in range(0, len(customer_ids), CustomerStats.REBUILD_BATCH_SIZE):
+            batch = customer_ids[index:index + CustomerStats.REBUILD_BATCH_SIZE]
+            CustomerStats.lock(cursor, batch)
+            counts = CustomerStats.refresh(cursor, batch)
+            result['customers'] += counts['customers']
+            result['removed'] += counts['removed']
+        return result
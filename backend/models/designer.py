@@ -1,4 +1,5 @@
 from config.database import get_db_connection
+from utils.cache import cached, invalidate
 
 class Designer:
     @staticmethod
@@ -29,7 +30,7 @@ class Designer:
                     data.get('style_description', '')
                 ))
                 
-                conn.commit() 
+                invalidate('designers')
                 return cursor.lastrowid, None
     
     # [修正] 補上缺少的驗證密碼函式
@@ -51,6 +52,15 @@ class Designer:
                 cursor.execute("SELECT * FROM designer WHERE designer_id = %s", (designer_id,))
                 return cursor.fetchone()
     
+    @staticmethod
+    def get_name(designer_id):
+        """只取設計師名稱 (不需要整列資料時使用)"""
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT name FROM designer WHERE designer_id = %s", (designer_id,))
+                row = cursor.fetchone()
+                return row['name'] if row else None
+
     @staticmethod
     def update_password(designer_id, new_password):
         with get_db_connection() as conn:
@@ -59,7 +69,6 @@ class Designer:
                     "UPDATE designer SET password_hash = %s WHERE designer_id = %s",
                     (new_password, designer_id)
                 )
-                conn.commit()
                 return cursor.rowcount > 0
 
     @staticmethod
@@ -70,7 +79,7 @@ class Designer:
                     "UPDATE designer SET photo_url = %s WHERE designer_id = %s",
                     (photo_url, designer_id)
                 )
-                conn.commit()
+                invalidate('designers')
                 return cursor.rowcount > 0
 
     @staticmethod
@@ -79,11 +88,13 @@ class Designer:
             with conn.cursor() as cursor:
                 sql = "UPDATE designer SET name = %s, phone = %s, style_description = %s WHERE designer_id = %s"
                 cursor.execute(sql, (data['name'], data['phone'], data['style_description'], designer_id))
-                conn.commit()
+                invalidate('designers')
                 return cursor.rowcount > 0
 
     @staticmethod
+    @cached(ttl=300, tags=('designers',))
     def get_all():
+        # 快取的值從主要資料庫讀：讀取端點可能還沒看到剛寫入的資料，存進快取後會維持整個 TTL
         with get_db_connection() as conn:
             with conn.cursor() as cursor:
                 cursor.execute("""
@@ -148,6 +159,7 @@ class DesignerService:
                 return data
             
     @staticmethod
+    @cached(ttl=600, tags=('services', 'designer_services:{0}'))
     def get_service_config(designer_id, service_id):
         """
         取得單一服務的最終設定 (給建立預約用)
@@ -201,10 +213,11 @@ class DesignerService:
                     ))
                 
                 cursor.executemany(sql, params)
-                conn.commit()
+                invalidate(f'designer_services:{designer_id}', 'designer_services')
                 return True
             
     @staticmethod
+    @cached(ttl=600, tags=('services', 'designer_services:{0}'))
     def get_public_services(designer_id):
         """
         給顧客預約頁面用：取得該設計師「已上架」的服務與最終價格
@@ -232,6 +245,31 @@ class DesignerService:
                 cursor.execute(sql, (designer_id,))
                 return cursor.fetchall()
     
+    @staticmethod
+    @cached(ttl=600, tags=('services', 'designers', 'designer_services'))
+    def get_designers_offering(service_id):
+        """
+        給「不指定設計師」查詢用：所有在職且有開啟這項服務的設計師 (不含主管帳號)，以及各自的服務時長
+        """
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                sql = """
+                    SELECT 
+                        d.designer_id,
+                        d.name,
+                        d.photo_url,
+                        COALESCE(dsi.duration_min, s.duration_min) as duration_min
+                    FROM designer d
+                    JOIN service s ON s.service_id = %s AND s.is_active = 1
+                    LEFT JOIN designer_service_item dsi 
+                        ON dsi.service_id = s.service_id AND dsi.designer_id = d.designer_id
+                    WHERE d.is_active = 1 AND d.role = 'designer'
+                      AND (dsi.is_enabled = 1 OR dsi.is_enabled IS NULL)
+                    ORDER BY d.designer_id
+                """
+                cursor.execute(sql, (service_id,))
+                return cursor.fetchall()
+
     @staticmethod
     def get_all_designers_configs():
         """
@@ -1,7 +1,14 @@
 import math
-from config.database import get_db_connection
+from config.database import get_db_connection, stream_query
+from utils.cache import cached, invalidate
 
 class Product:
+    TRANSACTIONS_SQL = """
+        SELECT * FROM transactions 
+        WHERE product_id = %s 
+        ORDER BY transaction_date DESC
+    """
+
     @staticmethod
     def create(data):
         """
@@ -45,12 +52,14 @@ class Product:
                         0        # 初始安全存量
                     ))
                     
+                    invalidate('products')
                     return product_id, None
         except Exception as e:
             print(f"Error in Product.create: {e}")
             return None, str(e)
 
     @staticmethod
+    @cached(ttl=300, tags=('products',))
     def get_all():
         """取得所有產品列表"""
         with get_db_connection() as conn:
@@ -141,6 +150,8 @@ class Product:
                         product_id
                     ))
                     
+                    invalidate('products')
+
                     # 回傳計算結果供前端即時顯示
                     return {
                         'eoq': eoq_val,
@@ -220,6 +231,8 @@ class Product:
 
                     # 5. 判斷是否需要訂購 (庫存 <= ROP) [cite: 127]
                     # 如果是銷售 (OUT) 且 新庫存 <= ROP，且 ROP > 0 (有設定過)
+                    invalidate('products')
+
                     alert = False
                     if trans_type == 'OUT' and rop > 0 and new_stock <= rop:
                         alert = True
@@ -240,10 +253,10 @@ class Product:
         """取得單一產品的交易歷史紀錄"""
         with get_db_connection() as conn:
             with conn.cursor() as cursor:
-                sql = """
-                    SELECT * FROM transactions 
-                    WHERE product_id = %s 
-                    ORDER BY transaction_date DESC
-                """
-                cursor.execute(sql, (product_id,))
-                return cursor.fetchall()
\ No newline at end of file
+                cursor.execute(Product.TRANSACTIONS_SQL, (product_id,))
+                return cursor.fetchall()
+
+    @staticmethod
+    def iter_transactions(product_id):
+        """串流讀取交易歷史紀錄 (逐筆產生，不一次載入全部)"""
+        return stream_query(Product.TRANSACTIONS_SQL, (product_id,))
\ No newline at end of file
@@ -0,0 +1,244 @@
+from config.database import get_db_connection
+from utils.cache import cached
+from utils.occupancy import from_bytes, reservation_mask, to_bytes
+from utils.time_range import day_range, to_date
+
+
+class Occupancy:
+    """
+    設計師每日佔用位元圖 (designer_occupancy)
+    由 Reservation 的寫入路徑維護，查詢可用時段時只讀這張表
+    寫入方法都接收呼叫端的 cursor，與預約異動在同一個交易內
+    """
+
+    # 重建時每次鎖定幾天 (只限制單一 SQL 的大小，鎖仍持有到交易結束)
+    REBUILD_LOCK_BATCH = 200
+
+    @staticmethod
+    def get_masks(designer_id, start_date, end_date):
+        """取得設計師 start_date ~ end_date (含) 的位元圖，回傳 {date: mask}，沒有資料的日期視為全空"""
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT occupancy_date, bits FROM designer_occupancy
+                    WHERE designer_id = %s AND occupancy_date >= %s AND occupancy_date <= %s
+                """, (designer_id, to_date(start_date), to_date(end_date)))
+                return {row['occupancy_date']: from_bytes(row['bits']) for row in cursor.fetchall()}
+
+    @staticmethod
+    def get_masks_for(designer_ids, start_date, end_date):
+        """一次取得多位設計師的位元圖，回傳 {(designer_id, date): mask}"""
+        if not designer_ids:
+            return {}
+        placeholders = ', '.join(['%s'] * len(designer_ids))
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT designer_id, occupancy_date, bits FROM designer_occupancy
+                    WHERE designer_id IN ({placeholders})
+                    AND occupancy_date >= %s AND occupancy_date <= %s
+                """, (*designer_ids, to_date(start_date), to_date(end_date)))
+                return {
+                    (row['designer_id'], row['occupancy_date']): from_bytes(row['bits'])
+                    for row in cursor.fetchall()
+                }
+
+    @staticmethod
+    def get_day_mask(designer_id, date_str):
+        """單日位元圖 (有快取，新增預約或改狀態時失效)"""
+        return Occupancy._cached_day_mask(str(designer_id), to_date(date_str).isoformat())
+
+    @staticmethod
+    @cached(ttl=60, tags=('schedule:{0}:{1}',))
+    def _cached_day_mask(designer_id, date_str):
+        return Occupancy.get_masks(designer_id, date_str, date_str).get(to_date(date_str), 0)
+
+    @staticmethod
+    def lock_day(cursor, designer_id, day):
+        """
+        鎖定設計師當天的位元圖並回傳目前的值，交易結束前其他交易無法修改
+        列不存在時先建立 (全空)，確保一定有列可以鎖
+        只鎖這位設計師的這一天，其他設計師 / 其他天的預約不受影響
+        """
+        day = to_date(day)
+        cursor.execute("""
+            INSERT INTO designer_occupancy (designer_id, occupancy_date, bits)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE designer_id = designer_id
+        """, (designer_id, day, to_bytes(0)))
+        cursor.execute("""
+            SELECT bits FROM designer_occupancy
+            WHERE designer_id = %s AND occupancy_date = %s
+            FOR UPDATE
+        """, (designer_id, day))
+        row = cursor.fetchone()
+        return from_bytes(row['bits']) if row else 0
+
+    @staticmethod
+    def locked_reservations(cursor, designer_id, day):
+        """
+        讀取設計師當天未取消的預約 (需先 lock_day)
+        使用 FOR UPDATE 讀取最新已 commit 的資料，不受交易快照影響
+        """
+        day_start, day_end = day_range(day)
+        cursor.execute("""
+            SELECT reservation_id, reserved_time, duration_min FROM reservation
+            WHERE designer_id = %s
+            AND reserved_time >= %s AND reserved_time < %s
+            AND status != '已取消'
+            FOR UPDATE
+        """, (designer_id, day_start, day_end))
+        return list(cursor.fetchall())
+
+    @staticmethod
+    def save(cursor, designer_id, day, mask):
+        cursor.execute("""
+            INSERT INTO designer_occupancy (designer_id, occupancy_date, bits)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE bits = VALUES(bits)
+        """, (designer_id, to_date(day), to_bytes(mask)))
+
+    @staticmethod
+    def recompute(cursor, designer_id, day):
+        """
+        依 reservation 表重算設計師當天的位元圖 (取消、改期、狀態變更後使用)
+        位元圖無法直接「減掉」一筆預約 (可能與其他預約重疊)，所以整天重算
+        """
+        day = to_date(day)
+        Occupancy.lock_day(cursor, designer_id, day)
+        reservations = Occupancy.locked_reservations(cursor, designer_id, day)
+        Occupancy.save(cursor, designer_id, day, reservation_mask(reservations, day))
+
+    @staticmethod
+    def lock_days(cursor, keys):
+        """
+        一次鎖定多個 (designer_id, date)，依 (designer_id, date) 順序上鎖避免 deadlock
+        與 lock_day 相同：列不存在時先建立
+        """
+        keys = sorted({(designer_id, to_date(day)) for designer_id, day in keys})
+        if not keys:
+            return
+        cursor.executemany("""
+            INSERT INTO designer_occupancy (designer_id, occupancy_date, bits)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE designer_id = designer_id
+        """, [(designer_id, day, to_bytes(0)) for designer_id, day in keys])
+        conditions = ' OR '.join(['(designer_id = %s AND occupancy_date = %s)'] * len(keys))
+        cursor.execute(f"""
+            SELECT designer_id, occupancy_date FROM designer_occupancy
+            WHERE {conditions}
+            ORDER BY designer_id, occupancy_date
+            FOR UPDATE
+        """, tuple(value for key in keys for value in key))
+        cursor.fetchall()
+
+    @staticmethod
+    def locked_reservations_many(cursor, keys):
+        """
+        一次讀取多個 (designer_id, date) 未取消的預約 (需先 lock_days)，回傳 {(designer_id, date): [預約, ...]}
+        與 locked_reservations 相同使用 FOR UPDATE 讀取最新資料
+        """
+        keys = sorted({(designer_id, to_date(day)) for designer_id, day in keys})
+        if not keys:
+            return {}
+        conditions = ' OR '.join(['(designer_id = %s AND reserved_time >= %s AND reserved_time < %s)'] * len(keys))
+        params = []
+        for designer_id, day in keys:
+            params.extend([designer_id, *day_range(day)])
+        cursor.execute(f"""
+            SELECT reservation_id, designer_id, reserved_time, duration_min FROM reservation
+            WHERE ({conditions}) AND status != '已取消'
+            FOR UPDATE
+        """, tuple(params))
+        by_day = {key: [] for key in keys}
+        for row in cursor.fetchall():
+            by_day.setdefault((row['designer_id'], row['reserved_time'].date()), []).append(row)
+        return by_day
+
+    @staticmethod
+    def save_many(cursor, masks):
+        """masks = {(designer_id, date): mask}，一次寫入"""
+        if not masks:
+            return
+        cursor.executemany("""
+            INSERT INTO designer_occupancy (designer_id, occupancy_date, bits)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE bits = VALUES(bits)
+        """, [(designer_id, to_date(day), to_bytes(mask)) for (designer_id, day), mask in sorted(masks.items())])
+
+    @staticmethod
+    def recompute_many(cursor, keys):
+        """
+        多個 (designer_id, date) 一起重算 (批次改狀態用)，查詢次數與天數無關
+        呼叫端需先 lock_days
+        """
+        reservations = Occupancy.locked_reservations_many(cursor, keys)
+        Occupancy.save_many(cursor, {
+            (designer_id, day): reservation_mask(rows, day)
+            for (designer_id, day), rows in reservations.items()
+        })
+
+    @staticmethod
+    def rebuild(cursor, start_date=None, end_date=None):
+        """
+        從 reservation 表重建位元圖，修正與實際預約不一致的資料
+        start_date / end_date 為 None 時不限制
+        回傳 {'checked': 檢查的天數, 'fixed': 更新的天數, 'removed': 刪除的天數}
+        """
+        conditions = ["status != '已取消'"]
+        params = []
+        occupancy_conditions = []
+        occupancy_params = []
+        if start_date:
+            range_start, _ = day_range(start_date)
+            conditions.append("reserved_time >= %s")
+            params.append(range_start)
+            occupancy_conditions.append("occupancy_date >= %s")
+            occupancy_params.append(to_date(start_date))
+        if end_date:
+            _, range_end = day_range(end_date)
+            conditions.append("reserved_time < %s")
+            params.append(range_end)
+            occupancy_conditions.append("occupancy_date <= %s")
+            occupancy_params.append(to_date(end_date))
+
+        # 1. 依 reservation 計算正確的位元圖
+        expected = {}
+        cursor.execute(f"""
+            SELECT designer_id, reserved_time, duration_min FROM reservation
+            WHERE {' AND '.join(conditions)}
+        """, tuple(params))
+        for row in cursor.fetchall():
+            key = (row['designer_id'], row['reserved_time'].date())
+            expected[key] = expected.get(key, 0) | reservation_mask([row], key[1])
+
+        # 2. 與現有資料比對
+        where = f"WHERE {' AND '.join(occupancy_conditions)}" if occupancy_conditions else ''
+        cursor.execute(f"SELECT designer_id, occupancy_date, bits FROM designer_occupancy {where}",
+                       tuple(occupancy_params))
+        current = {(row['designer_id'], row['occupancy_date']): from_bytes(row['bits']) for row in cursor.fetchall()}
+
+        suspects = sorted(
+            {key for key, mask in expected.items() if current.get(key) != mask}
+            | {key for key, mask in current.items() if mask and key not in expected}
+        )
+
+        # 3. 有差異的天數與預約寫入路徑相同：依 (designer_id, date) 順序鎖定後，以最新資料重算再寫入
+        #    上面的快照可能早於同時 commit 的預約，不能直接寫入，否則會蓋掉較新的位元圖
+        fixed = removed = 0
+        for index in range(0, len(suspects), Occupancy.REBUILD_LOCK_BATCH):
+            keys = suspects[index:index + Occupancy.REBUILD_LOCK_BATCH]
+            Occupancy.lock_days(cursor, keys)
+            masks = {
+                key: reservation_mask(rows, key[1])
+                for key, rows in Occupancy.locked_reservations_many(cursor, keys).items()
+            }
+            empty = [key for key, mask in masks.items() if not mask]
+            Occupancy.save_many(cursor, {key: mask for key, mask in masks.items() if mask})
+            if empty:
+                cursor.executemany(
+                    "DELETE FROM designer_occupancy WHERE designer_id = %s AND occupancy_date = %s", empty
+                )
+            fixed += len(masks) - len(empty)
+            removed += sum(1 for key in empty if current.get(key))
+        return {'checked': len(set(expected) | set(current)), 'fixed': fixed, 'removed': removed}
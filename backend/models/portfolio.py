@@ -1,4 +1,4 @@
-from config.database import get_db_connection
+from config.database import get_db_connection, read_only
 
 class Portfolio:
     @staticmethod
@@ -76,6 +76,7 @@ class Portfolio:
                 return cursor.rowcount > 0
     
     @staticmethod
+    @read_only(max_staleness=30)
     def get_all(limit=50, offset=0):
         """取得所有作品（分頁）"""
         with get_db_connection() as conn:
@@ -92,6 +93,7 @@ class Portfolio:
                 return cursor.fetchall()
     
     @staticmethod
+    @read_only(max_staleness=30)
     def count():
         """取得作品總數"""
         with get_db_connection() as conn:
@@ -101,6 +103,7 @@ class Portfolio:
                 return result['total'] if result else 0
     
     @staticmethod
+    @read_only(max_staleness=30)
     def search_by_tag(style_tag):
         """根據風格標籤搜尋作品"""
         with get_db_connection() as conn:
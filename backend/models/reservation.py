@@ -1,13 +1,73 @@
-from config.database import get_db_connection
+from config.database import get_db_connection, stream_query
 from datetime import datetime, timedelta
+from utils.time_range import day_range, to_date
+from utils.pagination import encode_cursor
+from utils.cache import invalidate
+from utils.pubsub import publish
+from utils.scheduling import day_slots, has_conflict, minutes_of_day, nearest_slots
+from utils.occupancy import reservation_mask
+from models.occupancy import Occupancy
+from models.calendar import Calendar
+from models.customer_stats import CustomerStats
+from models.sales_rollup import SalesRollup
 
 class Reservation:
-    
+    # 時段衝突時的錯誤訊息 (route 依此回傳 409)
+    SLOT_TAKEN = "該時段已被預約，請選擇其他時間"
+    # 不在營業時間 / 設計師休假 / 封鎖時段 (route 依此回傳 400)
+    OUTSIDE_HOURS = "該時段不在營業時間內，請選擇其他時間"
+    # 改期時預約剛被其他人修改 (route 回傳 409)
+    CHANGED_CONCURRENTLY = "預約剛被修改，請重新整理後再試"
+
+    # 批次更新狀態時允許的流轉 (單筆的 PUT /<id>/status 不限制)
+    STATUS_TRANSITIONS = {
+        '待確認': ('已確認', '已取消'),
+        '已確認': ('已完成', '已取消'),
+        '已完成': (),
+        '已取消': (),
+    }
+
+    # 週期 / 組合預約的上限
+    SERIES_MAX_OCCURRENCES = 12
+    SERIES_MAX_SERVICES = 5
+
+    CUSTOMER_HISTORY_SQL = """
+        SELECT
+            r.reservation_id, 
+            r.customer_id, 
+            r.designer_id, 
+            r.service_id, 
+            DATE_FORMAT(r.reserved_time, '%%Y-%%m-%%d %%H:%%i:%%s') as reserved_time,
+            r.final_price, 
+            r.duration_min,
+            r.notes, 
+            r.status,
+            r.created_at,
+            s.name as service_name, 
+            s.duration_min, 
+            d.name as designer_name, 
+            d.photo_url as designer_photo
+        FROM reservation r
+        JOIN service s ON r.service_id = s.service_id
+        JOIN designer d ON r.designer_id = d.designer_id
+        WHERE r.customer_id = %s
+        ORDER BY r.reserved_time DESC
+    """
+
+    # 半開區間 [起, 迄)，可使用 (designer_id, reserved_time, status) 索引
+    # 單日與多日排程共用，依時間排序方便逐日計算
+    DAILY_SCHEDULE_SQL = """
+        SELECT reservation_id, reserved_time, duration_min
+        FROM reservation
+        WHERE designer_id = %s 
+        AND reserved_time >= %s AND reserved_time < %s
+        AND status != '已取消'
+        ORDER BY reserved_time
+    """
+
     @staticmethod
-    def check_conflict(designer_id, start_time, duration_min, exclude_res_id=None):
-        """
-        核心邏輯：檢查時間是否衝突
-        """
+    def parse_time(start_time):
+        """預約時間字串 -> datetime"""
         # [修正] 容錯處理：同時支援含秒數與不含秒數的格式
         if isinstance(start_time, str):
             try:
@@ -20,28 +80,25 @@ class Reservation:
                 except ValueError:
                     # 如果格式真的太奇怪，這裡會報錯，但至少擋掉了上面的問題
                     raise ValueError(f"時間格式錯誤: {start_time}")
-            
-        end_time = start_time + timedelta(minutes=duration_min)
-        
-        date_str = start_time.strftime('%Y-%m-%d')
-        daily_schedule = Reservation.get_designer_daily_schedule(designer_id, date_str)
-        
-        for res in daily_schedule:
-            if exclude_res_id and str(res['reservation_id']) == str(exclude_res_id):
-                continue
+        return start_time
 
-            exist_start = res['reserved_time'] 
-            exist_duration = res['duration_min']
-            exist_end = exist_start + timedelta(minutes=exist_duration)
-            
-            if start_time < exist_end and end_time > exist_start:
-                return True 
-                
-        return False
+    @staticmethod
+    def check_conflict(designer_id, start_time, duration_min, exclude_res_id=None):
+        """
+        核心邏輯：檢查時間是否衝突
+        """
+        start_time = Reservation.parse_time(start_time)
+        # 只需要讀當天的預約，單次檢查直接線性掃描，不必排序 (見 utils/scheduling.has_conflict)
+        daily_schedule = Reservation.get_designer_daily_schedule(designer_id, start_time)
+        return has_conflict(start_time, duration_min, daily_schedule, exclude_id=exclude_res_id)
 
     @staticmethod
     def create(data):
-        """建立新預約"""
+        """
+        建立新預約
+        檢查衝突與寫入在同一個交易內完成：先鎖定該設計師當天的佔用列，
+        同一設計師同一天的預約依序處理，不同設計師之間互不阻擋
+        """
         
         # 1. 直接使用 Controller 傳進來的 duration_min (這是從設計師設定拿到的)
         duration = data.get('duration_min')
@@ -50,13 +107,20 @@ class Reservation:
         if not duration:
              return None, "系統錯誤：未取得服務時間"
 
-        # 2. 檢查衝突
-        if Reservation.check_conflict(data['designer_id'], data['reserved_time'], duration):
-            return None, "該時段已被預約，請選擇其他時間"
+        start_time = Reservation.parse_time(data['reserved_time'])
+        day = start_time.date()
+        if not Calendar.fits(data['designer_id'], start_time, duration):
+            return None, Reservation.OUTSIDE_HOURS
 
-        # 3. 寫入資料庫 (新增 duration_min 欄位)
         with get_db_connection() as conn:
             with conn.cursor() as cursor:
+                # 2. 鎖定設計師當天，之後讀到的預約就是最新的，檢查完到寫入之間不會被插隊
+                Occupancy.lock_day(cursor, data['designer_id'], day)
+                daily_schedule = Occupancy.locked_reservations(cursor, data['designer_id'], day)
+                if has_conflict(start_time, duration, daily_schedule):
+                    return None, Reservation.SLOT_TAKEN
+
+                # 3. 寫入資料庫 (新增 duration_min 欄位)
                 sql = """
                     INSERT INTO reservation 
                     (customer_id, designer_id, service_id, reserved_time, final_price, duration_min, notes, status)
@@ -71,8 +135,113 @@ class Reservation:
                     duration,            # <--- 寫入這裡！
                     data.get('notes', '')
                 ))
-                conn.commit()
-                return cursor.lastrowid, None
+                reservation_id = cursor.lastrowid
+
+                # 4. 同一個交易內更新佔用位元圖 (順便修正可能的不一致)
+                daily_schedule.append({'reserved_time': start_time, 'duration_min': duration})
+                Occupancy.save(cursor, data['designer_id'], day, reservation_mask(daily_schedule, day))
+                Reservation._invalidate_schedule(data['designer_id'], day)
+                Reservation._publish_change('created', data['designer_id'], start_time,
+                                            reservation_id=reservation_id, status='待確認', duration_min=duration)
+                return reservation_id, None
+
+    @staticmethod
+    def expand_series(start_time, services, every_days=None, count=1):
+        """
+        展開週期 / 組合預約
+        services = [{'service_id', 'duration_min', 'final_price'}, ...]：同一次來店依序接續 (例如剪髮後接染髮)
+        every_days / count：每隔幾天重複一次、共幾次
+        回傳 [{'start': datetime, 'duration_min': 整組時長, 'items': [{'service_id', 'reserved_time', 'duration_min', 'final_price'}, ...]}, ...]
+        """
+        start_time = Reservation.parse_time(start_time)
+        occurrences = []
+        for index in range(count):
+            start = start_time + timedelta(days=(every_days or 0) * index)
+            items = []
+            offset = 0
+            for service in services:
+                items.append({
+                    'service_id': service['service_id'],
+                    'reserved_time': start + timedelta(minutes=offset),
+                    'duration_min': service['duration_min'],
+                    'final_price': service['final_price'],
+                })
+                offset += service['duration_min']
+            occurrences.append({'start': start, 'duration_min': offset, 'items': items})
+        return occurrences
+
+    @staticmethod
+    def create_series(customer_id, designer_id, occurrences, notes=''):
+        """
+        一次建立多筆預約 (expand_series 的結果)，全部成功或全部不建立
+        - 依日期順序鎖定設計師相關的每一天，一次讀出這些天的預約
+        - 每次來店整組檢查 (營業時間、衝突)，組內的服務彼此接續不算衝突
+        回傳 (reservation_ids, None) 或 (None, conflicts)
+        conflicts = [{'date', 'time', 'reason': 'taken' / 'outside_hours', 'error', 'suggestions': ['13:00', ...]}, ...]
+        """
+        days = sorted({occurrence['start'].date() for occurrence in occurrences})
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                keys = [(designer_id, day) for day in days]
+                Occupancy.lock_days(cursor, keys)
+                schedules = Occupancy.locked_reservations_many(cursor, keys)
+                schedules = {day: schedules.get((designer_id, day), []) for day in days}
+
+                now = datetime.now()
+                conflicts = []
+                for occurrence in occurrences:
+                    start, duration = occurrence['start'], occurrence['duration_min']
+                    day = start.date()
+                    if not Calendar.fits(designer_id, start, duration):
+                        reason, error = 'outside_hours', Reservation.OUTSIDE_HOURS
+                    elif has_conflict(start, duration, schedules[day]):
+                        reason, error = 'taken', Reservation.SLOT_TAKEN
+                    else:
+                        continue
+                    # 建議同一天、放得下整組服務且最接近原時間的時段
+                    slots = day_slots(day, duration, schedules[day], now,
+                                      windows=Calendar.get_working_windows(designer_id, day))
+                    conflicts.append({
+                        'date': day.isoformat(),
+                        'time': start.strftime('%H:%M'),
+                        'reason': reason,
+                        'error': error,
+                        'suggestions': nearest_slots(slots, minutes_of_day(start, day)),
+                    })
+                if conflicts:
+                    return None, conflicts
+
+                rows = [item for occurrence in occurrences for item in occurrence['items']]
+                cursor.executemany("""
+                    INSERT INTO reservation
+                    (customer_id, designer_id, service_id, reserved_time, final_price, duration_min, notes, status)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, '待確認')
+                """, [
+                    (customer_id, designer_id, item['service_id'], item['reserved_time'],
+                     item['final_price'], item['duration_min'], notes)
+                    for item in rows
+                ])
+                # 這幾天已鎖定且時段不重疊，(設計師, 時間) 可以唯一對應到剛寫入的預約
+                placeholders = ', '.join(['%s'] * len(rows))
+                cursor.execute(f"""
+                    SELECT reservation_id, reserved_time FROM reservation
+                    WHERE designer_id = %s AND customer_id = %s
+                    AND reserved_time IN ({placeholders}) AND status = '待確認'
+                """, (designer_id, customer_id, *[item['reserved_time'] for item in rows]))
+                ids = {row['reserved_time']: row['reservation_id'] for row in cursor.fetchall()}
+
+                for item in rows:
+                    schedules[item['reserved_time'].date()].append(item)
+                Occupancy.save_many(cursor, {
+                    (designer_id, day): reservation_mask(schedules[day], day) for day in days
+                })
+                for day in days:
+                    Reservation._invalidate_schedule(designer_id, day)
+                for item in rows:
+                    Reservation._publish_change('created', designer_id, item['reserved_time'],
+                                                reservation_id=ids.get(item['reserved_time']), status='待確認',
+                                                duration_min=item['duration_min'])
+                return [ids.get(item['reserved_time']) for item in rows], None
 
     @staticmethod
     def get_designer_daily_schedule(designer_id, date_str):
@@ -80,48 +249,166 @@ class Reservation:
         取得設計師在特定日期的所有預約 (給排程計算用)
         [修改] 改為直接讀取 reservation 表的 duration_min，不用再 JOIN service 表了
         """
+        day_start, day_end = day_range(date_str)
         with get_db_connection() as conn:
             with conn.cursor() as cursor:
-                sql = """
-                    SELECT reservation_id, reserved_time, duration_min
-                    FROM reservation
-                    WHERE designer_id = %s 
-                    AND DATE(reserved_time) = %s
-                    AND status != '已取消'
-                """
-                cursor.execute(sql, (designer_id, date_str))
+                cursor.execute(Reservation.DAILY_SCHEDULE_SQL, (designer_id, day_start, day_end))
                 return cursor.fetchall()
-            
+
+    @staticmethod
+    def _invalidate_schedule(designer_id, reserved_time):
+        """預約異動後，讓該設計師當天的排程 (佔用位元圖) 快取失效"""
+        invalidate(f'schedule:{designer_id}:{to_date(reserved_time).isoformat()}')
+
+    @staticmethod
+    def _publish_change(event_type, designer_id, reserved_time, extra_topics=(), **fields):
+        """
+        推播預約異動 (commit 後才送出，見 utils/pubsub.py)
+        主題為設計師與日期；只帶排程需要的欄位，不含顧客資料
+        event_type: created / status_changed / cancelled / rescheduled
+        """
+        designer_id = int(designer_id)
+        day = reserved_time.date().isoformat()
+        publish((f'designer:{designer_id}', f'date:{day}', *extra_topics), {
+            'type': event_type,
+            'designer_id': designer_id,
+            'date': day,
+            'time': reserved_time.strftime('%H:%M'),
+            **fields
+        })
+
     @staticmethod
     def get_by_customer(customer_id):
         """取得顧客的預約紀錄"""
         with get_db_connection() as conn:
             with conn.cursor() as cursor:
-                sql = """
-                    SELECT
-                        r.reservation_id, 
-                        r.customer_id, 
-                        r.designer_id, 
-                        r.service_id, 
-                        DATE_FORMAT(r.reserved_time, '%%Y-%%m-%%d %%H:%%i:%%s') as reserved_time,
-                        r.final_price, 
-                        r.duration_min,
-                        r.notes, 
-                        r.status,
-                        r.created_at,
-                        s.name as service_name, 
-                        s.duration_min, 
-                        d.name as designer_name, 
-                        d.photo_url as designer_photo
-                    FROM reservation r
-                    JOIN service s ON r.service_id = s.service_id
-                    JOIN designer d ON r.designer_id = d.designer_id
-                    WHERE r.customer_id = %s
-                    ORDER BY r.reserved_time DESC
-                """
-                cursor.execute(sql, (customer_id,))
+                cursor.execute(Reservation.CUSTOMER_HISTORY_SQL, (customer_id,))
                 return cursor.fetchall()
 
+    @staticmethod
+    def iter_by_customer(customer_id):
+        """串流讀取顧客的預約紀錄 (逐筆產生，不一次載入全部)"""
+        return stream_query(Reservation.CUSTOMER_HISTORY_SQL, (customer_id,))
+
+    # 分頁查詢：內層只用 (擁有者, reserved_time, reservation_id) 索引挑出這一頁的 ID，
+    # 外層才 JOIN 與格式化，每頁成本固定，與歷史筆數無關
+    CUSTOMER_PAGE_SQL = """
+        SELECT
+            r.reservation_id,
+            r.customer_id,
+            r.designer_id,
+            r.service_id,
+            DATE_FORMAT(r.reserved_time, '%%Y-%%m-%%d %%H:%%i:%%s') as reserved_time,
+            r.final_price,
+            r.duration_min,
+            r.notes,
+            r.status,
+            r.created_at,
+            s.name as service_name,
+            d.name as designer_name,
+            d.photo_url as designer_photo
+        FROM ({page}) page
+        JOIN reservation r ON r.reservation_id = page.reservation_id
+        JOIN service s ON r.service_id = s.service_id
+        JOIN designer d ON r.designer_id = d.designer_id
+        ORDER BY r.reserved_time {order}, r.reservation_id {order}
+    """
+
+    DESIGNER_PAGE_SQL = """
+        SELECT
+            r.reservation_id,
+            DATE_FORMAT(r.reserved_time, '%%Y-%%m-%%d %%H:%%i:%%s') as reserved_time,
+            r.status,
+            r.final_price,
+            r.notes,
+            s.name as service_name,
+            r.duration_min,
+            u.name as customer_name,
+            u.phone as customer_phone
+        FROM ({page}) page
+        JOIN reservation r ON r.reservation_id = page.reservation_id
+        JOIN service s ON r.service_id = s.service_id
+        JOIN customer u ON r.customer_id = u.customer_id
+        ORDER BY r.reserved_time {order}, r.reservation_id {order}
+    """
+
+    @staticmethod
+    def _page_filters(owner_column, owner_id, date_from=None, date_to=None, statuses=None):
+        """擁有者、日期區間 (含 to 當天)、狀態條件，回傳 (條件列表, 參數列表)"""
+        conditions = [f"{owner_column} = %s"]
+        params = [owner_id]
+        if date_from:
+            conditions.append("reserved_time >= %s")
+            params.append(day_range(date_from)[0])
+        if date_to:
+            conditions.append("reserved_time < %s")
+            params.append(day_range(date_to)[1])
+        if statuses:
+            conditions.append(f"status IN ({', '.join(['%s'] * len(statuses))})")
+            params.extend(statuses)
+        return conditions, params
+
+    @staticmethod
+    def _page(select_sql, owner_column, owner_id, limit, cursor=None, date_from=None, date_to=None,
+              statuses=None, descending=False):
+        """
+        keyset 分頁，回傳 {'items': [...], 'next_cursor': ..., 'has_more': bool}
+        第一頁 (沒有 cursor) 另外附上 summary: {'total': 筆數, 'by_status': {狀態: 筆數}}
+        """
+        conditions, params = Reservation._page_filters(owner_column, owner_id, date_from, date_to, statuses)
+        summary_where, summary_params = ' AND '.join(conditions), list(params)
+
+        # 從上一頁最後一筆 (reserved_time, reservation_id) 之後接著查
+        op = '<' if descending else '>'
+        if cursor:
+            cursor_time, cursor_id = cursor
+            conditions.append(f"(reserved_time {op} %s OR (reserved_time = %s AND reservation_id {op} %s))")
+            params.extend([cursor_time, cursor_time, cursor_id])
+
+        order = 'DESC' if descending else 'ASC'
+        page_sql = f"""
+            SELECT reservation_id FROM reservation
+            WHERE {' AND '.join(conditions)}
+            ORDER BY reserved_time {order}, reservation_id {order}
+            LIMIT %s
+        """
+        with get_db_connection() as conn:
+            with conn.cursor() as db_cursor:
+                # 多查一筆判斷是否還有下一頁
+                db_cursor.execute(select_sql.format(page=page_sql, order=order), (*params, limit + 1))
+                rows = db_cursor.fetchall()
+
+                result = {'items': rows[:limit], 'has_more': len(rows) > limit, 'next_cursor': None}
+                if result['has_more']:
+                    last = rows[limit - 1]
+                    result['next_cursor'] = encode_cursor(last['reserved_time'], last['reservation_id'])
+
+                if not cursor:
+                    db_cursor.execute(f"""
+                        SELECT status, COUNT(*) AS total FROM reservation
+                        WHERE {summary_where}
+                        GROUP BY status
+                    """, tuple(summary_params))
+                    by_status = {row['status']: row['total'] for row in db_cursor.fetchall()}
+                    result['summary'] = {'total': sum(by_status.values()), 'by_status': by_status}
+                return result
+
+    @staticmethod
+    def page_by_customer(customer_id, limit, cursor=None, date_from=None, date_to=None, statuses=None):
+        """顧客的預約紀錄 (分頁，新到舊)"""
+        return Reservation._page(
+            Reservation.CUSTOMER_PAGE_SQL, 'customer_id', customer_id, limit,
+            cursor, date_from, date_to, statuses, descending=True
+        )
+
+    @staticmethod
+    def page_for_designer(designer_id, limit, cursor=None, date_from=None, date_to=None, statuses=None):
+        """設計師後台的預約列表 (分頁，依時間先後)"""
+        return Reservation._page(
+            Reservation.DESIGNER_PAGE_SQL, 'designer_id', designer_id, limit,
+            cursor, date_from, date_to, statuses
+        )
+
     @staticmethod
     def get_for_designer_management(designer_id, date=None):
         """
@@ -151,8 +438,8 @@ class Reservation:
                 params = [designer_id]
                 
                 if date:
-                    sql += " AND DATE(r.reserved_time) = %s"
-                    params.append(date)
+                    sql += " AND r.reserved_time >= %s AND r.reserved_time < %s"
+                    params.extend(day_range(date))
                 
                 sql += " ORDER BY r.reserved_time ASC"
                 
@@ -161,10 +448,268 @@ class Reservation:
             
     @staticmethod
     def update_status(reservation_id, new_status):
-        """更新預約狀態"""
+        """
+        更新預約狀態 (單筆，不限制狀態流轉；從已取消恢復時仍會檢查時段是否已被預約)
+        回傳 bulk_update_status 的單筆結果 {'reservation_id', 'status', 'result', 'error'}，資料庫錯誤時回傳 None
+        """
+        results = Reservation.bulk_update_status(
+            [{'reservation_id': reservation_id, 'status': new_status}], enforce_transitions=False
+        )
+        return results[0] if results else None
+
+    @staticmethod
+    def bulk_update_status(items, designer_id=None, enforce_transitions=True):
+        """
+        批次更新預約狀態，全部在同一個交易內完成
+        items = [{'reservation_id': 1, 'status': '已完成'}, ...]
+        designer_id: 指定時只能改這位設計師的預約 (None 表示不限，管理者用)
+        enforce_transitions: 只允許 STATUS_TRANSITIONS 內的狀態流轉
+            不限制時仍不能造成重複預約：從已取消恢復的預約與建立預約相同，在鎖定下檢查衝突 (衝突時 error 為 SLOT_TAKEN)
+        回傳與 items 同順序的 [{'reservation_id', 'status', 'result', 'error'}, ...]
+        result: updated / unchanged / not_found / forbidden / invalid_status / invalid_transition / duplicate / conflict
+        """
+        results = []
+        requested = {}
+        for item in items:
+            result = {'reservation_id': item.get('reservation_id'), 'status': item.get('status'),
+                      'result': None, 'error': None}
+            results.append(result)
+            try:
+                result['reservation_id'] = int(result['reservation_id'])
+            except (TypeError, ValueError):
+                pass
+            if result['status'] not in Reservation.STATUS_TRANSITIONS:
+                result['result'], result['error'] = 'invalid_status', '無效的狀態'
+            elif not isinstance(result['reservation_id'], int):
+                result['result'], result['error'] = 'not_found', '找不到該預約'
+            elif result['reservation_id'] in requested:
+                result['result'], result['error'] = 'duplicate', '同一筆預約重複出現'
+            else:
+                requested[result['reservation_id']] = result
+        if not requested:
+            return results
+
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                # 1. 一次查出所有預約，檢查擁有者與狀態流轉 (不上鎖)
+                placeholders = ', '.join(['%s'] * len(requested))
+                cursor.execute(f"""
+                    SELECT reservation_id, customer_id, designer_id, reserved_time, status
+                    FROM reservation WHERE reservation_id IN ({placeholders})
+                """, tuple(requested))
+                current = {row['reservation_id']: row for row in cursor.fetchall()}
+
+                planned = {}
+                for reservation_id, result in requested.items():
+                    row = current.get(reservation_id)
+                    if not row:
+                        result['result'], result['error'] = 'not_found', '找不到該預約'
+                    elif designer_id is not None and str(row['designer_id']) != str(designer_id):
+                        result['result'], result['error'] = 'forbidden', '權限不足'
+                    elif row['status'] == result['status']:
+                        result['result'] = 'unchanged'
+                    elif enforce_transitions and result['status'] not in Reservation.STATUS_TRANSITIONS[row['status']]:
+                        result['result'] = 'invalid_transition'
+                        result['error'] = f"無法從{row['status']}改為{result['status']}"
+                    else:
+                        planned[reservation_id] = row
+                if not planned:
+                    return results
+
+                # 2. 會改變佔用的 (進出已取消) 先鎖定設計師當天，鎖定順序與建立預約相同 (先佔用列、再預約列)
+                #    進出已完成的再鎖定顧客統計列
+                changes = [(row, requested[reservation_id]['status']) for reservation_id, row in planned.items()]
+                Occupancy.lock_days(cursor, Reservation._occupancy_days(changes))
+                CustomerStats.lock(cursor, Reservation._stats_customers(changes))
+
+                # 3. 鎖定要更新的預約，確認狀態、設計師與時間在檢查後沒有被其他交易改掉
+                #    (被改期到別天時，上面鎖定與之後重算的都是原本那一天)
+                placeholders = ', '.join(['%s'] * len(planned))
+                cursor.execute(f"""
+                    SELECT reservation_id, designer_id, reserved_time, duration_min, status FROM reservation
+                    WHERE reservation_id IN ({placeholders})
+                    FOR UPDATE
+                """, tuple(planned))
+                latest = {row['reservation_id']: row for row in cursor.fetchall()}
+                for reservation_id in list(planned):
+                    row, fresh = planned[reservation_id], latest.get(reservation_id)
+                    if fresh and fresh['status'] == row['status'] and str(fresh['designer_id']) == str(row['designer_id']) \
+                            and fresh['reserved_time'] == row['reserved_time']:
+                        continue
+                    result = requested[reservation_id]
+                    if not fresh:
+                        result['result'], result['error'] = 'not_found', '找不到該預約'
+                    elif fresh['status'] != row['status']:
+                        result['result'], result['error'] = 'conflict', '預約狀態已被其他人更新，請重新整理'
+                    else:
+                        result['result'], result['error'] = 'conflict', Reservation.CHANGED_CONCURRENTLY
+                    del planned[reservation_id]
+
+                # 從已取消恢復的預約，時段可能已被別人預約：與建立預約相同，在鎖定下讀取當天預約檢查衝突
+                reactivated = sorted(reservation_id for reservation_id, row in planned.items() if row['status'] == '已取消')
+                if reactivated:
+                    schedules = Occupancy.locked_reservations_many(cursor, [
+                        (planned[reservation_id]['designer_id'], planned[reservation_id]['reserved_time'])
+                        for reservation_id in reactivated
+                    ])
+                    for reservation_id in reactivated:
+                        row, duration = planned[reservation_id], latest[reservation_id]['duration_min']
+                        schedule = schedules[(row['designer_id'], to_date(row['reserved_time']))]
+                        if has_conflict(row['reserved_time'], duration, schedule, exclude_id=reservation_id):
+                            result = requested[reservation_id]
+                            result['result'], result['error'] = 'conflict', Reservation.SLOT_TAKEN
+                            del planned[reservation_id]
+                        else:
+                            # 同一批恢復的預約之間也不能重疊
+                            schedule.append({'reservation_id': reservation_id, 'reserved_time': row['reserved_time'],
+                                             'duration_min': duration})
+                if not planned:
+                    return results
+
+                # 4. 一條 UPDATE 套用所有變更
+                cases = ' '.join(['WHEN %s THEN %s'] * len(planned))
+                placeholders = ', '.join(['%s'] * len(planned))
+                cursor.execute(f"""
+                    UPDATE reservation
+                    SET status = CASE reservation_id {cases} END
+                    WHERE reservation_id IN ({placeholders})
+                """, (
+                    *[value for reservation_id in planned for value in (reservation_id, requested[reservation_id]['status'])],
+                    *planned
+                ))
+                for reservation_id in planned:
+                    requested[reservation_id]['result'] = 'updated'
+
+                Reservation._after_status_change(cursor, [
+                    (row, requested[reservation_id]['status']) for reservation_id, row in planned.items()
+                ])
+                return results
+
+    @staticmethod
+    def _occupancy_days(changes):
+        """changes = [(原本的預約列, 新狀態), ...] -> 佔用會改變的 {(designer_id, date)}：進出「已取消」"""
+        return {
+            (row['designer_id'], to_date(row['reserved_time']))
+            for row, new_status in changes
+            if row['status'] != new_status and '已取消' in (row['status'], new_status)
+        }
+
+    @staticmethod
+    def _completed_changes(changes):
+        """changes = [(原本的預約列, 新狀態), ...] -> 進出「已完成」的預約列 (影響顧客統計與銷售彙總)"""
+        return [
+            row for row, new_status in changes
+            if row['status'] != new_status and '已完成' in (row['status'], new_status)
+        ]
+
+    @staticmethod
+    def _stats_customers(changes):
+        """changes = [(原本的預約列, 新狀態), ...] -> 統計會改變的 {customer_id}：進出「已完成」"""
+        return {row['customer_id'] for row in Reservation._completed_changes(changes)}
+
+    @staticmethod
+    def _after_status_change(cursor, changes):
+        """
+        狀態變更後的連帶更新 (單筆與批次共用，同一個交易內)
+        - 進出「已取消」會改變當天的佔用：每個設計師當天重算一次 (需先 Occupancy.lock_days)
+        - 進出「已完成」會改變顧客的 RFM 統計：重算這些顧客 (需先 CustomerStats.lock)
+          並標記銷售彙總需要重算的日期 (由背景工作處理)
+        - 讓受影響的排程快取失效
+        - 推播狀態變更
+        """
+        days = Reservation._occupancy_days(changes)
+        Occupancy.recompute_many(cursor, days)
+        CustomerStats.refresh(cursor, Reservation._stats_customers(changes))
+        SalesRollup.mark_changed(cursor, Reservation._completed_changes(changes))
+        for designer_id, day in days:
+            Reservation._invalidate_schedule(designer_id, day)
+        for row, new_status in changes:
+            Reservation._publish_change(
+                'cancelled' if new_status == '已取消' else 'status_changed',
+                row['designer_id'], row['reserved_time'],
+                reservation_id=row['reservation_id'], status=new_status, previous_status=row['status']
+            )
+
+    @staticmethod
+    def get_by_id(reservation_id):
+        """取得單筆預約"""
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT reservation_id, customer_id, designer_id, service_id,
+                           reserved_time, duration_min, status
+                    FROM reservation WHERE reservation_id = %s
+                """, (reservation_id,))
+                return cursor.fetchone()
+
+    @staticmethod
+    def reschedule(reservation_id, new_time):
+        """
+        改期：檢查新時段沒有衝突後更新時間，並重算新舊兩天的佔用位元圖
+        先依讀到的時間鎖定新舊兩天，再以 FOR UPDATE 重新讀取這筆預約檢查狀態與時間，
+        鎖定前被其他交易取消、完成或改期時不會覆蓋
+        回傳 (是否成功, 錯誤訊息)
+        """
+        new_time = Reservation.parse_time(new_time)
         with get_db_connection() as conn:
             with conn.cursor() as cursor:
-                sql = "UPDATE reservation SET status = %s WHERE reservation_id = %s"
-                cursor.execute(sql, (new_status, reservation_id))
-                conn.commit()
-                return cursor.rowcount > 0
\ No newline at end of file
+                cursor.execute(
+                    "SELECT designer_id, reserved_time, duration_min, status FROM reservation WHERE reservation_id = %s",
+                    (reservation_id,)
+                )
+                current = cursor.fetchone()
+                if not current:
+                    return False, "找不到該預約"
+                if current['status'] in ('已取消', '已完成'):
+                    return False, f"預約狀態為{current['status']}，無法改期"
+
+                designer_id = current['designer_id']
+                if not Calendar.fits(designer_id, new_time, current['duration_min']):
+                    return False, Reservation.OUTSIDE_HOURS
+                days = sorted({current['reserved_time'].date(), new_time.date()})
+                # 依日期順序鎖定新舊兩天，避免兩個改期互相等待 (deadlock)
+                for day in days:
+                    Occupancy.lock_day(cursor, designer_id, day)
+                # 鎖定後重新讀取最新資料 (上面的讀取不持有鎖，可能已被其他交易修改)
+                cursor.execute(
+                    "SELECT reserved_time, status FROM reservation WHERE reservation_id = %s FOR UPDATE",
+                    (reservation_id,)
+                )
+                latest = cursor.fetchone()
+                if not latest:
+                    return False, "找不到該預約"
+                if latest['status'] in ('已取消', '已完成'):
+                    return False, f"預約狀態為{latest['status']}，無法改期"
+                if latest['reserved_time'] != current['reserved_time']:
+                    # 已被改到別天時，原本的那一天沒有鎖到，不能在這個交易內重算
+                    return False, Reservation.CHANGED_CONCURRENTLY
+                current['status'] = latest['status']
+                daily_schedule = Occupancy.locked_reservations(cursor, designer_id, new_time.date())
+                if has_conflict(new_time, current['duration_min'], daily_schedule, exclude_id=reservation_id):
+                    return False, Reservation.SLOT_TAKEN
+
+                cursor.execute(
+                    "UPDATE reservation SET reserved_time = %s WHERE reservation_id = %s",
+                    (new_time, reservation_id)
+                )
+                # 兩天都已鎖定，直接依最新資料重算位元圖
+                new_day = new_time.date()
+                moved = {'reservation_id': reservation_id, 'reserved_time': new_time, 'duration_min': current['duration_min']}
+                new_day_schedule = [
+                    res for res in daily_schedule if str(res['reservation_id']) != str(reservation_id)
+                ] + [moved]
+                Occupancy.save(cursor, designer_id, new_day, reservation_mask(new_day_schedule, new_day))
+                old_day = current['reserved_time'].date()
+                if old_day != new_day:
+                    old_day_schedule = Occupancy.locked_reservations(cursor, designer_id, old_day)
+                    Occupancy.save(cursor, designer_id, old_day, reservation_mask(old_day_schedule, old_day))
+
+                for day in days:
+                    Reservation._invalidate_schedule(designer_id, day)
+                Reservation._publish_change(
+                    'rescheduled', designer_id, new_time,
+                    extra_topics=(f'date:{old_day.isoformat()}',),
+                    reservation_id=reservation_id, status=current['status'], duration_min=current['duration_min'],
+                    from_date=old_day.isoformat(), from_time=current['reserved_time'].strftime('%H:%M')
+                )
+                return True, None
\ No newline at end of file
@@ -1,7 +1,54 @@
-from config.database import get_db_connection
-from datetime import datetime
+from config.database import get_db_connection, read_only
+from datetime import datetime, timedelta
+from utils.time_range import day_range, month_range, to_date
 
 class SalesModel:
+
+    # 趨勢圖包含 as_of 當月與之前幾個月
+    TREND_MONTHS = 6
+
+    # 儀表板的所有指標一次查完：done 為 as_of 以前已完成的預約 (status, reserved_time 索引的區間掃描)
+    # - month 列：趨勢圖與本月 / 上月營收
+    # - customers 列：依顧客彙總後的新客、本月 / 上月活躍、留存人數，以及購買間隔
+    #   購買間隔：每位顧客相鄰兩次的天數相加 = 最後一次 - 第一次，不需要 LAG 逐筆計算
+    DASHBOARD_SQL = """
+        WITH done AS (
+            SELECT customer_id, reserved_time, final_price
+            FROM reservation
+            WHERE status = '已完成' AND reserved_time < %(end)s
+        ),
+        per_customer AS (
+            SELECT
+                customer_id,
+                MIN(reserved_time) AS first_buy,
+                DATEDIFF(MAX(reserved_time), MIN(reserved_time)) AS span_days,
+                COUNT(*) AS visits,
+                MAX(reserved_time >= %(this_start)s) AS this_month,
+                MAX(reserved_time >= %(last_start)s AND reserved_time < %(this_start)s) AS last_month
+            FROM done
+            GROUP BY customer_id
+        )
+        SELECT
+            'month' AS kind,
+            DATE_FORMAT(reserved_time, '%%Y-%%m') AS month,
+            SUM(final_price) AS revenue,
+            COUNT(*) AS order_count,
+            NULL AS new_customers, NULL AS active_customers, NULL AS last_active_customers,
+            NULL AS retained_customers, NULL AS span_days, NULL AS intervals
+        FROM done
+        WHERE reserved_time >= %(trend_start)s
+        GROUP BY month
+        UNION ALL
+        SELECT
+            'customers', NULL, NULL, NULL,
+            SUM(first_buy >= %(this_start)s),
+            SUM(this_month),
+            SUM(last_month),
+            SUM(this_month AND last_month),
+            SUM(span_days),
+            SUM(visits - 1)
+        FROM per_customer
+    """
     
     @staticmethod
     def _to_dict_list(cursor, rows):
@@ -27,6 +74,7 @@ class SalesModel:
         return dict(zip(columns, row))
 
     @staticmethod
+    @read_only(max_staleness=60)
     def get_monthly_kpi():
         """取得本月核心 KPI 與 MoM"""
         with get_db_connection() as conn:
@@ -65,6 +113,7 @@ class SalesModel:
                 }
 
     @staticmethod
+    @read_only(max_staleness=60)
     def get_purchase_interval():
         """計算平均購買間隔"""
         with get_db_connection() as conn:
@@ -89,8 +138,11 @@ class SalesModel:
                 return round(float(avg_days), 1) if avg_days else 0
 
     @staticmethod
+    @read_only(max_staleness=60)
     def get_acquisition_rate():
         """計算本月顧客獲取率"""
+        # 本月的半開區間，讓 reserved_time 可以走索引 (取代 DATE_FORMAT 比對)
+        month_start, month_end = month_range()
         with get_db_connection() as conn:
             with conn.cursor() as cursor:
                 sql = """
@@ -101,17 +153,17 @@ class SalesModel:
                         WHERE status = '已完成'
                         GROUP BY customer_id
                     ) as first_buys
-                    WHERE DATE_FORMAT(first_buy, '%Y-%m') = DATE_FORMAT(NOW(), '%Y-%m')
+                    WHERE first_buy >= %s AND first_buy < %s
                 """
-                cursor.execute(sql)
+                cursor.execute(sql, (month_start, month_end))
                 new_paying_res = SalesModel._to_dict(cursor, cursor.fetchone())
                 new_paying = new_paying_res.get('new_paying_customers', 0) if new_paying_res else 0
                 
                 cursor.execute("""
                     SELECT COUNT(DISTINCT customer_id) as total 
                     FROM reservation 
-                    WHERE status='已完成' AND DATE_FORMAT(reserved_time, '%Y-%m') = DATE_FORMAT(NOW(), '%Y-%m')
-                """)
+                    WHERE status='已完成' AND reserved_time >= %s AND reserved_time < %s
+                """, (month_start, month_end))
                 total_res = SalesModel._to_dict(cursor, cursor.fetchone())
                 total_active = total_res.get('total', 0) if total_res else 0
                 
@@ -119,17 +171,19 @@ class SalesModel:
                 return round((new_paying / total_active) * 100, 2)
 
     @staticmethod
+    @read_only(max_staleness=60)
     def get_retention_rate():
         """計算留存率"""
+        last_month_start, last_month_end = month_range(offset=-1)
+        this_month_start, _ = month_range()
         with get_db_connection() as conn:
             with conn.cursor() as cursor:
                 sql_last_month = """
                     SELECT DISTINCT customer_id FROM reservation 
                     WHERE status='已完成' 
-                    AND reserved_time BETWEEN DATE_FORMAT(NOW() - INTERVAL 1 MONTH, '%Y-%m-01') 
-                                      AND LAST_DAY(NOW() - INTERVAL 1 MONTH)
+                    AND reserved_time >= %s AND reserved_time < %s
                 """
-                cursor.execute(sql_last_month)
+                cursor.execute(sql_last_month, (last_month_start, last_month_end))
                 
                 raw_rows = cursor.fetchall()
                 if not raw_rows:
@@ -140,21 +194,22 @@ class SalesModel:
                 else:
                     last_month_ids = [row[0] for row in raw_rows]
 
-                format_ids = ','.join(map(str, last_month_ids))
+                placeholders = ','.join(['%s'] * len(last_month_ids))
                 sql_this_month = f"""
                     SELECT COUNT(DISTINCT customer_id) as retained
                     FROM reservation
                     WHERE status='已完成'
-                    AND reserved_time >= DATE_FORMAT(NOW(), '%Y-%m-01')
-                    AND customer_id IN ({format_ids})
+                    AND reserved_time >= %s
+                    AND customer_id IN ({placeholders})
                 """
-                cursor.execute(sql_this_month)
+                cursor.execute(sql_this_month, (this_month_start, *last_month_ids))
                 retained_res = SalesModel._to_dict(cursor, cursor.fetchone())
                 retained_count = retained_res.get('retained', 0) if retained_res else 0
                 
                 return round((retained_count / len(last_month_ids)) * 100, 2)
 
     @staticmethod
+    @read_only(max_staleness=60)
     def get_monthly_trend():
         """取得趨勢圖表資料"""
         with get_db_connection() as conn:
@@ -177,4 +232,214 @@ class SalesModel:
                 for item in data:
                     item['revenue'] = int(item.get('revenue') or 0)
                 
-                return data
\ No newline at end of file
+                return data
+
+    @staticmethod
+    def _dashboard_window(as_of):
+        """as_of -> 查詢區間 {'end': as_of 隔天 00:00, 'this_start': 本月初, 'last_start': 上月初, 'trend_start': 趨勢起點}"""
+        _, end = day_range(as_of or datetime.now())
+        this_start, _ = month_range(end - timedelta(days=1))
+        return {
+            'end': end,
+            'this_start': this_start,
+            'last_start': month_range(this_start, offset=-1)[0],
+            'trend_start': month_range(this_start, offset=-SalesModel.TREND_MONTHS)[0],
+        }
+
+    @staticmethod
+    def _build_dashboard(window, months, customers):
+        """
+        彙整成 /api/manager/analysis/sales 的格式：{'as_of', 'kpi', 'metrics', 'trend'}
+        months: [{'month', 'revenue', 'order_count'}, ...]
+        customers: new_customers / active_customers / last_active_customers / retained_customers / span_days / intervals
+        """
+        months = sorted(months, key=lambda row: row['month'])
+        revenue_by_month = {row['month']: float(row['revenue'] or 0) for row in months}
+
+        current_rev = revenue_by_month.get(window['this_start'].strftime('%Y-%m'), 0)
+        last_rev = revenue_by_month.get(window['last_start'].strftime('%Y-%m'), 0)
+        growth_rate = ((current_rev - last_rev) / last_rev) * 100 if last_rev > 0 else 0
+
+        active = int(customers.get('active_customers') or 0)
+        last_active = int(customers.get('last_active_customers') or 0)
+        new_customers = int(customers.get('new_customers') or 0)
+        retained = int(customers.get('retained_customers') or 0)
+        intervals = int(customers.get('intervals') or 0)
+        span_days = float(customers.get('span_days') or 0)
+
+        acquisition_rate = round((new_customers / active) * 100, 2) if active else 0
+        retention_rate = round((retained / last_active) * 100, 2) if last_active else 0
+        return {
+            'as_of': (window['end'] - timedelta(days=1)).date().isoformat(),
+            'kpi': {
+                'current_revenue': int(current_rev),
+                'last_revenue': int(last_rev),
+                'growth_rate': round(growth_rate, 2),
+                'active_customers': active
+            },
+            'metrics': {
+                'avg_interval_days': round(span_days / intervals, 1) if intervals else 0,
+                'acquisition_rate': acquisition_rate,
+                'retention_rate': retention_rate,
+                'churn_rate': round(100 - retention_rate, 2)
+            },
+            'trend': [
+                {'month': row['month'], 'revenue': int(row['revenue'] or 0), 'order_count': int(row['order_count'])}
+                for row in months
+            ]
+        }
+
+    @staticmethod
+    @read_only(max_staleness=60)
+    def get_dashboard_live(as_of=None):
+        """
+        直接從 reservation 計算儀表板 (一次查詢，DASHBOARD_SQL)，不經過彙總表
+        用來驗證 sales_daily，或彙總表還沒建立時使用；參數與回傳同 get_dashboard
+        """
+        window = SalesModel._dashboard_window(as_of)
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(SalesModel.DASHBOARD_SQL, window)
+                rows = SalesModel._to_dict_list(cursor, cursor.fetchall())
+        return SalesModel._build_dashboard(
+            window,
+            [row for row in rows if row['kind'] == 'month'],
+            next((row for row in rows if row['kind'] == 'customers'), {})
+        )
+
+    # 彙總表版本：營收、訂單、新客、購買間隔都來自 sales_daily (與天數成正比)
+    ROLLUP_DASHBOARD_SQL = """
+        SELECT
+            'month' AS kind,
+            DATE_FORMAT(sale_date, '%%Y-%%m') AS month,
+            SUM(revenue) AS revenue,
+            SUM(completed_orders) AS order_count,
+            SUM(new_customers) AS new_customers,
+            NULL AS repeat_orders,
+            NULL AS gap_days
+        FROM sales_daily
+        WHERE sale_date >= %(trend_start)s AND sale_date < %(end)s
+        GROUP BY month
+        UNION ALL
+        SELECT 'interval', NULL, NULL, NULL, NULL, SUM(repeat_orders), SUM(gap_days)
+        FROM sales_daily
+        WHERE sale_date < %(end)s
+    """
+
+    # 不重複顧客數無法從每日彙總相加，只查本月與上月 (覆蓋索引的區間掃描，與歷史資料量無關)
+    ACTIVE_CUSTOMERS_SQL = """
+        SELECT
+            SUM(this_month) AS active_customers,
+            SUM(last_month) AS last_active_customers,
+            SUM(this_month AND last_month) AS retained_customers
+        FROM (
+            SELECT
+                customer_id,
+                MAX(reserved_time >= %(this_start)s) AS this_month,
+                MAX(reserved_time < %(this_start)s) AS last_month
+            FROM reservation
+            WHERE status = '已完成' AND reserved_time >= %(last_start)s AND reserved_time < %(end)s
+            GROUP BY customer_id
+        ) AS active
+    """
+
+    @staticmethod
+    @read_only(max_staleness=60)
+    def get_dashboard(as_of=None):
+        """
+        銷售儀表板的所有數據 (兩次查詢：sales_daily 彙總 + 兩個月內的不重複顧客)
+        as_of: 以這一天結束時的資料計算 (date / 'YYYY-MM-DD'，預設今天)，同一個 as_of 的結果可重現
+        本月 = as_of 所在月份 (到 as_of 當天為止)，上月 = 前一個月
+        彙總表由背景工作更新，最近的狀態變更可能稍晚反映 (見 SalesRollup.status)
+        回傳格式與 /api/manager/analysis/sales 相同：{'as_of', 'kpi', 'metrics', 'trend'}
+        """
+        window = SalesModel._dashboard_window(as_of)
+        params = {**window, 'end': window['end'].date(), 'trend_start': window['trend_start'].date()}
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(SalesModel.ROLLUP_DASHBOARD_SQL, params)
+                rows = SalesModel._to_dict_list(cursor, cursor.fetchall())
+                cursor.execute(SalesModel.ACTIVE_CUSTOMERS_SQL, window)
+                customers = SalesModel._to_dict(cursor, cursor.fetchone()) or {}
+
+        months = [row for row in rows if row['kind'] == 'month']
+        interval = next((row for row in rows if row['kind'] == 'interval'), {})
+        this_month = window['this_start'].strftime('%Y-%m')
+        return SalesModel._build_dashboard(window, months, {
+            **customers,
+            'new_customers': sum(row['new_customers'] or 0 for row in months if row['month'] == this_month),
+            'span_days': interval.get('gap_days'),
+            'intervals': interval.get('repeat_orders'),
+        })
+
+    # 區間報表可依這些欄位分組
+    RANGE_GROUPS = {
+        'day': ("DATE_FORMAT(d.sale_date, '%%Y-%%m-%%d')", None),
+        'month': ("DATE_FORMAT(d.sale_date, '%%Y-%%m')", None),
+        'designer': ('d.designer_id', 'LEFT JOIN designer g ON g.designer_id = d.designer_id'),
+        'service': ('d.service_id', 'LEFT JOIN service g ON g.service_id = d.service_id'),
+    }
+
+    @staticmethod
+    @read_only(max_staleness=60)
+    def get_range_kpi(start_date, end_date, designer_id=None, service_id=None, group_by=None):
+        """
+        任意日期區間 (含 end_date) 的銷售指標，只讀 sales_daily
+        可篩選設計師 / 服務，group_by: day / month / designer / service
+        customer_visits 為每天不重複顧客數的加總 (同一位顧客在不同天來店會重複計算)
+        回傳 {'totals': {...}, 'groups': [{'key', 'name', ...}, ...]}
+        """
+        conditions = ['d.sale_date >= %s', 'd.sale_date <= %s']
+        params = [to_date(start_date), to_date(end_date)]
+        if designer_id is not None:
+            conditions.append('d.designer_id = %s')
+            params.append(designer_id)
+        if service_id is not None:
+            conditions.append('d.service_id = %s')
+            params.append(service_id)
+        where = ' AND '.join(conditions)
+        metrics = """
+            COALESCE(SUM(d.revenue), 0) AS revenue,
+            COALESCE(SUM(d.completed_orders), 0) AS completed_orders,
+            COALESCE(SUM(d.new_customers), 0) AS new_customers,
+            COALESCE(SUM(d.customers), 0) AS customer_visits,
+            COALESCE(SUM(d.repeat_orders), 0) AS repeat_orders,
+            COALESCE(SUM(d.gap_days), 0) AS gap_days
+        """
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"SELECT {metrics} FROM sales_daily d WHERE {where}", tuple(params))
+                totals = SalesModel._to_dict(cursor, cursor.fetchone())
+                groups = []
+                if group_by:
+                    key, join = SalesModel.RANGE_GROUPS[group_by]
+                    name = 'MAX(g.name)' if join else 'NULL'
+                    cursor.execute(f"""
+                        SELECT {key} AS `key`, {name} AS name, {metrics}
+                        FROM sales_daily d
+                        {join or ''}
+                        WHERE {where}
+                        GROUP BY {key}
+                        ORDER BY {key}
+                    """, tuple(params))
+                    groups = SalesModel._to_dict_list(cursor, cursor.fetchall())
+        return {
+            'totals': SalesModel._range_metrics(totals),
+            'groups': [
+                {'key': row['key'], 'name': row['name'], **SalesModel._range_metrics(row)} for row in groups
+            ]
+        }
+
+    @staticmethod
+    def _range_metrics(row):
+        revenue = float(row['revenue'] or 0)
+        orders = int(row['completed_orders'] or 0)
+        repeat_orders = int(row['repeat_orders'] or 0)
+        return {
+            'revenue': int(revenue),
+            'completed_orders': orders,
+            'new_customers': int(row['new_customers'] or 0),
+            'customer_visits': int(row['customer_visits'] or 0),
+            'avg_order_value': round(revenue / orders, 2) if orders else 0,
+            'avg_interval_days': round(float(row['gap_days'] or 0) / repeat_orders, 1) if repeat_orders else 0,
+        }
@@ -0,0 +1,358 @@
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from config.database import get_db_connection
+from utils.time_range import day_range, to_date
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 flock，每個 process 都會執行
+    fcntl = None
+
+# 背景彙總的間隔 (秒)，0 表示不在 web process 內執行 (改用 manage.py refresh-sales-rollups 排程)
+SALES_ROLLUP_INTERVAL = float(os.getenv('SALES_ROLLUP_INTERVAL', 30))
+# 每次最多處理幾天
+SALES_ROLLUP_BATCH_DAYS = int(os.getenv('SALES_ROLLUP_BATCH_DAYS', 31))
+# 同一台機器上只有拿到這個檔案鎖的 worker 執行背景彙總
+SALES_ROLLUP_LOCK_PATH = os.getenv('SALES_ROLLUP_LOCK_PATH') or os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'ochi_salon_sales_rollup.lock'
+)
+
+
+class SalesRollup:
+    """
+    每日銷售彙總 (sales_daily)：每天 x 設計師 x 服務一列
+    - revenue / completed_orders / customers (當天不重複顧客)
+    - new_customers：第一次完成消費的顧客 (算在他第一筆已完成預約的那一列)
+    - repeat_orders / gap_days：回訪的訂單數與距離上一次完成的天數總和 (平均購買間隔 = gap_days / repeat_orders)
+    預約進出「已完成」時在同一個交易內把受影響的日期記到 sales_dirty_day，
+    背景工作再依序重算這些日期 (refresh_pending)，報表只讀彙總表，成本與天數成正比而不是預約筆數
+    """
+
+    STATE_NAME = 'sales_daily'
+
+    INSERT_SQL = """
+        INSERT INTO sales_daily
+        (sale_date, designer_id, service_id, revenue, completed_orders, customers,
+         new_customers, repeat_orders, gap_days)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """
+
+    # 全量重建時每批寫入的筆數
+    REBUILD_BATCH_SIZE = 1000
+
+    @staticmethod
+    def _day_spans(days):
+        """日期 -> 合併連續日期後的半開區間 [(開始, 結束), ...]"""
+        spans = []
+        for day in sorted(set(days)):
+            start, end = day_range(day)
+            if spans and spans[-1][1] == start:
+                spans[-1] = (spans[-1][0], end)
+            else:
+                spans.append((start, end))
+        return spans
+
+    @staticmethod
+    def mark_changed(cursor, rows):
+        """
+        預約進出「已完成」後呼叫 (同一個交易內，需先 CustomerStats.lock 鎖住這些顧客)
+        rows: 狀態改變的預約列 (需有 customer_id, reserved_time)
+        受影響的日期：預約當天，以及該顧客在這筆之後的下一次完成 (他的「上一次」或「是否為新客」會跟著改變)
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        customer_ids = sorted({row['customer_id'] for row in rows})
+        placeholders = ', '.join(['%s'] * len(customer_ids))
+        cursor.execute(f"""
+            SELECT customer_id, reserved_time FROM reservation
+            WHERE customer_id IN ({placeholders}) AND status = '已完成'
+            FOR UPDATE
+        """, tuple(customer_ids))
+        visits = {}
+        for visit in cursor.fetchall():
+            visits.setdefault(visit['customer_id'], []).append(visit['reserved_time'])
+
+        days = set()
+        for row in rows:
+            days.add(to_date(row['reserved_time']))
+            later = [visit for visit in visits.get(row['customer_id'], []) if visit > row['reserved_time']]
+            if later:
+                days.add(to_date(min(later)))
+        SalesRollup.mark_dirty(cursor, days)
+
+    @staticmethod
+    def mark_dirty(cursor, days):
+        """把日期加入待重算佇列 (version 遞增，處理中的工作不會誤刪之後的標記)"""
+        days = sorted(set(days))
+        if not days:
+            return
+        cursor.executemany("""
+            INSERT INTO sales_dirty_day (sale_date, version, marked_at) VALUES (%s, 1, NOW(6))
+            ON DUPLICATE KEY UPDATE version = version + 1, marked_at = NOW(6)
+        """, [(day,) for day in days])
+
+    @staticmethod
+    def _aggregate(cursor, days=None):
+        """
+        從 reservation 計算彙總列 (days 為 None 時計算全部)
+        只讀當天有完成消費的顧客，以及他們在這之前的紀錄 (用來判斷新客與購買間隔)
+        """
+        params = []
+        customer_filter = day_filter = ''
+        if days is not None:
+            spans = SalesRollup._day_spans(days)
+            ranges = ' OR '.join(['(reserved_time >= %s AND reserved_time < %s)'] * len(spans))
+            span_params = [value for span in spans for value in span]
+            customer_filter = f"""
+                AND reserved_time < %s
+                AND customer_id IN (
+                    SELECT customer_id FROM reservation WHERE status = '已完成' AND ({ranges})
+                )
+            """
+            day_filter = f"WHERE {ranges}"
+            params = [spans[-1][1], *span_params, *span_params]
+        cursor.execute(f"""
+            WITH visits AS (
+                SELECT
+                    customer_id, designer_id, service_id, reserved_time, final_price,
+                    LAG(reserved_time) OVER (
+                        PARTITION BY customer_id ORDER BY reserved_time, reservation_id
+                    ) AS prev_time
+                FROM reservation
+                WHERE status = '已完成' {customer_filter}
+            )
+            SELECT
+                DATE(reserved_time) AS sale_date,
+                designer_id,
+                service_id,
+                COALESCE(SUM(final_price), 0) AS revenue,
+                COUNT(*) AS completed_orders,
+                COUNT(DISTINCT customer_id) AS customers,
+                SUM(prev_time IS NULL) AS new_customers,
+                SUM(prev_time IS NOT NULL) AS repeat_orders,
+                COALESCE(SUM(DATEDIFF(reserved_time, prev_time)), 0) AS gap_days
+            FROM visits
+            {day_filter}
+            GROUP BY sale_date, designer_id, service_id
+        """, tuple(params))
+        return [
+            (row['sale_date'], row['designer_id'], row['service_id'], row['revenue'], row['completed_orders'],
+             row['customers'], row['new_customers'], row['repeat_orders'], row['gap_days'])
+            for row in cursor.fetchall()
+        ]
+
+    @staticmethod
+    def _lock_state(cursor):
+        """
+        鎖定狀態列：同一時間只有一個工作在寫 sales_daily (多個 worker 的背景執行緒依序執行)
+        每次寫入都會遞增 run_id；鎖定後讀到的最新值與交易快照不同，代表快照早於上一個工作的 commit
+        (TiDB 的快照在交易開始時就決定)，用這個快照重算會蓋掉較新的結果，回傳 False 讓呼叫端重試
+        """
+        cursor.execute(
+            "SELECT run_id FROM sales_rollup_state WHERE name = %s FOR UPDATE", (SalesRollup.STATE_NAME,)
+        )
+        locked = cursor.fetchone()
+        cursor.execute("SELECT run_id FROM sales_rollup_state WHERE name = %s", (SalesRollup.STATE_NAME,))
+        snapshot = cursor.fetchone()
+        if not locked or not snapshot:
+            raise RuntimeError('找不到 sales_rollup_state，請先執行 python manage.py migrate')
+        return locked['run_id'] == snapshot['run_id']
+
+    @staticmethod
+    def _db_now(cursor):
+        """資料庫的目前時間 (與 marked_at 同一個時鐘)"""
+        cursor.execute("SELECT NOW(6) AS now")
+        return cursor.fetchone()['now']
+
+    @staticmethod
+    def _save(cursor, days, rows):
+        """以新的彙總列取代這些日期 (days 為 None 時取代全部)"""
+        if days is None:
+            cursor.execute("DELETE FROM sales_daily")
+        elif days:
+            placeholders = ', '.join(['%s'] * len(days))
+            cursor.execute(f"DELETE FROM sales_daily WHERE sale_date IN ({placeholders})", tuple(days))
+        for index in range(0, len(rows), SalesRollup.REBUILD_BATCH_SIZE):
+            cursor.executemany(SalesRollup.INSERT_SQL, rows[index:index + SalesRollup.REBUILD_BATCH_SIZE])
+
+    @staticmethod
+    def _finish(cursor, dirty, started_at):
+        """
+        移除已處理的標記並更新水位
+        只刪除 version 與讀到時相同的標記：處理期間又被標記的日期會留到下一輪
+        水位 = 最早仍待處理的標記時間；佇列清空時為這一輪開始的時間
+        """
+        if dirty:
+            cursor.executemany(
+                "DELETE FROM sales_dirty_day WHERE sale_date = %s AND version = %s",
+                [(row['sale_date'], row['version']) for row in dirty]
+            )
+        cursor.execute("SELECT MIN(marked_at) AS pending_since FROM sales_dirty_day")
+        pending = cursor.fetchone()
+        watermark = (pending and pending['pending_since']) or started_at
+        cursor.execute(
+            "UPDATE sales_rollup_state SET watermark = %s, refreshed_at = NOW(), run_id = run_id + 1 WHERE name = %s",
+            (watermark, SalesRollup.STATE_NAME)
+        )
+        return watermark
+
+    @staticmethod
+    def refresh_pending(cursor, limit=SALES_ROLLUP_BATCH_DAYS):
+        """
+        重算待處理的日期 (最多 limit 天)
+        回傳 {'days': 重算的天數, 'watermark': 水位}；快照過舊時回傳 retry: True，需以新的交易重試
+        """
+        if not SalesRollup._lock_state(cursor):
+            return {'days': 0, 'watermark': None, 'retry': True}
+        started_at = SalesRollup._db_now(cursor)
+        cursor.execute(
+            "SELECT sale_date, version FROM sales_dirty_day ORDER BY sale_date LIMIT %s", (limit,)
+        )
+        dirty = cursor.fetchall()
+        if dirty:
+            days = [row['sale_date'] for row in dirty]
+            SalesRollup._save(cursor, days, SalesRollup._aggregate(cursor, days))
+        watermark = SalesRollup._finish(cursor, dirty, started_at)
+        return {'days': len(dirty), 'watermark': watermark}
+
+    @staticmethod
+    def refresh_range(cursor, start_date, end_date):
+        """重算指定日期區間 (含 end_date)，例如直接修改過資料庫之後"""
+        start, end = to_date(start_date), to_date(end_date)
+        days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+        if not SalesRollup._lock_state(cursor):
+            raise RuntimeError('另一個彙總工作剛完成，請重新執行')
+        SalesRollup._save(cursor, days, SalesRollup._aggregate(cursor, days))
+        cursor.execute(
+            "UPDATE sales_rollup_state SET run_id = run_id + 1 WHERE name = %s", (SalesRollup.STATE_NAME,)
+        )
+        return {'days': len(days)}
+
+    @staticmethod
+    def rebuild(cursor):
+        """
+        從 reservation 表全量重建 (初次建立、修正不一致)
+        回傳 {'rows': 彙總列數, 'watermark': 水位}
+        """
+        if not SalesRollup._lock_state(cursor):
+            raise RuntimeError('另一個彙總工作剛完成，請重新執行')
+        started_at = SalesRollup._db_now(cursor)
+        cursor.execute("SELECT sale_date, version FROM sales_dirty_day")
+        dirty = cursor.fetchall()
+        rows = SalesRollup._aggregate(cursor)
+        SalesRollup._save(cursor, None, rows)
+        watermark = SalesRollup._finish(cursor, dirty, started_at)
+        return {'rows': len(rows), 'watermark': watermark}
+
+    @staticmethod
+    def is_installed():
+        """彙總用的資料表是否已建立 (遷移 0007)"""
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT COUNT(*) AS tables FROM information_schema.tables
+                    WHERE table_schema = DATABASE()
+                    AND table_name IN ('sales_daily', 'sales_dirty_day', 'sales_rollup_state')
+                """)
+                return cursor.fetchone()['tables'] == 3
+
+    @staticmethod
+    def status():
+        """{'watermark': 此時間以前的異動都已彙總, 'pending_days': 待重算天數}"""
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT s.watermark, (SELECT COUNT(*) FROM sales_dirty_day) AS pending_days
+                    FROM sales_rollup_state s
+                    WHERE s.name = %s
+                """, (SalesRollup.STATE_NAME,))
+                row = cursor.fetchone()
+        return {
+            'watermark': row['watermark'].strftime('%Y-%m-%d %H:%M:%S') if row and row['watermark'] else None,
+            'pending_days': row['pending_days'] if row else 0,
+        }
+
+
+class RollupRefresher:
+    """
+    背景執行緒定期執行 SalesRollup.refresh_pending；佇列是空的時只做一次計數查詢
+    - 每個 worker 都會啟動執行緒，但同一台機器上只有拿到檔案鎖 (SALES_ROLLUP_LOCK_PATH) 的 worker 執行，
+      其他 worker 每個間隔嘗試一次，原本的 worker 結束後接手
+    - 多台機器之間透過 sales_rollup_state 的列鎖依序執行，不會互相覆蓋
+    - 尚未套用遷移 0007 時只提示一次並停止
+    """
+
+    def __init__(self, interval=30, lock_path=SALES_ROLLUP_LOCK_PATH):
+        self.interval = interval
+        self.lock_path = lock_path
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._lock_fd = None
+
+    def ensure_started(self):
+        """啟動背景執行緒；fork 後 (gunicorn --preload) 在子程序重新啟動"""
+        if self.interval <= 0:
+            return
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._lock_fd = None  # fork 前的檔案鎖屬於父程序
+            self._thread = threading.Thread(target=self._run, name='sales-rollup', daemon=True)
+            self._thread.start()
+
+    def _acquire_leader(self):
+        """嘗試取得檔案鎖 (不等待)，取得後持有到 process 結束"""
+        if fcntl is None or self._lock_fd is not None:
+            return True
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    def _run(self):
+        installed = False
+        while True:
+            try:
+                if self._acquire_leader():
+                    if not installed:
+                        if not SalesRollup.is_installed():
+                            # 保留檔案鎖，其他 worker 也不會重複提示
+                            print("⚠️ 尚未建立銷售彙總資料表，請執行 python manage.py migrate；背景彙總已停止")
+                            return
+                        installed = True
+                    self.run_once()
+            except Exception as e:
+                print(f"⚠️ 銷售彙總更新失敗: {str(e)}")
+            time.sleep(self.interval)
+
+    def run_once(self):
+        """處理到佇列清空為止，回傳重算的天數"""
+        total = 0
+        while True:
+            # 先用另一個交易檢查有沒有待處理的日期，重算的交易要從鎖定狀態列開始 (見 _lock_state)
+            with get_db_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT COUNT(*) AS pending FROM sales_dirty_day")
+                    if not cursor.fetchone()['pending']:
+                        return total
+            with get_db_connection() as conn:
+                with conn.cursor() as cursor:
+                    result = SalesRollup.refresh_pending(cursor)
+            total += result['days']
+            if result['days'] == 0 and not result.get('retry'):
+                return total
+
+
+rollup_refresher = RollupRefresher(interval=SALES_ROLLUP_INTERVAL)
@@ -1,7 +1,9 @@
 from config.database import get_db_connection
+from utils.cache import cached
 
 class Service:
     @staticmethod
+    @cached(ttl=600, tags=('services',))
     def get_all():
         """取得所有上架的服務預設值"""
         with get_db_connection() as conn:
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from models.inventory import Product
 from utils.cloudinary_helper import upload_image
+from utils.streaming import wants_stream, stream_rows
 
 inventory_bp = Blueprint('inventory', __name__)
 
@@ -144,7 +145,12 @@ def add_transaction():
 
 @inventory_bp.route('/api/inventory/products/<int:product_id>/transactions', methods=['GET'])
 def get_product_transactions(product_id):
-    """取得產品交易紀錄"""
+    """
+    取得產品交易紀錄
+    支援串流：?stream=1 或 Accept: application/x-ndjson
+    """
+    if wants_stream():
+        return stream_rows(Product.iter_transactions(product_id))
     try:
         transactions = Product.get_transactions(product_id)
         return jsonify(transactions), 200
@@ -1,7 +1,15 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 from models.analysis import AnalysisService
+from models.calendar import Calendar
 from models.sales import SalesModel
+from models.sales_rollup import SalesRollup
+from utils.scheduling import format_minutes, parse_minutes
+from utils.time_range import to_date
+from datetime import datetime
 from utils.auth import token_required, manager_required
+from utils.pagination import RFM_PAGE_ARGS, parse_rfm_args, wants_page
+from utils.rfm import LEGACY_THRESHOLDS, RFM_THRESHOLDS, THRESHOLD_MODES, iter_scored, score_rows, thresholds_for
+from utils.streaming import wants_stream, stream_rows
 
 manager_bp = Blueprint('manager', __name__, url_prefix='/api/manager')
 
@@ -9,63 +17,278 @@ manager_bp = Blueprint('manager', __name__, url_prefix='/api/manager')
 @token_required
 @manager_required
 def get_rfm_analysis():
-    """取得 RFM 顧客分析數據"""
-    raw_data = AnalysisService.get_rfm_data()
-    
-    analyzed_data = []
-    
+    """
+    取得 RFM 顧客分析數據
+    支援串流：?stream=1 (summary 附在最後) 或 Accept: application/x-ndjson (只有顧客列)
+    ?thresholds=legacy (固定門檻，預設見 RFM_THRESHOLDS) 或 quantile (依目前分布的五分位數)
+    帶篩選或分頁參數時回傳分頁格式 (見 parse_rfm_args)：
+    ?segment=沈睡顧客&r_max=2&sort=recency_days&order=asc&limit=20&cursor=...
+    """
+    mode = request.args.get('thresholds', RFM_THRESHOLDS)
+    if mode not in THRESHOLD_MODES:
+        return jsonify({'error': f"thresholds 需為 {' / '.join(THRESHOLD_MODES)}"}), 400
+
+    if wants_page(RFM_PAGE_ARGS):
+        try:
+            page_args = parse_rfm_args()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(AnalysisService.page_rfm(mode=mode, **page_args))
+
     # 用來計算儀表板總數
     summary = {
         'total_revenue': 0,
-        'total_customers': len(raw_data),
+        'total_customers': 0,
         'active_customers': 0, # R <= 90
         'churn_risk': 0        # R > 180 & F >= 3
     }
 
-    for row in raw_data:
-        # 進行分群運算
-        segment_info = AnalysisService.segment_customer(
-            row['recency_days'], 
-            row['frequency'], 
-            row['monetary']
+    def tally(rows):
+        for row in rows:
+            # 累加統計數據
+            summary['total_customers'] += 1
+            summary['total_revenue'] += row['monetary']
+            if row['recency_days'] <= 90:
+                summary['active_customers'] += 1
+            if row['recency_days'] > 180 and row['frequency'] >= 3:
+                summary['churn_risk'] += 1
+            yield row
+
+    if wants_stream():
+        # 串流時拿不到全部資料，五分位數門檻先以不含聯絡資料的輕量查詢 (有快取) 算好
+        thresholds = LEGACY_THRESHOLDS
+        if mode == 'quantile':
+            metrics = AnalysisService.get_rfm_metrics()
+            thresholds = thresholds_for(mode, metrics['recency_days'], metrics['frequency'], metrics['monetary'])
+        return stream_rows(
+            iter_scored(tally(AnalysisService.iter_rfm_data()), thresholds),
+            key='customers',
+            trailer=lambda: {'summary': summary, 'thresholds': thresholds}
         )
-        
-        # 合併原始資料與分析結果
-        customer_data = {**row, **segment_info}
-        analyzed_data.append(customer_data)
-
-        # 累加統計數據
-        summary['total_revenue'] += row['monetary']
-        if row['recency_days'] <= 90:
-            summary['active_customers'] += 1
-        if row['recency_days'] > 180 and row['frequency'] >= 3:
-            summary['churn_risk'] += 1
+
+    rows = list(tally(AnalysisService.get_rfm_data()))
+    thresholds = thresholds_for(
+        mode,
+        [row['recency_days'] for row in rows],
+        [row['frequency'] for row in rows],
+        [row['monetary'] for row in rows]
+    )
+
+    # 整批評分，並合併原始資料與分析結果
+    analyzed_data = score_rows(rows, thresholds)
 
     return jsonify({
         'summary': summary,
+        'thresholds': thresholds,
         'customers': analyzed_data
     })
 
+@manager_bp.route('/analysis/rfm/summary', methods=['GET'])
+@token_required
+@manager_required
+def get_rfm_summary():
+    """
+    RFM 儀表板摘要 (總數、各分群人數、門檻)，不含顧客列表
+    顧客列表再依需要以 /analysis/rfm 的篩選與分頁參數查詢
+    """
+    mode = request.args.get('thresholds', RFM_THRESHOLDS)
+    if mode not in THRESHOLD_MODES:
+        return jsonify({'error': f"thresholds 需為 {' / '.join(THRESHOLD_MODES)}"}), 400
+    return jsonify(AnalysisService.get_rfm_summary(mode))
+
 @manager_bp.route('/analysis/sales', methods=['GET'])
 @token_required
 @manager_required
 def get_sales_analysis():
-    """取得銷售儀表板所需的所有數據"""
-    
-    kpi = SalesModel.get_monthly_kpi()
-    avg_interval = SalesModel.get_purchase_interval()
-    acquisition_rate = SalesModel.get_acquisition_rate()
-    retention_rate = SalesModel.get_retention_rate()
-    churn_rate = 100 - retention_rate
-    trend = SalesModel.get_monthly_trend()
-    
+    """
+    取得銷售儀表板所需的所有數據 (讀每日彙總表，見 SalesModel.get_dashboard)
+    ?as_of=YYYY-MM-DD 以指定日期結束時的資料計算，預設今天
+    rollup: 彙總表的水位與待重算天數 (水位之後的異動可能還沒反映)
+    """
+    as_of = request.args.get('as_of')
+    try:
+        as_of = to_date(as_of) if as_of else None
+    except ValueError:
+        return jsonify({'error': '日期格式錯誤'}), 400
+    return jsonify({**SalesModel.get_dashboard(as_of), 'rollup': SalesRollup.status()})
+
+
+@manager_bp.route('/analysis/sales/range', methods=['GET'])
+@token_required
+@manager_required
+def get_sales_range():
+    """
+    任意日期區間的銷售指標 (只讀每日彙總表)
+    ?from=YYYY-MM-DD&to=YYYY-MM-DD (含) 必填，可選 designer_id / service_id
+    ?group_by=day / month / designer / service 另外回傳各組的指標
+    """
+    try:
+        start = to_date(request.args['from'])
+        end = to_date(request.args['to'])
+    except KeyError:
+        return jsonify({'error': '缺少 from 或 to'}), 400
+    except ValueError:
+        return jsonify({'error': '日期格式錯誤'}), 400
+    if start > end:
+        return jsonify({'error': 'from 不可晚於 to'}), 400
+
+    group_by = request.args.get('group_by')
+    if group_by and group_by not in SalesModel.RANGE_GROUPS:
+        return jsonify({'error': f"group_by 需為 {' / '.join(SalesModel.RANGE_GROUPS)}"}), 400
+    designer_id = request.args.get('designer_id', type=int)
+    service_id = request.args.get('service_id', type=int)
+
+    result = SalesModel.get_range_kpi(start, end, designer_id, service_id, group_by)
     return jsonify({
-        'kpi': kpi,
-        'metrics': {
-            'avg_interval_days': avg_interval,
-            'acquisition_rate': acquisition_rate,
-            'retention_rate': retention_rate,
-            'churn_rate': round(churn_rate, 2)
-        },
-        'trend': trend
-    })
\ No newline at end of file
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        **result,
+        'rollup': SalesRollup.status()
+    })
+
+
+def _parse_windows(raw):
+    """
+    [['11:00', '14:00'], ['15:00', '19:00']] -> 正規化後的 [('11:00', '14:00'), ...]
+    格式錯誤、開始不早於結束或時段重疊時丟出 ValueError
+    """
+    if not isinstance(raw, list):
+        raise ValueError('windows 必須是列表')
+    windows = []
+    for item in raw:
+        if not isinstance(item, (list, tuple)) or len(item) != 2:
+            raise ValueError('每個時段需為 [開始, 結束]')
+        try:
+            start, end = parse_minutes(item[0]), parse_minutes(item[1])
+        except (AttributeError, ValueError):
+            raise ValueError(f'時間格式錯誤: {item}')
+        if not 0 <= start < end <= 24 * 60:
+            raise ValueError(f'時段錯誤: {item[0]} - {item[1]}')
+        windows.append((start, end))
+    windows.sort()
+    for (_, prev_end), (next_start, _) in zip(windows, windows[1:]):
+        if next_start < prev_end:
+            raise ValueError('時段不可重疊')
+    return [(format_minutes(start), format_minutes(end)) for start, end in windows]
+
+def _parse_designer_id(value):
+    """null / 未提供 -> None (全店)，其他需為正整數 (數字或數字字串)，否則丟出 ValueError"""
+    if value in (None, ''):
+        return None
+    if isinstance(value, bool) or not str(value).isdigit():
+        raise ValueError('designer_id 需為設計師 ID (整數)')
+    return int(value)
+
+@manager_bp.route('/calendar', methods=['GET'])
+@token_required
+@manager_required
+def get_calendar():
+    """取得營業時間設定 (每週時段、今天以後的特定日期設定與封鎖時段)"""
+    return jsonify(Calendar.get_settings())
+
+@manager_bp.route('/calendar/hours', methods=['PUT'])
+@token_required
+@manager_required
+def set_weekly_hours():
+    """
+    設定每週營業時間 (取代當天原本的設定)
+    Body { designer_id: null (全店) 或設計師 ID, weekday: 0 (週一) ~ 6, windows: [['11:00', '19:00']] }
+    windows 為空列表表示當天公休；設計師的設定會再與全店時段取交集
+    """
+    data = request.get_json() or {}
+    weekday = data.get('weekday')
+    if not isinstance(weekday, int) or not 0 <= weekday <= 6:
+        return jsonify({'error': 'weekday 需為 0 (週一) ~ 6 (週日)'}), 400
+    try:
+        designer_id = _parse_designer_id(data.get('designer_id'))
+        windows = _parse_windows(data.get('windows', []))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    Calendar.set_weekly_hours(designer_id, weekday, windows)
+    return jsonify({'message': '營業時間已更新'}), 200
+
+@manager_bp.route('/calendar/hours', methods=['DELETE'])
+@token_required
+@manager_required
+def clear_weekly_hours():
+    """刪除每週設定 ?designer_id= (未提供表示全店，改回預設營業時間)"""
+    try:
+        designer_id = _parse_designer_id(request.args.get('designer_id'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    removed = Calendar.clear_weekly_hours(designer_id)
+    return jsonify({'message': '每週設定已刪除', 'removed': removed}), 200
+
+@manager_bp.route('/calendar/overrides', methods=['PUT'])
+@token_required
+@manager_required
+def set_calendar_override():
+    """
+    設定特定日期 (休假、國定假日、延長營業)
+    Body { designer_id: null 或設計師 ID, date: 'YYYY-MM-DD', windows: [] (整天休息) 或 [['11:00', '15:00']], note }
+    """
+    data = request.get_json() or {}
+    if not data.get('date'):
+        return jsonify({'error': '資料不完整'}), 400
+    try:
+        to_date(data['date'])
+        designer_id = _parse_designer_id(data.get('designer_id'))
+        windows = _parse_windows(data.get('windows', []))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    Calendar.set_override(designer_id, data['date'], windows, data.get('note'))
+    return jsonify({'message': '特定日期設定已更新'}), 200
+
+@manager_bp.route('/calendar/overrides', methods=['DELETE'])
+@token_required
+@manager_required
+def delete_calendar_override():
+    """刪除特定日期設定 ?date=YYYY-MM-DD&designer_id= (未提供 designer_id 表示全店)"""
+    date_str = request.args.get('date')
+    try:
+        to_date(date_str)
+    except (TypeError, ValueError):
+        return jsonify({'error': '日期格式錯誤'}), 400
+    try:
+        designer_id = _parse_designer_id(request.args.get('designer_id'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not Calendar.delete_override(designer_id, date_str):
+        return jsonify({'error': '找不到該設定'}), 404
+    return jsonify({'message': '特定日期設定已刪除'}), 200
+
+@manager_bp.route('/calendar/blocks', methods=['POST'])
+@token_required
+@manager_required
+def add_calendar_block():
+    """
+    新增封鎖時段 (教育訓練、店內活動等)，可跨日
+    Body { designer_id: null (全店) 或設計師 ID, start_at: 'YYYY-MM-DD HH:MM', end_at: 'YYYY-MM-DD HH:MM', reason }
+    """
+    data = request.get_json() or {}
+    try:
+        start_at = datetime.strptime(data.get('start_at', ''), '%Y-%m-%d %H:%M')
+        end_at = datetime.strptime(data.get('end_at', ''), '%Y-%m-%d %H:%M')
+    except (TypeError, ValueError):
+        return jsonify({'error': '時間格式錯誤，需為 YYYY-MM-DD HH:MM'}), 400
+    if end_at <= start_at:
+        return jsonify({'error': '結束時間需晚於開始時間'}), 400
+    try:
+        designer_id = _parse_designer_id(data.get('designer_id'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    block_id = Calendar.add_block(designer_id, start_at, end_at, data.get('reason'))
+    return jsonify({'message': '封鎖時段已新增', 'block_id': block_id}), 201
+
+@manager_bp.route('/calendar/blocks/<int:block_id>', methods=['DELETE'])
+@token_required
+@manager_required
+def delete_calendar_block(block_id):
+    """刪除封鎖時段"""
+    if not Calendar.delete_block(block_id):
+        return jsonify({'error': '找不到該封鎖時段'}), 404
+    return jsonify({'message': '封鎖時段已刪除'}), 200
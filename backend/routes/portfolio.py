@@ -52,15 +52,15 @@ def get_designer_portfolio(designer_id):
     """取得設計師的作品集 (公開)"""
     
     # 檢查設計師是否存在
-    designer = Designer.get_by_id(designer_id)
-    if not designer:
+    designer_name = Designer.get_name(designer_id)
+    if designer_name is None:
         return jsonify({'error': '找不到此設計師'}), 404
     
     portfolios = Portfolio.get_by_designer(designer_id)
     
     return jsonify({
         'designer_id': designer_id,
-        'designer_name': designer['name'],
+        'designer_name': designer_name,
         'portfolios': portfolios,
         'total': len(portfolios)
     }), 200
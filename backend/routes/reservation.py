@@ -2,11 +2,38 @@ from flask import Blueprint, request, jsonify
 from models.reservation import Reservation
 from models.designer import DesignerService
 from models.service import Service
+from models.occupancy import Occupancy
+from models.calendar import Calendar
 from utils.auth import token_required
+from utils.streaming import wants_stream, stream_rows, stream_events
+from utils import pubsub
+from utils.pagination import wants_page, parse_page_args
+from utils.time_range import to_date
+from utils.scheduling import slot_grid, sweep_available, format_minutes
+from utils.occupancy import mask_slots, mask_windows
 from datetime import datetime, timedelta
+import os
 
 reservation_bp = Blueprint('reservation', __name__, url_prefix='/api/reservations')
 
+# 多日查詢最多幾天
+AVAILABILITY_MAX_DAYS = 31
+
+def _parse_date_range(start_str, end_str):
+    """解析 start_date / end_date (含當天，未提供時預設 7 天)，回傳 (start, end, 錯誤訊息)"""
+    try:
+        start_date = to_date(start_str)
+        end_date = to_date(end_str) if end_str else start_date + timedelta(days=6)
+    except ValueError:
+        return None, None, '日期格式錯誤'
+
+    total_days = (end_date - start_date).days + 1
+    if total_days < 1:
+        return None, None, '結束日期不可早於開始日期'
+    if total_days > AVAILABILITY_MAX_DAYS:
+        return None, None, f'查詢區間最多 {AVAILABILITY_MAX_DAYS} 天'
+    return start_date, end_date, None
+
 @reservation_bp.route('/services', methods=['GET'])
 def get_services():
     """
@@ -39,58 +66,198 @@ def check_availability():
     if not all([designer_id, date_str, service_id]):
         return jsonify({'error': '缺少必要參數'}), 400
 
-    # 1. 取得該服務需要多久時間
-    service = Service.get_by_id(service_id)
+    # 1. 取得該服務需要多久時間：使用設計師的客製化設定 (與建立預約、多天查詢相同)
+    service = DesignerService.get_service_config(designer_id, service_id)
     if not service:
         return jsonify({'error': '無此服務'}), 404
     
     duration_min = service['duration_min']
 
-    # 2. 取得設計師當天已有的預約 (包含開始時間與時長)
-    existing_reservations = Reservation.get_designer_daily_schedule(designer_id, date_str)
+    try:
+        day = to_date(date_str)
+    except ValueError:
+        return jsonify({'error': '日期格式錯誤'}), 400
 
-    # 3. 營業時間 (假設 11:00 - 20:00)
-    shop_open_time = datetime.strptime(f"{date_str} 11:00", "%Y-%m-%d %H:%M")
-    shop_close_time = datetime.strptime(f"{date_str} 19:00", "%Y-%m-%d %H:%M")
+    # 2. 取得設計師當天的佔用位元圖 (有快取)
+    occupancy = Occupancy.get_day_mask(designer_id, day)
 
-    # 4. 演算法：每 30 分鐘切一個 slot，檢查能不能塞進去
-    available_slots = []
-    current_slot = shop_open_time
+    # 3. 設計師當天的工作時段 (營業時間 ∩ 設計師班表 - 封鎖時段，有快取)
+    windows = Calendar.get_working_windows(designer_id, day)
 
-    # 如果查詢的是今天，不能預約過去的時間
-    now = datetime.now()
-    if current_slot.date() == now.date() and current_slot < now:
-        # 讓 current_slot 前進到下一個最近的半點或整點
-        # 這裡簡單處理：直接從現在時間往後推一點
-        current_slot = now + timedelta(minutes=30 - (now.minute % 30))
-        current_slot = current_slot.replace(second=0, microsecond=0)
-
-    while current_slot + timedelta(minutes=duration_min) <= shop_close_time:
-        # 擬定這個 slot 的起訖時間
-        slot_start = current_slot
-        slot_end = current_slot + timedelta(minutes=duration_min)
-        
-        is_conflict = False
-        
-        # 檢查是否跟現有預約衝突
-        for res in existing_reservations:
-            # 資料庫拿出來的 reserved_time 應該是 datetime 物件
-            res_start = res['reserved_time']
-            res_end = res_start + timedelta(minutes=res['duration_min'])
-
-            # 判斷重疊邏輯：(新開始 < 舊結束) AND (新結束 > 舊開始)
-            if slot_start < res_end and slot_end > res_start:
-                is_conflict = True
-                break
-        
-        if not is_conflict:
-            available_slots.append(slot_start.strftime("%H:%M"))
-
-        # 下一個檢查點 (步長 30 分鐘)
-        current_slot += timedelta(minutes=30)
+    # 4. 工作時段內每個候選時段與佔用位元圖做 AND，列出放得下的時段
+    available_slots = mask_slots(day, duration_min, occupancy, windows=windows)
 
     return jsonify({'slots': available_slots})
 
+@reservation_bp.route('/availability/range', methods=['GET'])
+def check_availability_range():
+    """
+    查詢多天的可用時段 (週曆 / 月曆用)，整段期間的佔用位元圖只查一次
+    Query Params:
+        designer_id
+        start_date (YYYY-MM-DD)
+        end_date (YYYY-MM-DD，含當天，選填，預設 start_date 起 7 天)
+        service_id 或 service_ids (逗號分隔，一次查多個服務)
+    回傳:
+        service_id  -> {'days': {'2024-01-01': ['11:00', ...], ...}}
+        service_ids -> {'days': {'2024-01-01': {'1': ['11:00', ...], '2': [...]}, ...}}
+    """
+    designer_id = request.args.get('designer_id')
+    start_str = request.args.get('start_date')
+    service_id = request.args.get('service_id')
+    service_ids_str = request.args.get('service_ids')
+
+    if not all([designer_id, start_str]) or not (service_id or service_ids_str):
+        return jsonify({'error': '缺少必要參數'}), 400
+
+    start_date, end_date, error = _parse_date_range(start_str, request.args.get('end_date'))
+    if error:
+        return jsonify({'error': error}), 400
+    total_days = (end_date - start_date).days + 1
+
+    multi = not service_id
+    requested = [s.strip() for s in (service_ids_str or service_id).split(',') if s.strip()]
+
+    # 1. 服務時長：使用設計師的客製化設定 (與建立預約時相同)，只查一次 (有快取)
+    durations = {
+        str(s['service_id']): s['duration_min']
+        for s in DesignerService.get_public_services(designer_id)
+    }
+    missing = [s for s in requested if s not in durations]
+    if missing:
+        return jsonify({'error': '無此服務', 'service_ids': missing}), 404
+
+    # 2. 一次取得整段期間的佔用位元圖
+    masks = Occupancy.get_masks(designer_id, start_date, end_date)
+
+    # 3. 整段期間的工作時段
+    working = Calendar.get_working_windows_for([designer_id], start_date, end_date)
+
+    # 4. 逐日計算
+    now = datetime.now()
+    days = {}
+    for offset in range(total_days):
+        day = start_date + timedelta(days=offset)
+        occupancy = masks.get(day, 0)
+        windows = working[(designer_id, day)]
+        slots = {
+            sid: mask_slots(day, durations[sid], occupancy, now, windows=windows)
+            for sid in requested
+        }
+        days[day.isoformat()] = slots if multi else slots[requested[0]]
+
+    return jsonify({
+        'designer_id': designer_id,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'durations': {sid: durations[sid] for sid in requested},
+        'days': days
+    })
+
+@reservation_bp.route('/availability/any', methods=['GET'])
+def check_availability_any():
+    """
+    不指定設計師：查詢所有有提供此服務的設計師在期間內的可用時段
+    所有設計師的佔用位元圖一次查出，再用 sweep line 合併
+    Query Params: service_id, start_date (或 date), end_date (選填，含當天)
+    回傳:
+        {
+            'designers': {'1': {'name': ..., 'photo_url': ..., 'duration_min': 60}, ...},
+            'days': {'2024-01-01': {'11:00': [1, 3], '11:30': [3], ...}, ...}
+        }
+    """
+    service_id = request.args.get('service_id')
+    start_str = request.args.get('start_date') or request.args.get('date')
+
+    if not all([service_id, start_str]):
+        return jsonify({'error': '缺少必要參數'}), 400
+
+    # 只給 date 時只查當天
+    end_str = request.args.get('end_date') or (None if request.args.get('start_date') else start_str)
+    start_date, end_date, error = _parse_date_range(start_str, end_str)
+    if error:
+        return jsonify({'error': error}), 400
+
+    # 1. 有提供此服務的設計師與各自的服務時長 (一次查詢，有快取)
+    designers = DesignerService.get_designers_offering(service_id)
+    durations = {d['designer_id']: d['duration_min'] for d in designers}
+
+    # 2. 所有設計師整段期間的佔用位元圖 (一次查詢)
+    masks = Occupancy.get_masks_for(list(durations), start_date, end_date)
+
+    # 3. 所有設計師整段期間的工作時段
+    working = Calendar.get_working_windows_for(list(durations), start_date, end_date)
+
+    # 4. 逐日：各設計師的空檔 -> 可開始範圍 -> sweep line 合併
+    #    候選時間點為所有設計師工作時段的格點聯集 (各時段從開始時間起算)
+    now = datetime.now()
+    days = {}
+    day = start_date
+    while day <= end_date:
+        day_working = {designer_id: working[(designer_id, day)] for designer_id in durations}
+        grid = slot_grid(day, now, windows=[w for ws in day_working.values() for w in ws])
+        windows = {
+            designer_id: mask_windows(day, duration_min, masks.get((designer_id, day), 0),
+                                      windows=day_working[designer_id])
+            for designer_id, duration_min in durations.items()
+        } if grid else {}
+        days[day.isoformat()] = {
+            format_minutes(slot): designer_ids
+            for slot, designer_ids in sweep_available(windows, grid)
+        }
+        day += timedelta(days=1)
+
+    return jsonify({
+        'service_id': service_id,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'designers': {
+            str(d['designer_id']): {
+                'name': d['name'],
+                'photo_url': d['photo_url'],
+                'duration_min': d['duration_min']
+            }
+            for d in designers
+        },
+        'days': days
+    })
+
+# SSE 連線設定：心跳間隔與單一連線最長秒數 (到期後瀏覽器自動重連)
+SSE_HEARTBEAT_SEC = float(os.getenv('SSE_HEARTBEAT_SEC', 15))
+SSE_MAX_SECONDS = float(os.getenv('SSE_MAX_SECONDS', 300))
+
+@reservation_bp.route('/events', methods=['GET'])
+def reservation_events():
+    """
+    預約異動即時推播 (Server-Sent Events)，取代輪詢 /availability 與 /designer/schedule
+    Query Params: designer_id 和 / 或 date (YYYY-MM-DD)，至少一個
+    事件：created / status_changed / cancelled / rescheduled，data 為
+        {type, reservation_id, designer_id, date, time, status, ...} (不含顧客資料)
+    收到 resync 表示漏掉了事件，應重新查詢一次
+    前端：new EventSource('/api/reservations/events?designer_id=1')
+    """
+    designer_id = request.args.get('designer_id')
+    date_str = request.args.get('date')
+    if not (designer_id or date_str):
+        return jsonify({'error': '缺少必要參數'}), 400
+
+    topics = []
+    try:
+        if designer_id:
+            topics.append(f'designer:{int(designer_id)}')
+        if date_str:
+            topics.append(f'date:{to_date(date_str).isoformat()}')
+    except ValueError:
+        return jsonify({'error': '參數格式錯誤'}), 400
+
+    subscription = pubsub.subscribe(topics)
+    return stream_events(
+        subscription,
+        on_close=lambda: pubsub.unsubscribe(subscription),
+        heartbeat_sec=SSE_HEARTBEAT_SEC,
+        max_seconds=SSE_MAX_SECONDS
+    )
+
 @reservation_bp.route('', methods=['POST'])
 @token_required
 def create_reservation():
@@ -122,20 +289,104 @@ def create_reservation():
         'notes': data.get('notes', '')
     }
 
-    # 再次檢查後端防守 (防止並發預約造成的衝突)
-    # 這裡簡化省略，實際專案建議加上 Transaction 或 Lock
-
-    res_id, error = Reservation.create(reservation_data)
+    # 衝突檢查與寫入在同一個交易內 (鎖定設計師當天)，並發預約同一時段只會有一筆成功
+    try:
+        res_id, error = Reservation.create(reservation_data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     if error:
-        return jsonify({'error': str(error)}), 500
+        status_code = {Reservation.SLOT_TAKEN: 409, Reservation.OUTSIDE_HOURS: 400}.get(error, 500)
+        return jsonify({'error': str(error)}), status_code
 
     return jsonify({'message': '預約請求已送出', 'reservation_id': res_id}), 201
 
+@reservation_bp.route('/series', methods=['POST'])
+@token_required
+def create_reservation_series():
+    """
+    週期 / 組合預約，一次建立、全部成功或全部不建立
+    Body {
+        designer_id, date: 'YYYY-MM-DD', time: 'HH:MM',
+        service_ids: [1, 2] (依序接續，例如剪髮 + 染髮；或 service_id 單一服務),
+        repeat: {every_weeks: 4 (或 every_days), count: 3} (選填),
+        notes
+    }
+    有任何一次無法預約時回傳 409 與 conflicts (含同一天的建議時段)
+    """
+    data = request.get_json() or {}
+    user_id = request.user['user_id']
+
+    service_ids = data.get('service_ids') or ([data['service_id']] if data.get('service_id') else [])
+    if not all(k in data for k in ('designer_id', 'date', 'time')) or not isinstance(service_ids, list) or not service_ids:
+        return jsonify({'error': '資料不完整'}), 400
+    if len(service_ids) > Reservation.SERIES_MAX_SERVICES:
+        return jsonify({'error': f'一次最多 {Reservation.SERIES_MAX_SERVICES} 項服務'}), 400
+
+    repeat = data.get('repeat') or {}
+    try:
+        count = int(repeat.get('count', 1))
+        every_days = int(repeat['every_days']) if 'every_days' in repeat else int(repeat.get('every_weeks', 0)) * 7
+    except (TypeError, ValueError):
+        return jsonify({'error': 'repeat 格式錯誤'}), 400
+    if not 1 <= count <= Reservation.SERIES_MAX_OCCURRENCES:
+        return jsonify({'error': f'重複次數需介於 1 ~ {Reservation.SERIES_MAX_OCCURRENCES}'}), 400
+    if count > 1 and every_days < 1:
+        return jsonify({'error': '重複間隔至少 1 天'}), 400
+
+    # 設計師的服務設定只查一次 (有快取)
+    configs = {str(s['service_id']): s for s in DesignerService.get_public_services(data['designer_id'])}
+    missing = [sid for sid in service_ids if str(sid) not in configs]
+    if missing:
+        return jsonify({'error': '服務不存在', 'service_ids': missing}), 404
+
+    try:
+        occurrences = Reservation.expand_series(
+            f"{data['date']} {data['time']}",
+            [configs[str(sid)] for sid in service_ids],
+            every_days=every_days,
+            count=count
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    reservation_ids, conflicts = Reservation.create_series(
+        user_id, data['designer_id'], occurrences, data.get('notes', '')
+    )
+    if conflicts:
+        return jsonify({'error': '部分時段無法預約，請調整後再送出', 'conflicts': conflicts}), 409
+
+    per_visit = len(service_ids)
+    return jsonify({
+        'message': '預約請求已送出',
+        'reservation_ids': reservation_ids,
+        'occurrences': [
+            {
+                'date': occurrence['start'].strftime('%Y-%m-%d'),
+                'time': occurrence['start'].strftime('%H:%M'),
+                'reservation_ids': reservation_ids[index * per_visit:(index + 1) * per_visit]
+            }
+            for index, occurrence in enumerate(occurrences)
+        ]
+    }), 201
+
 @reservation_bp.route('/my', methods=['GET'])
 @token_required
 def get_my_reservations():
-    """取得我的預約歷史"""
+    """
+    取得我的預約歷史
+    支援分頁：?limit=20&cursor=...&from=YYYY-MM-DD&to=YYYY-MM-DD&status=已確認,待確認 (新到舊)
+        回傳 {items, next_cursor, has_more}，第一頁另附 summary (總筆數與各狀態筆數)
+    支援串流：?stream=1 或 Accept: application/x-ndjson
+    """
     user_id = request.user['user_id']
+    if wants_page():
+        try:
+            page_args = parse_page_args()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(Reservation.page_by_customer(user_id, **page_args))
+    if wants_stream():
+        return stream_rows(Reservation.iter_by_customer(user_id))
     reservations = Reservation.get_by_customer(user_id)
     return jsonify(reservations)
 
@@ -145,6 +396,7 @@ def get_designer_schedule():
     """
     設計師取得自己的預約列表 (管理後台用)
     支援篩選日期 ?date=2023-11-27
+    支援分頁：?limit=20&cursor=...&from=YYYY-MM-DD&to=YYYY-MM-DD&status=... (依時間先後)
     """
     # 1. 權限檢查：確認是設計師或管理者
     current_user = request.user
@@ -153,6 +405,13 @@ def get_designer_schedule():
 
     designer_id = current_user.get('user_id') # 或是 'id'，需看你 Token payload 怎麼塞
     
+    if wants_page():
+        try:
+            page_args = parse_page_args()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(Reservation.page_for_designer(designer_id, **page_args))
+
     # 2. 接收日期篩選 (選填)
     target_date = request.args.get('date') # 格式 YYYY-MM-DD
     
@@ -182,9 +441,76 @@ def update_reservation_status(reservation_id):
         return jsonify({'error': '無效的狀態'}), 400
     
     # 呼叫 Model 更新 (記得去 Model 補上這個方法)
-    success = Reservation.update_status(reservation_id, new_status)
+    result = Reservation.update_status(reservation_id, new_status)
     
-    if success:
+    if result and result['result'] in ('updated', 'unchanged'):
         return jsonify({'message': f'預約狀態已更新為 {new_status}'}), 200
+    elif result and result['result'] == 'conflict':
+        # 恢復已取消的預約時時段已被預約，或預約剛被其他人修改
+        return jsonify({'error': result['error']}), 409
     else:
-        return jsonify({'error': '更新失敗，找不到該預約或資料庫錯誤'}), 500
\ No newline at end of file
+        return jsonify({'error': '更新失敗，找不到該預約或資料庫錯誤'}), 500
+
+
+# 批次更新一次最多幾筆
+BULK_STATUS_MAX = 200
+
+@reservation_bp.route('/status', methods=['PUT'])
+@token_required
+def bulk_update_reservation_status():
+    """
+    批次更新預約狀態 (例如設計師下班前一次結清當天的預約)，同一個交易內完成
+    Body { items: [{reservation_id: 1, status: '已完成'}, ...] }
+    設計師只能改自己的預約，管理者不限；只允許 待確認 -> 已確認 / 已取消、已確認 -> 已完成 / 已取消
+    回傳每一筆的結果 (updated / unchanged / not_found / forbidden / invalid_transition ...)
+    """
+    current_user = request.user
+    role = current_user.get('role')
+    if role not in ['designer', 'manager']:
+        return jsonify({'error': '權限不足'}), 403
+
+    items = (request.get_json() or {}).get('items')
+    if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+        return jsonify({'error': '資料不完整'}), 400
+    if len(items) > BULK_STATUS_MAX:
+        return jsonify({'error': f'一次最多 {BULK_STATUS_MAX} 筆'}), 400
+
+    results = Reservation.bulk_update_status(
+        items, designer_id=current_user.get('user_id') if role == 'designer' else None
+    )
+    updated = sum(1 for result in results if result['result'] == 'updated')
+    return jsonify({
+        'updated': updated,
+        'failed': sum(1 for result in results if result['error']),
+        'results': results
+    }), 200
+
+@reservation_bp.route('/<int:reservation_id>/reschedule', methods=['PUT'])
+@token_required
+def reschedule_reservation(reservation_id):
+    """
+    改期：Body { date: 'YYYY-MM-DD', time: 'HH:MM' }
+    顧客只能改自己的預約，設計師只能改自己負責的預約，管理者不限
+    """
+    data = request.get_json() or {}
+    if not all(k in data for k in ('date', 'time')):
+        return jsonify({'error': '資料不完整'}), 400
+
+    reservation = Reservation.get_by_id(reservation_id)
+    if not reservation:
+        return jsonify({'error': '找不到該預約'}), 404
+
+    current_user = request.user
+    role = current_user.get('role')
+    owner_field = 'customer_id' if role == 'customer' else 'designer_id'
+    if role != 'manager' and str(reservation[owner_field]) != str(current_user.get('user_id')):
+        return jsonify({'error': '權限不足'}), 403
+
+    try:
+        success, error = Reservation.reschedule(reservation_id, f"{data['date']} {data['time']}")
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not success:
+        return jsonify({'error': error}), 400 if error == Reservation.OUTSIDE_HOURS else 409
+    return jsonify({'message': '預約已改期'}), 200
@@ -0,0 +1,38 @@
+"""
+可用時段：單日查詢與多天查詢使用同一個服務時長 (設計師的客製化設定，與建立預約相同)
+執行: python -m pytest test_availability.py
+"""
+from datetime import date, timedelta
+
+# 預設 60 分鐘的服務，這位設計師設定為 120 分鐘
+CUSTOM_DURATION = 120
+
+
+def _custom_duration(fake_db):
+    fake_db.respond('WHERE s.service_id = %s', [{'final_price': 800, 'duration_min': CUSTOM_DURATION, 'is_enabled': 1}])
+    fake_db.respond('FROM service s', [{'service_id': 1, 'name': '剪髮', 'duration_min': CUSTOM_DURATION}])
+    fake_db.respond('FROM service WHERE service_id', [{'service_id': 1, 'name': '剪髮', 'duration_min': 60}])
+
+
+def test_day_view_uses_designer_duration(client, fake_db):
+    _custom_duration(fake_db)
+    day = date.today() + timedelta(days=1)
+    slots = client.get(f'/api/reservations/availability?designer_id=1&service_id=1&date={day}').get_json()['slots']
+    # 營業到 19:00，120 分鐘的服務最晚 17:00 開始
+    assert slots[-1] == '17:00'
+
+
+def test_day_view_matches_range_view(client, fake_db):
+    _custom_duration(fake_db)
+    day = date.today() + timedelta(days=1)
+    single = client.get(f'/api/reservations/availability?designer_id=1&service_id=1&date={day}').get_json()
+    week = client.get(
+        f'/api/reservations/availability/range?designer_id=1&service_id=1&start_date={day}&end_date={day}'
+    ).get_json()
+    assert single['slots'] == week['days'][day.isoformat()]
+
+
+def test_day_view_unknown_service(client, fake_db):
+    day = date.today() + timedelta(days=1)
+    response = client.get(f'/api/reservations/availability?designer_id=1&service_id=99&date={day}')
+    assert response.status_code == 404
@@ -0,0 +1,326 @@
+"""
+並發預約：數百個執行緒同時搶同一個時段，每位設計師只能有一筆成功；不同設計師之間互不阻擋
+需要可寫入的本機 / 測試資料庫 (.env 可能指向正式資料庫，所以預設跳過)
+改期、批次更新狀態在鎖定後重新檢查 (含恢復已取消的預約) 的測試使用 fake_db，不需要資料庫
+執行: DB_WRITE_TESTS=1 python -m pytest test_booking_concurrency.py
+- 可用 TEST_CUSTOMER_ID / TEST_SERVICE_ID / TEST_DESIGNER_IDS (逗號分隔) 指定測試資料，預設取前幾筆
+- TEST_BOOKING_THREADS (預設 300)：同時送出的預約數，測試期間連線池也開到這麼大，資料庫的最大連線數需足夠
+"""
+import os
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+import pytest
+import config.database as database
+from config.database import get_db_connection
+from models.calendar import Calendar
+from models.occupancy import Occupancy
+from models.reservation import Reservation
+
+requires_db = pytest.mark.skipif(
+    not os.getenv('DB_HOST') or os.getenv('DB_WRITE_TESTS') != '1',
+    reason='需要 DB_HOST 與 DB_WRITE_TESTS=1 (會寫入資料庫)',
+)
+
+THREADS = int(os.getenv('TEST_BOOKING_THREADS', '300'))
+DESIGNERS = 3
+DURATION_MIN = 60
+# 別的設計師當天被鎖住時，建立預約最多可以花幾秒 (遠小於資料庫的鎖等待逾時)
+UNBLOCKED_SECONDS = 5
+# 測試資料以這個備註標記，結束後刪除
+TEST_NOTE = '__test_booking_concurrency__'
+
+
+def _pick_id(cursor, env_name, sql):
+    if os.getenv(env_name):
+        return int(os.getenv(env_name))
+    cursor.execute(sql)
+    row = cursor.fetchone()
+    if not row:
+        pytest.skip(f'資料庫沒有可用的測試資料 (可設定 {env_name})')
+    return next(iter(row.values()))
+
+
+def _pick_designers(cursor):
+    if os.getenv('TEST_DESIGNER_IDS'):
+        return [int(x) for x in os.getenv('TEST_DESIGNER_IDS').split(',')]
+    cursor.execute(
+        "SELECT designer_id FROM designer WHERE is_active = 1 AND role = 'designer' ORDER BY designer_id LIMIT %s",
+        (DESIGNERS,)
+    )
+    designer_ids = [row['designer_id'] for row in cursor.fetchall()]
+    if not designer_ids:
+        pytest.skip('資料庫沒有可用的設計師 (可設定 TEST_DESIGNER_IDS)')
+    return designer_ids
+
+
+def _first_open_slot(designer_id):
+    """一年後第一個有營業時間的時段，避免影響實際預約"""
+    day = date.today() + timedelta(days=365)
+    for _ in range(30):
+        for open_time, close_time in Calendar.get_working_windows(designer_id, day):
+            if close_time - open_time >= DURATION_MIN:
+                return datetime.combine(day, datetime.min.time()) + timedelta(minutes=open_time)
+        day += timedelta(days=1)
+    pytest.skip(f'設計師 {designer_id} 一年後的 30 天內沒有營業時間')
+
+
+def _cleanup(days):
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            for day in sorted(days):
+                day_start = datetime.combine(day, datetime.min.time())
+                cursor.execute(
+                    "DELETE FROM reservation WHERE notes = %s AND reserved_time >= %s AND reserved_time < %s",
+                    (TEST_NOTE, day_start, day_start + timedelta(days=1))
+                )
+                Occupancy.rebuild(cursor, start_date=day, end_date=day)
+
+
+def _day_of(booking):
+    return datetime.strptime(booking['reserved_time'], '%Y-%m-%d %H:%M').date()
+
+
+@pytest.fixture
+def contended_pool(monkeypatch):
+    """
+    測試專用的連線池，大小與執行緒數相同：預設的池 (DB_POOL_SIZE) 只有幾條連線，
+    同時只會有幾個交易在搶鎖，測不出並發問題
+    """
+    monkeypatch.setitem(database.POOL_CONFIG, 'max_size', THREADS)
+    monkeypatch.setitem(database.POOL_CONFIG, 'timeout', 120)
+    pools = {}
+    monkeypatch.setattr(database, '_pools', pools)
+    yield
+    for pool in pools.values():
+        for conn in pool._idle:
+            pool._close_quietly(conn)
+
+
+@pytest.fixture
+def bookings(contended_pool):
+    """每位測試設計師一筆預約資料 (各自第一個營業時段)，結束後刪除並重建當天的佔用位元圖"""
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            customer_id = _pick_id(cursor, 'TEST_CUSTOMER_ID', "SELECT customer_id FROM customer ORDER BY customer_id LIMIT 1")
+            service_id = _pick_id(cursor, 'TEST_SERVICE_ID', "SELECT service_id FROM service ORDER BY service_id LIMIT 1")
+            designer_ids = _pick_designers(cursor)
+    result = [
+        {
+            'customer_id': customer_id,
+            'designer_id': designer_id,
+            'service_id': service_id,
+            'reserved_time': _first_open_slot(designer_id).strftime('%Y-%m-%d %H:%M'),
+            'final_price': 0,
+            'duration_min': DURATION_MIN,
+            'notes': TEST_NOTE,
+        }
+        for designer_id in designer_ids
+    ]
+    days = {_day_of(booking) for booking in result}
+    _cleanup(days)
+    yield result
+    _cleanup(days)
+
+
+def _overlaps(designer_id, day):
+    """以 SQL self-join 找出同一設計師時間重疊的預約"""
+    day_start = datetime.combine(day, datetime.min.time())
+    day_end = day_start + timedelta(days=1)
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT a.reservation_id AS a_id, b.reservation_id AS b_id
+                FROM reservation a
+                JOIN reservation b
+                  ON a.designer_id = b.designer_id
+                 AND a.reservation_id < b.reservation_id
+                 AND a.reserved_time < DATE_ADD(b.reserved_time, INTERVAL b.duration_min MINUTE)
+                 AND b.reserved_time < DATE_ADD(a.reserved_time, INTERVAL a.duration_min MINUTE)
+                WHERE a.designer_id = %s
+                  AND a.reserved_time >= %s AND a.reserved_time < %s
+                  AND b.reserved_time >= %s AND b.reserved_time < %s
+                  AND a.status != '已取消' AND b.status != '已取消'
+            """, (designer_id, day_start, day_end, day_start, day_end))
+            return cursor.fetchall()
+
+
+def _hammer(bookings):
+    """THREADS 個執行緒同時建立預約 (依序輪流分給 bookings)，回傳 {designer_id: Counter(結果)}"""
+    results = {booking['designer_id']: Counter() for booking in bookings}
+    lock = threading.Lock()
+    barrier = threading.Barrier(THREADS)
+
+    def book(booking):
+        barrier.wait()  # 所有執行緒同時開始
+        try:
+            reservation_id, error = Reservation.create(dict(booking))
+            outcome = 'ok' if reservation_id else error
+        except Exception as e:
+            outcome = f'exception: {e}'
+        with lock:
+            results[booking['designer_id']][outcome] += 1
+
+    threads = [threading.Thread(target=book, args=(bookings[i % len(bookings)],)) for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _assert_consistent(bookings):
+    """沒有重複預約，且佔用位元圖與 reservation 表一致"""
+    for booking in bookings:
+        assert _overlaps(booking['designer_id'], _day_of(booking)) == []
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            for day in sorted({_day_of(booking) for booking in bookings}):
+                drift = Occupancy.rebuild(cursor, start_date=day, end_date=day)
+                assert drift['fixed'] == 0 and drift['removed'] == 0, drift
+
+
+@requires_db
+def test_same_slot_only_one_succeeds(bookings):
+    booking = bookings[0]
+    results = _hammer([booking])[booking['designer_id']]
+    assert results['ok'] == 1, results
+    assert results[Reservation.SLOT_TAKEN] == THREADS - 1, results
+    _assert_consistent([booking])
+
+
+@requires_db
+def test_each_designer_gets_exactly_one(bookings):
+    """多位設計師同時被搶：每位各自只有一筆成功，互不影響"""
+    if len(bookings) < 2:
+        pytest.skip('需要至少兩位設計師')
+    results = _hammer(bookings)
+    for designer_id, outcome in results.items():
+        assert outcome['ok'] == 1, (designer_id, outcome)
+        assert outcome['ok'] + outcome[Reservation.SLOT_TAKEN] == sum(outcome.values()), (designer_id, outcome)
+    _assert_consistent(bookings)
+
+
+@requires_db
+def test_other_designer_not_blocked(bookings):
+    """某位設計師當天被鎖住 (交易未結束) 時，其他設計師仍可立即建立預約"""
+    if len(bookings) < 2:
+        pytest.skip('需要至少兩位設計師')
+    held, other = bookings[0], bookings[1]
+    pool = database.get_pool()
+    conn = pool.acquire()
+    try:
+        with conn.cursor() as cursor:
+            Occupancy.lock_day(cursor, held['designer_id'], _day_of(held))
+        started = time.monotonic()
+        reservation_id, error = Reservation.create(dict(other))
+        elapsed = time.monotonic() - started
+    finally:
+        conn.rollback()
+        pool.release(conn)
+    assert reservation_id, error
+    assert elapsed < UNBLOCKED_SECONDS, elapsed
+
+
+def _reschedule_with_latest(fake_db, latest):
+    """第一次讀到待確認的預約，鎖定後重新讀取時換成 latest (模擬鎖定前被其他交易修改)"""
+    day = date.today() + timedelta(days=7)
+    original = datetime.combine(day, datetime.min.time()) + timedelta(hours=12)
+    fake_db.respond('designer_id, reserved_time, duration_min, status FROM reservation', [
+        {'designer_id': 1, 'reserved_time': original, 'duration_min': 60, 'status': '待確認'}
+    ])
+    fake_db.respond('FOR UPDATE', lambda sql, args: (
+        [latest(original)] if 'FROM reservation WHERE reservation_id' in sql and latest else []
+    ))
+    ok, error = Reservation.reschedule(5, original + timedelta(hours=2))
+    updated = [sql for sql, _ in fake_db.queries if 'UPDATE reservation SET reserved_time' in sql]
+    return ok, error, updated
+
+
+@pytest.mark.parametrize('latest, expected', [
+    (lambda original: {'reserved_time': original, 'status': '已取消'}, '預約狀態為已取消，無法改期'),
+    (lambda original: {'reserved_time': original, 'status': '已完成'}, '預約狀態為已完成，無法改期'),
+    (lambda original: {'reserved_time': original + timedelta(days=1), 'status': '待確認'},
+     Reservation.CHANGED_CONCURRENTLY),
+    (None, '找不到該預約'),
+])
+def test_reschedule_rechecks_after_lock(fake_db, latest, expected):
+    ok, error, updated = _reschedule_with_latest(fake_db, latest)
+    assert (ok, error) == (False, expected)
+    assert updated == []
+
+
+def test_reschedule_unchanged_after_lock(fake_db):
+    ok, error, updated = _reschedule_with_latest(
+        fake_db, lambda original: {'reserved_time': original, 'status': '待確認'}
+    )
+    assert (ok, error) == (True, None)
+    assert len(updated) == 1
+
+
+def _cancel_with_latest(fake_db, latest):
+    """批次取消：第一次讀到待確認的預約，鎖定後重新讀取時換成 latest"""
+    day = date.today() + timedelta(days=7)
+    original = datetime.combine(day, datetime.min.time()) + timedelta(hours=12)
+    row = {'reservation_id': 5, 'customer_id': 3, 'designer_id': 1, 'reserved_time': original, 'status': '待確認'}
+    fake_db.respond('SELECT reservation_id, customer_id, designer_id, reserved_time, status', [row])
+    fake_db.respond('FOR UPDATE', lambda sql, args: (
+        [{'reservation_id': 5, **latest(row)}] if 'WHERE reservation_id IN' in sql and latest else []
+    ))
+    result = Reservation.bulk_update_status([{'reservation_id': 5, 'status': '已取消'}])[0]
+    updated = [sql for sql, _ in fake_db.queries if 'UPDATE reservation' in sql]
+    return result, updated
+
+
+@pytest.mark.parametrize('latest, expected', [
+    (lambda row: {'designer_id': 1, 'reserved_time': row['reserved_time'], 'status': '已確認'},
+     ('conflict', '預約狀態已被其他人更新，請重新整理')),
+    (lambda row: {'designer_id': 1, 'reserved_time': row['reserved_time'] + timedelta(days=1), 'status': '待確認'},
+     ('conflict', Reservation.CHANGED_CONCURRENTLY)),
+    (lambda row: {'designer_id': 2, 'reserved_time': row['reserved_time'], 'status': '待確認'},
+     ('conflict', Reservation.CHANGED_CONCURRENTLY)),
+    (None, ('not_found', '找不到該預約')),
+])
+def test_bulk_update_status_rechecks_after_lock(fake_db, latest, expected):
+    result, updated = _cancel_with_latest(fake_db, latest)
+    assert (result['result'], result['error']) == expected
+    assert updated == []
+
+
+def test_bulk_update_status_unchanged_after_lock(fake_db):
+    result, updated = _cancel_with_latest(
+        fake_db, lambda row: {'designer_id': 1, 'reserved_time': row['reserved_time'], 'status': '待確認'}
+    )
+    assert (result['result'], result['error']) == ('updated', None)
+    assert len(updated) == 1
+
+
+def _reactivate(fake_db, others):
+    """恢復已取消的預約，當天 (鎖定後讀到的) 其他預約為 others"""
+    day = date.today() + timedelta(days=7)
+    original = datetime.combine(day, datetime.min.time()) + timedelta(hours=12)
+    row = {'reservation_id': 5, 'customer_id': 3, 'designer_id': 1, 'reserved_time': original, 'status': '已取消'}
+    fake_db.respond('SELECT reservation_id, customer_id, designer_id, reserved_time, status', [row])
+    fake_db.respond('WHERE reservation_id IN', [{**row, 'duration_min': 60}])
+    fake_db.respond("status != '已取消'", [
+        {'designer_id': 1, 'reserved_time': original + timedelta(minutes=offset), 'duration_min': 60,
+         'reservation_id': 100 + index}
+        for index, offset in enumerate(others)
+    ])
+    result = Reservation.update_status(5, '已確認')
+    updated = [sql for sql, _ in fake_db.queries if 'UPDATE reservation' in sql]
+    return result, updated
+
+
+def test_reactivate_cancelled_slot_taken(fake_db):
+    """取消後時段已被別人預約，恢復時不能造成重複預約"""
+    result, updated = _reactivate(fake_db, others=[30])
+    assert (result['result'], result['error']) == ('conflict', Reservation.SLOT_TAKEN)
+    assert updated == []
+
+
+def test_reactivate_cancelled_slot_free(fake_db):
+    result, updated = _reactivate(fake_db, others=[180])
+    assert (result['result'], result['error']) == ('updated', None)
+    assert len(updated) == 1
@@ -0,0 +1,82 @@
+"""
+熱門 API 的 SQL 次數上限：查詢次數不可隨資料筆數或天數增加 (N+1 回歸時測試失敗)
+執行: python -m pytest test_query_budget.py
+"""
+from datetime import date, datetime, timedelta
+import pytest
+from utils.cache import MemoryBackend, set_backend
+from utils.query_debug import track_queries
+
+DESIGNERS = [
+    {'designer_id': designer_id, 'name': f'設計師{designer_id}', 'photo_url': None, 'duration_min': 60}
+    for designer_id in (1, 2, 3)
+]
+
+
+def _count(client, url):
+    """清空快取後呼叫一次 API，回傳 (回應, SQL 次數)"""
+    set_backend(MemoryBackend())
+    with track_queries() as recorder:
+        response = client.get(url)
+    assert response.status_code == 200, response.get_json()
+    return response, recorder.count
+
+
+def test_designer_list(client, fake_db, query_budget):
+    fake_db.respond('FROM designer', [
+        {'designer_id': designer_id, 'name': f'設計師{designer_id}', 'password_hash': 'x'} for designer_id in range(20)
+    ])
+    with query_budget(1):
+        response = client.get('/api/designers')
+    assert response.get_json()['total'] == 20
+    assert all('password_hash' not in designer for designer in response.get_json()['designers'])
+    # 第二次讀快取
+    with query_budget(0):
+        client.get('/api/designers')
+
+
+def test_designer_portfolio(client, fake_db, query_budget):
+    fake_db.respond('SELECT name FROM designer', [{'name': '設計師1'}])
+    fake_db.respond('FROM portfolio', [
+        {'portfolio_id': portfolio_id, 'designer_id': 1, 'image_url': f'https://example.com/{portfolio_id}.jpg',
+         'image_public_id': str(portfolio_id), 'description': '', 'style_tag': '', 'created_at': datetime(2025, 1, 1)}
+        for portfolio_id in range(30)
+    ])
+    with query_budget(2):
+        response = client.get('/api/portfolio/designer/1')
+    assert response.get_json()['total'] == 30
+
+
+@pytest.mark.parametrize('days', [7, 28])
+def test_availability_range(client, fake_db, query_budget, days):
+    fake_db.respond('FROM service s', [{'service_id': 1, 'name': '剪髮', 'duration_min': 60}])
+    start = date.today() + timedelta(days=1)
+    url = (f'/api/reservations/availability/range?designer_id=1&service_id=1'
+           f'&start_date={start}&end_date={start + timedelta(days=days - 1)}')
+    with query_budget(5):
+        response = client.get(url)
+    assert len(response.get_json()['days']) == days
+
+
+def test_availability_range_does_not_grow_with_days(client, fake_db):
+    fake_db.respond('FROM service s', [{'service_id': 1, 'name': '剪髮', 'duration_min': 60}])
+    start = date.today() + timedelta(days=1)
+    base = '/api/reservations/availability/range?designer_id=1&service_id=1'
+    _, week = _count(client, f'{base}&start_date={start}&end_date={start + timedelta(days=6)}')
+    _, month = _count(client, f'{base}&start_date={start}&end_date={start + timedelta(days=27)}')
+    assert week == month
+
+
+def test_availability_any_does_not_grow_with_designers_or_days(client, fake_db, query_budget):
+    offering = []
+    fake_db.respond('FROM designer d', lambda sql, args: offering)
+    start = date.today() + timedelta(days=1)
+    base = '/api/reservations/availability/any?service_id=1'
+
+    offering[:] = DESIGNERS[:1]
+    _, single = _count(client, f'{base}&date={start}')
+    offering[:] = DESIGNERS
+    response, many = _count(client, f'{base}&start_date={start}&end_date={start + timedelta(days=13)}')
+    assert single == many <= 5
+    assert len(response.get_json()['designers']) == len(DESIGNERS)
+    assert len(response.get_json()['days']) == 14
@@ -0,0 +1,34 @@
+"""
+讀寫分離：快取的查詢從主要資料庫讀，沒有快取的 @read_only 查詢才走讀取端點
+執行: python -m pytest test_read_routing.py
+"""
+import pytest
+import config.database as database
+from models.analysis import AnalysisService
+from models.designer import Designer
+
+
+@pytest.fixture
+def pools(fake_db, monkeypatch):
+    """啟用讀寫分離，記錄每次借用的連線池名稱"""
+    used = []
+    fake_get_pool = database.get_pool
+
+    def get_pool(name='primary'):
+        used.append(name)
+        return fake_get_pool(name)
+
+    monkeypatch.setattr(database, 'DB_READ_MODE', 'replica')
+    monkeypatch.setattr(database, 'get_pool', get_pool)
+    return used
+
+
+@pytest.mark.parametrize('method', [Designer.get_all, AnalysisService.get_rfm_metrics])
+def test_cached_fill_reads_primary(pools, method):
+    method()
+    assert pools and set(pools) == {'primary'}
+
+
+def test_uncached_read_only_uses_read_endpoint(pools):
+    AnalysisService.get_rfm_customers([1])
+    assert pools == ['read']
@@ -0,0 +1,110 @@
+"""
+utils/rfm.py 整批評分與 AnalysisService.segment_customer 的結果必須相同 (固定門檻)
+執行: python -m pytest test_rfm.py
+"""
+from decimal import Decimal
+from itertools import product
+import pytest
+from models.analysis import AnalysisService
+from utils import rfm
+from utils.rfm import LEGACY_THRESHOLDS, iter_scored, quantile_thresholds, score_batch, score_rows
+
+
+def _around(cuts, extra=()):
+    """每個門檻本身與前後一點，加上 0 / 1"""
+    values = {0, 1, *extra}
+    for cut in cuts:
+        values.update((cut - 1, cut, cut + 1))
+    return sorted(values)
+
+RECENCY = _around(LEGACY_THRESHOLDS['recency'], extra=(1000,))
+FREQUENCY = _around(LEGACY_THRESHOLDS['frequency'], extra=(50,))
+MONETARY = [Decimal(value) for value in _around(LEGACY_THRESHOLDS['monetary'], extra=(100000,))] + [
+    Decimal('1999.99'), Decimal('2000.00'), Decimal('19999.99'), Decimal('20000.01'), 0.5, 5000.0
+]
+
+
+def _legacy(row):
+    return AnalysisService.segment_customer(row['recency_days'], row['frequency'], row['monetary'] or 0)
+
+
+@pytest.fixture(params=['numpy', 'bisect'])
+def backend(request, monkeypatch):
+    """兩種實作都要測：有 numpy 時的 searchsorted，以及沒有 numpy 時的 bisect"""
+    if request.param == 'numpy':
+        if rfm.np is None:
+            pytest.skip('沒有安裝 numpy')
+    else:
+        monkeypatch.setattr(rfm, 'np', None)
+    return request.param
+
+
+def test_boundary_combinations_match_segment_customer(backend):
+    rows = [
+        {'recency_days': r, 'frequency': f, 'monetary': m}
+        for r, f, m in product(RECENCY, FREQUENCY, MONETARY)
+    ]
+    expected = [{**row, **_legacy(row)} for row in rows]
+    assert score_rows(rows) == expected
+    assert score_rows(rows, LEGACY_THRESHOLDS) == expected
+
+    columns = score_batch(
+        [row['recency_days'] for row in rows], [row['frequency'] for row in rows], [row['monetary'] for row in rows]
+    )
+    for name in ('r_score', 'f_score', 'm_score', 'segment', 'color'):
+        assert columns[name] == [row[name] for row in expected], name
+
+
+@pytest.mark.parametrize('recency, score', [(0, 5), (60, 5), (61, 4), (120, 4), (121, 3), (180, 3),
+                                            (181, 2), (360, 2), (361, 1)])
+def test_recency_edges(backend, recency, score):
+    assert score_batch([recency], [1], [0])['r_score'] == [score]
+
+
+@pytest.mark.parametrize('frequency, score', [(1, 1), (2, 2), (3, 3), (5, 3), (6, 4), (9, 4), (10, 5)])
+def test_frequency_edges(backend, frequency, score):
+    assert score_batch([0], [frequency], [0])['f_score'] == [score]
+
+
+@pytest.mark.parametrize('monetary, score', [
+    (Decimal('1999.99'), 1), (Decimal('2000'), 2), (Decimal('4999.99'), 2), (Decimal('5000'), 3),
+    (Decimal('9999.99'), 3), (Decimal('10000'), 4), (Decimal('19999.99'), 4), (Decimal('20000'), 5),
+])
+def test_monetary_edges(backend, monetary, score):
+    assert score_batch([0], [1], [monetary])['m_score'] == [score]
+
+
+def test_zero_and_missing_monetary(backend):
+    """沒有消費金額 (SUM 為 NULL) 與 0 元相同，與 segment_customer(r, f, 0) 一致"""
+    rows = [
+        {'recency_days': r, 'frequency': f, 'monetary': m}
+        for r, f, m in product(RECENCY, FREQUENCY, (0, Decimal('0'), None))
+    ]
+    scored = score_rows(rows)
+    assert scored == [{**row, **_legacy(row)} for row in rows]
+    assert {row['m_score'] for row in scored} == {1}
+
+    # 同一批裡混著 None 與一般金額
+    mixed = [{'recency_days': 30, 'frequency': 12, 'monetary': m} for m in (None, Decimal('25000'), None, 8000.0)]
+    assert [row['m_score'] for row in score_rows(mixed)] == [1, 5, 1, 3]
+
+
+def test_empty_input(backend):
+    assert score_rows([]) == []
+    assert score_batch([], [], []) == {'r_score': [], 'f_score': [], 'm_score': [], 'segment': [], 'color': []}
+
+
+def test_iter_scored_matches_score_rows(backend):
+    rows = [
+        {'customer_id': index, 'recency_days': r, 'frequency': f, 'monetary': m}
+        for index, (r, f, m) in enumerate(product(RECENCY, FREQUENCY[:4], MONETARY[:5]))
+    ]
+    assert list(iter_scored(iter(rows), chunk_size=7)) == score_rows(rows)
+
+
+def test_quantile_thresholds(backend):
+    assert quantile_thresholds([], [], []) == LEGACY_THRESHOLDS
+    values = list(range(1, 101))
+    thresholds = quantile_thresholds(values, values, values[:-1] + [None])
+    assert thresholds['recency'] == (20.8, 40.6, 60.4, 80.2)
+    assert thresholds['monetary'][0] == 19.8
@@ -0,0 +1,50 @@
+"""
+CACHE_BACKEND=shared (Docker 映像預設) 下，放不進 slot 的大型值仍要快取 (例如上萬位顧客的 RFM 欄位)
+執行: python -m pytest test_shared_cache.py
+"""
+from decimal import Decimal
+import pytest
+import utils.cache as cache
+from models.analysis import AnalysisService
+from utils.shared_cache import SharedMemoryBackend
+
+
+@pytest.fixture
+def shared(fake_db, tmp_path, monkeypatch):
+    backend = SharedMemoryBackend(path=str(tmp_path / 'cache'), n_slots=64)
+    monkeypatch.setattr(cache, '_backend', backend)
+    return backend
+
+
+@pytest.mark.parametrize('customers', [2000, 20000])
+def test_rfm_metrics_cached_with_shared_backend(shared, fake_db, query_budget, customers):
+    fake_db.respond('FROM customer_stats', [
+        {'customer_id': customer_id, 'recency_days': customer_id % 400, 'frequency': customer_id % 12 + 1,
+         'monetary': Decimal(customer_id % 30000) + Decimal('0.50')}
+        for customer_id in range(1, customers + 1)
+    ])
+    with query_budget(1):
+        metrics = AnalysisService.get_rfm_metrics()
+    assert len(metrics['customer_id']) == customers
+    assert shared.stats()['skipped_oversize'] == 1  # 比一個 slot 大
+
+    # 翻頁與摘要都直接用快取，不再重查 customer_stats
+    with query_budget(0):
+        assert AnalysisService.get_rfm_metrics() == metrics
+        assert AnalysisService.get_rfm_summary()['summary']['total_customers'] == customers
+    with query_budget(1):  # 只查這一頁的聯絡資料
+        AnalysisService.page_rfm(20)
+
+
+def test_oversize_value_follows_tag_invalidation(shared):
+    value = list(range(20000))
+    cache.cache_set('big', value, tags=('customer_stats',))
+    assert cache.cache_get('big', tags=('customer_stats',)) == value
+    shared.bump_tag('customer_stats')  # 其他 worker 失效時只會改共用區的版本號
+    assert cache.cache_get('big', tags=('customer_stats',)) is cache.MISSING
+
+
+def test_small_value_stays_in_shared_slot(shared):
+    cache.cache_set('small', {'a': 1}, tags=('services',))
+    assert shared.stats()['entries'] == 1
+    assert shared.stats()['local_entries'] == 0
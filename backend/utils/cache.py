@@ -0,0 +1,224 @@
+"""
+讀多寫少資料 (服務目錄、設計師列表、產品列表) 的查詢結果快取
+- @cached 裝飾器或 cache_get / cache_set 直接使用
+- LRU + TTL 淘汰
+- 以 tag 版本號失效：寫入時 invalidate(tag) 把版本號 +1，舊的 key 自然失效
+- 後端可抽換：預設為 process 內記憶體；shared 為跨 worker 共用的 mmap；其他後端只要實作 CacheBackend 介面
+"""
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from config.database import after_commit
+from utils.metrics import Counter
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 1024))
+CACHE_DEFAULT_TTL = float(os.getenv('CACHE_DEFAULT_TTL', 300))
+
+CACHE_REQUESTS = Counter('cache_requests_total', '快取查詢次數', ('name', 'result'))
+
+# 快取查無資料時的回傳值 (快取的值本身可能是 None)
+MISSING = object()
+
+
+class CacheBackend:
+    """
+    快取後端介面
+    值一律以 bytes (pickle) 存放，取出時是新的物件，呼叫端修改回傳值不會影響快取
+    """
+
+    def get(self, key):
+        """回傳 bytes，查無或過期回傳 None"""
+        raise NotImplementedError
+
+    def set(self, key, data, ttl):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def get_tag_versions(self, tags):
+        """回傳各 tag 目前的版本號列表"""
+        raise NotImplementedError
+
+    def bump_tag(self, tag):
+        """tag 版本號 +1，讓帶有此 tag 的快取全部失效"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class MemoryBackend(CacheBackend):
+    """process 內的 LRU + TTL 快取"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, data)
+        self._tags = {}
+        self._lock = threading.Lock()
+        self._evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return data
+
+    def set(self, key, data, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_tag_versions(self, tags):
+        with self._lock:
+            return [self._tags.get(tag, 0) for tag in tags]
+
+    def bump_tag(self, tag):
+        with self._lock:
+            self._tags[tag] = self._tags.get(tag, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'evictions': self._evictions,
+            }
+
+
+# 可用的後端 (名稱 -> 建立函式)，其他後端可用 register_backend 加入
+def _shared_backend():
+    # 跨 worker 共用 (mmap)，見 utils/shared_cache.py
+    from utils.shared_cache import SharedMemoryBackend
+    return SharedMemoryBackend(
+        path=os.getenv('SHARED_CACHE_PATH') or None,
+        n_slots=CACHE_MAX_ENTRIES,
+        slot_size=int(os.getenv('SHARED_CACHE_SLOT_BYTES', 32768)),
+        local_entries=int(os.getenv('SHARED_CACHE_LOCAL_ENTRIES', 64)),
+    )
+
+_backend_factories = {
+    'memory': lambda: MemoryBackend(max_entries=CACHE_MAX_ENTRIES),
+    'shared': _shared_backend,
+}
+_backend = None
+_backend_lock = threading.Lock()
+
+def register_backend(name, factory):
+    """註冊快取後端，CACHE_BACKEND 設為 name 時使用"""
+    _backend_factories[name] = factory
+
+def set_backend(backend):
+    """直接指定快取後端 (測試或自訂用)"""
+    global _backend
+    _backend = backend
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                factory = _backend_factories.get(CACHE_BACKEND)
+                if factory is None:
+                    print(f"⚠️ 未知的快取後端 {CACHE_BACKEND}，改用 memory")
+                    factory = _backend_factories['memory']
+                _backend = factory()
+    return _backend
+
+
+def _versioned_key(key, tags):
+    if not tags:
+        return key
+    versions = get_backend().get_tag_versions(tags)
+    return key + '|' + ','.join(f'{tag}={version}' for tag, version in zip(tags, versions))
+
+def _load(full_key, name):
+    data = get_backend().get(full_key)
+    if data is None:
+        CACHE_REQUESTS.inc(name=name, result='miss')
+        return MISSING
+    CACHE_REQUESTS.inc(name=name, result='hit')
+    return pickle.loads(data)
+
+def _store(full_key, value, ttl):
+    ttl = CACHE_DEFAULT_TTL if ttl is None else ttl
+    get_backend().set(full_key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ttl)
+
+def cache_get(key, tags=(), name='default'):
+    """取出快取，查無回傳 MISSING"""
+    return _load(_versioned_key(key, tags), name)
+
+def cache_set(key, value, ttl=None, tags=()):
+    """寫入快取"""
+    _store(_versioned_key(key, tags), value, ttl)
+
+def invalidate(*tags):
+    """
+    讓帶有這些 tag 的快取失效
+    在 request 中會等交易 commit 之後才執行，避免其他 request 在 commit 前又把舊資料放回快取
+    """
+    def bump():
+        backend = get_backend()
+        for tag in tags:
+            backend.bump_tag(tag)
+    after_commit(bump)
+
+
+def cached(ttl=None, tags=(), key_prefix=None):
+    """
+    裝飾器：快取函式回傳值
+    - tags 可用 {0}、{1} 代入位置參數，例如 'designer_services:{0}'
+    - 回傳值必須能 pickle
+    - 不要與 @read_only 疊用：失效後重新查詢若走讀取端點，可能讀到寫入前的資料，
+      並以新的 tag 版本存入快取，整個 TTL 內都看不到剛寫入的資料
+
+    使用方式：
+    @staticmethod
+    @cached(ttl=600, tags=('services',))
+    def get_all(): ...
+    """
+    def decorator(f):
+        name = key_prefix or f'{f.__module__}.{f.__qualname__}'
+
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            resolved_tags = tuple(tag.format(*args) for tag in tags)
+            key = f'{name}:{args!r}:{sorted(kwargs.items())!r}'
+            # 查詢前就決定 tag 版本：查詢期間若有寫入，結果會存到舊版本的 key，不會污染新版本
+            full_key = _versioned_key(key, resolved_tags)
+            value = _load(full_key, name)
+            if value is not MISSING:
+                return value
+            value = f(*args, **kwargs)
+            _store(full_key, value, ttl)
+            return value
+
+        decorated.uncached = f
+        return decorated
+    return decorator
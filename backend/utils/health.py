@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from config.database import get_db_connection
+
+# 背景檢查間隔 (秒)
+HEALTH_CHECK_INTERVAL = float(os.getenv('HEALTH_CHECK_INTERVAL', 10))
+# 是否一併檢查 Cloudinary (需要 Admin API 權限)
+HEALTH_CHECK_CLOUDINARY = os.getenv('HEALTH_CHECK_CLOUDINARY', '0') == '1'
+
+
+def check_database():
+    """資料庫是否可用 (從連線池借一條連線執行 SELECT 1)"""
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+
+def check_cloudinary():
+    """Cloudinary 是否可連線"""
+    import cloudinary.api
+    cloudinary.api.ping()
+
+
+class HealthChecker:
+    """
+    背景執行緒定期檢查相依服務，探針只讀取快取結果
+    避免 orchestrator 每幾秒一次的探針都去開新的資料庫連線
+    """
+
+    def __init__(self, checks, interval=10):
+        self.checks = checks          # {名稱: 檢查函式 (失敗時拋出例外)}
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._state = {
+            name: {
+                'ok': None,               # None 表示還沒檢查過
+                'last_checked_at': None,
+                'last_latency_ms': None,
+                'consecutive_failures': 0,
+                'total_failures': 0,
+                'last_error': None,
+            }
+            for name in checks
+        }
+
+    def ensure_started(self):
+        """啟動背景執行緒；fork 後 (gunicorn --preload) 在子程序重新啟動"""
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='health-checker', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self.run_checks()
+            time.sleep(self.interval)
+
+    def run_checks(self):
+        for name, check in self.checks.items():
+            start = time.perf_counter()
+            error = None
+            try:
+                check()
+            except Exception as e:
+                error = str(e)
+            latency_ms = round((time.perf_counter() - start) * 1000, 2)
+            with self._lock:
+                state = self._state[name]
+                state['ok'] = error is None
+                state['last_checked_at'] = time.time()
+                state['last_latency_ms'] = latency_ms
+                state['last_error'] = error
+                if error is None:
+                    state['consecutive_failures'] = 0
+                else:
+                    state['consecutive_failures'] += 1
+                    state['total_failures'] += 1
+            if error is not None:
+                print(f"❌ 健康檢查失敗 ({name}): {error}")
+
+    def snapshot(self):
+        """
+        回傳快取的檢查結果
+        結果太舊 (超過 3 個檢查週期沒更新) 也視為未就緒
+        """
+        now = time.time()
+        with self._lock:
+            checks = {name: dict(state) for name, state in self._state.items()}
+        ready = True
+        for state in checks.values():
+            fresh = state['last_checked_at'] is not None and now - state['last_checked_at'] <= self.interval * 3
+            if not state['ok'] or not fresh:
+                ready = False
+            if state['last_checked_at'] is not None:
+                state['age_sec'] = round(now - state['last_checked_at'], 1)
+            state.pop('last_checked_at')
+        return ready, checks
+
+
+_checks = {'database': check_database}
+if HEALTH_CHECK_CLOUDINARY:
+    _checks['cloudinary'] = check_cloudinary
+
+health_checker = HealthChecker(_checks, interval=HEALTH_CHECK_INTERVAL)
@@ -0,0 +1,170 @@
+import threading
+import time
+from bisect import bisect_left
+from flask import g, request
+
+# 預設的延遲分布區間 (秒)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 所有註冊過的指標，/metrics 會依序輸出
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """只會增加的計數器"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Gauge:
+    """
+    目前值；可傳入 collect_fn 在輸出時才取值
+    collect_fn 回傳 [(labels_dict, value), ...]
+    """
+
+    def __init__(self, name, documentation, labelnames=(), collect_fn=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect_fn = collect_fn
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        if self.collect_fn:
+            try:
+                samples = [
+                    (tuple(labels.get(name, '') for name in self.labelnames), value)
+                    for labels, value in self.collect_fn()
+                ]
+            except Exception as e:
+                print(f"⚠️ 指標 {self.name} 取值失敗: {str(e)}")
+                samples = []
+        else:
+            with self._lock:
+                samples = list(self._values.items())
+        for key, value in samples:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Histogram:
+    """延遲分布 (Prometheus histogram)"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [各區間計數..., +Inf 計數, 總和]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            inf_labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{inf_labels} {cumulative}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {round(series[-1], 6)}')
+        return lines
+
+
+def render_metrics():
+    """輸出 Prometheus 文字格式"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+# HTTP 層指標
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'HTTP 請求處理時間', ('blueprint', 'method', 'status')
+)
+HTTP_DB_QUERIES = Histogram(
+    'http_request_db_queries', '每個 HTTP 請求執行的 SQL 數量', ('blueprint',),
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55)
+)
+HTTP_DB_SECONDS = Histogram(
+    'http_request_db_seconds', '每個 HTTP 請求花在資料庫的時間', ('blueprint',)
+)
+
+
+def init_metrics(app):
+    """註冊 HTTP 延遲統計 (依 blueprint 分類)"""
+
+    @app.before_request
+    def _start_timer():
+        g._request_started_at = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.get('_request_started_at')
+        if started is None:
+            return response
+        blueprint = request.blueprint or 'app'
+        elapsed = time.perf_counter() - started
+        HTTP_REQUEST_SECONDS.observe(elapsed, blueprint=blueprint, method=request.method,
+                                     status=response.status_code)
+        query_count = g.get('_db_query_count', 0)
+        db_seconds = g.get('_db_query_seconds', 0.0)
+        HTTP_DB_QUERIES.observe(query_count, blueprint=blueprint)
+        HTTP_DB_SECONDS.observe(db_seconds, blueprint=blueprint)
+        response.headers['X-DB-Query-Count'] = str(query_count)
+        response.headers['X-DB-Time-Ms'] = f'{db_seconds * 1000:.1f}'
+        return response
@@ -0,0 +1,92 @@
+"""
+設計師每日佔用位元圖
+- 一天切成 288 格 (每格 5 分鐘)，第 i 個 bit 代表 [5i, 5i+5) 分鐘是否已被預約
+- 以 Python int 做位元運算，存進資料庫時轉成固定 36 bytes
+- 查詢可用時段 = 把候選時段換成位元遮罩後與佔用圖 AND，結果為 0 就是空的
+"""
+from utils.scheduling import (
+    BUFFER_MIN, SLOT_STEP_MIN, default_windows, earliest_start, first_grid_point, format_minutes,
+    free_gaps, minutes_of_day, start_windows
+)
+
+TICK_MIN = 5
+TICKS_PER_DAY = 24 * 60 // TICK_MIN
+BITMAP_BYTES = TICKS_PER_DAY // 8
+_FULL_DAY = (1 << TICKS_PER_DAY) - 1
+
+
+def interval_mask(start_min, end_min):
+    """[start_min, end_min) 涵蓋到的格子 (不滿一格也算)"""
+    first = max(start_min // TICK_MIN, 0)
+    last = min(-(-end_min // TICK_MIN), TICKS_PER_DAY)
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+def reservation_mask(reservations, day):
+    """當天的預約 (reserved_time, duration_min) -> 佔用位元圖"""
+    mask = 0
+    for res in reservations:
+        start = minutes_of_day(res['reserved_time'], day)
+        mask |= interval_mask(start, start + res['duration_min'])
+    return mask
+
+def to_bytes(mask):
+    return (mask & _FULL_DAY).to_bytes(BITMAP_BYTES, 'little')
+
+def from_bytes(data):
+    return int.from_bytes(data, 'little') if data else 0
+
+
+def busy_runs(mask, buffer_min=0):
+    """位元圖 -> 忙碌區間 [(開始, 結束), ...] (分鐘數，前後各加 buffer_min 並合併)"""
+    runs = []
+    tick = 0
+    while mask >> tick:
+        # 跳過空格，找到下一段連續的 1
+        low = (mask >> tick) & -(mask >> tick)
+        tick += low.bit_length() - 1
+        length = (~(mask >> tick) & ((mask >> tick) + 1)).bit_length() - 1
+        start = tick * TICK_MIN - buffer_min
+        end = (tick + length) * TICK_MIN + buffer_min
+        if runs and start <= runs[-1][1]:
+            runs[-1] = (runs[-1][0], end)
+        else:
+            runs.append((start, end))
+        tick += length
+    return runs
+
+def mask_free(mask, start_min, duration_min, buffer_min=None):
+    """start_min 開始、持續 duration_min 是否完全空著 (含前後緩衝)"""
+    buffer_min = BUFFER_MIN if buffer_min is None else buffer_min
+    return not mask & interval_mask(start_min - buffer_min, start_min + duration_min + buffer_min)
+
+def mask_slots(day, duration_min, mask, now=None, step_min=None, buffer_min=None, lead_time_min=None,
+               windows=None):
+    """
+    以位元圖計算某一天可預約的時段，回傳 ['11:00', '11:30', ...]
+    只列出完整落在工作時段 (windows) 內的時段，每個候選時段只做一次 AND
+    """
+    step_min = step_min or SLOT_STEP_MIN
+    buffer_min = BUFFER_MIN if buffer_min is None else buffer_min
+    limit = earliest_start(day, now, lead_time_min)
+    if limit is None:
+        return []
+    slots = []
+    for open_time, close_time in (default_windows() if windows is None else windows):
+        first = first_grid_point(open_time, step_min, limit + 1)
+        slots.extend(
+            format_minutes(start)
+            for start in range(first, close_time - duration_min + 1, step_min)
+            if not mask & interval_mask(start - buffer_min, start + duration_min + buffer_min)
+        )
+    return slots
+
+def mask_windows(day, duration_min, mask, buffer_min=None, windows=None):
+    """位元圖 -> 某一天的可開始範圍，給 scheduling.sweep_available 使用"""
+    buffer_min = BUFFER_MIN if buffer_min is None else buffer_min
+    busy = busy_runs(mask, buffer_min)
+    result = []
+    for open_time, close_time in (default_windows() if windows is None else windows):
+        result.extend(start_windows(free_gaps(open_time, close_time, busy), duration_min))
+    return result
@@ -0,0 +1,139 @@
+"""
+列表分頁 (keyset / cursor)
+- 以 (reserved_time, reservation_id) 作為排序鍵，下一頁從上一頁最後一筆之後接著查，不使用 OFFSET
+- cursor 為 base64 編碼的 "reserved_time|reservation_id"，前端原封不動帶回即可
+- RFM 顧客列表以 (排序欄位的值, customer_id) 作為排序鍵，cursor 為 "值|customer_id"
+"""
+import base64
+from datetime import datetime
+from flask import request
+from utils.rfm import SEGMENTS, SORT_KEYS
+from utils.time_range import to_date
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# 出現任一個參數就回傳分頁格式 {items, next_cursor, ...}，否則維持原本的完整列表
+PAGE_ARGS = ('limit', 'cursor', 'from', 'to', 'status')
+
+RESERVATION_STATUSES = ('待確認', '已確認', '已完成', '已取消')
+
+# RFM 顧客列表：出現任一個參數就回傳分頁格式
+RFM_PAGE_ARGS = (
+    'limit', 'cursor', 'segment', 'sort', 'order',
+    'r_min', 'r_max', 'f_min', 'f_max', 'm_min', 'm_max',
+)
+
+
+def encode_cursor(reserved_time, reservation_id):
+    if isinstance(reserved_time, datetime):
+        reserved_time = reserved_time.strftime('%Y-%m-%d %H:%M:%S')
+    raw = f"{reserved_time}|{reservation_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token):
+    """cursor -> (reserved_time, reservation_id)，格式錯誤時丟出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        reserved_time, reservation_id = raw.split('|')
+        return datetime.strptime(reserved_time, '%Y-%m-%d %H:%M:%S'), int(reservation_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('cursor 格式錯誤')
+
+def encode_sort_cursor(value, item_id):
+    raw = f"{float(value)!r}|{item_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_sort_cursor(token):
+    """cursor -> (排序值, id)，格式錯誤時丟出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        value, item_id = raw.split('|')
+        return float(value), int(item_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('cursor 格式錯誤')
+
+def wants_page(args=PAGE_ARGS):
+    """前端是否要求分頁回應"""
+    return any(name in request.args for name in args)
+
+def _parse_limit():
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit 需為數字')
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f'limit 需介於 1 ~ {MAX_PAGE_SIZE}')
+    return limit
+
+def parse_page_args():
+    """
+    解析分頁參數，格式錯誤時丟出 ValueError
+    ?limit=20&cursor=...&from=YYYY-MM-DD&to=YYYY-MM-DD (含當天)&status=已確認,待確認
+    """
+    limit = _parse_limit()
+    cursor = request.args.get('cursor')
+    date_from, date_to = request.args.get('from'), request.args.get('to')
+    try:
+        date_from = to_date(date_from) if date_from else None
+        date_to = to_date(date_to) if date_to else None
+    except ValueError:
+        raise ValueError('日期格式錯誤')
+    if date_from and date_to and date_to < date_from:
+        raise ValueError('結束日期不可早於開始日期')
+
+    statuses = [s.strip() for s in request.args.get('status', '').split(',') if s.strip()]
+    invalid = [s for s in statuses if s not in RESERVATION_STATUSES]
+    if invalid:
+        raise ValueError(f"無效的狀態: {', '.join(invalid)}")
+
+    return {
+        'limit': limit,
+        'cursor': decode_cursor(cursor) if cursor else None,
+        'date_from': date_from,
+        'date_to': date_to,
+        'statuses': statuses,
+    }
+
+def parse_rfm_args():
+    """
+    解析 RFM 顧客列表參數，格式錯誤時丟出 ValueError
+    ?segment=超級常客,流失大戶&r_min=4&f_max=2&sort=monetary&order=desc&limit=20&cursor=...
+    分數範圍為 1 ~ 5 (含)；sort 預設 monetary，order 預設 desc
+    """
+    limit = _parse_limit()
+
+    segments = [s.strip() for s in request.args.get('segment', '').split(',') if s.strip()]
+    invalid = [s for s in segments if s not in SEGMENTS]
+    if invalid:
+        raise ValueError(f"無效的分群: {', '.join(invalid)}")
+
+    score_ranges = {}
+    for prefix, name in (('r', 'r_score'), ('f', 'f_score'), ('m', 'm_score')):
+        low, high = request.args.get(f'{prefix}_min'), request.args.get(f'{prefix}_max')
+        if low is None and high is None:
+            continue
+        try:
+            low, high = int(low or 1), int(high or 5)
+        except ValueError:
+            raise ValueError(f'{prefix}_min / {prefix}_max 需為數字')
+        if not 1 <= low <= high <= 5:
+            raise ValueError(f'{prefix} 分數範圍需介於 1 ~ 5，且最小值不大於最大值')
+        score_ranges[name] = (low, high)
+
+    sort = request.args.get('sort', 'monetary')
+    if sort not in SORT_KEYS:
+        raise ValueError(f"sort 需為 {' / '.join(SORT_KEYS)}")
+    order = request.args.get('order', 'desc')
+    if order not in ('asc', 'desc'):
+        raise ValueError('order 需為 asc / desc')
+
+    cursor = request.args.get('cursor')
+    return {
+        'limit': limit,
+        'cursor': decode_sort_cursor(cursor) if cursor else None,
+        'segments': segments,
+        'score_ranges': score_ranges,
+        'sort': sort,
+        'descending': order == 'desc',
+    }
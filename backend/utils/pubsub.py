@@ -0,0 +1,244 @@
+"""
+預約異動的即時推播 (publish / subscribe)
+- Reservation 的寫入方法在交易 commit 後 publish，SSE 端點 subscribe 後推給前端，前端不用再輪詢
+- 主題：designer:<id>、date:<YYYY-MM-DD>
+- 後端 (PUBSUB_BACKEND)：
+    memory: 只在同一個 process 內 (單一 worker / 開發用)
+    file: 多個 gunicorn worker 透過共用的 append-only 檔案互通，每個 worker 一條背景執行緒讀取新事件再分派
+- 訂閱者的佇列有上限，處理不及時丟棄事件並標記 overflowed，由 SSE 端點通知前端重新查詢
+"""
+import fcntl
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from config.database import after_commit
+
+PUBSUB_BACKEND = os.getenv('PUBSUB_BACKEND', 'memory')
+PUBSUB_QUEUE_SIZE = int(os.getenv('PUBSUB_QUEUE_SIZE', 100))
+# file 後端：背景執行緒檢查新事件的間隔 (秒) 與檔案輪替大小
+PUBSUB_POLL_INTERVAL = float(os.getenv('PUBSUB_POLL_INTERVAL', 0.2))
+PUBSUB_FILE_MAX_BYTES = int(os.getenv('PUBSUB_FILE_MAX_BYTES', 4 * 1024 * 1024))
+
+
+def _default_path():
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, 'ochi_salon_events')
+
+
+class Subscription:
+    """一個訂閱者 (一條 SSE 連線)"""
+
+    def __init__(self, topics, maxsize):
+        self.topics = frozenset(topics)
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """等待下一個事件，逾時回傳 None"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class MemoryBroker:
+    """process 內的訂閱者清單，依主題分派"""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscribe(self, topics):
+        subscription = Subscription(topics, self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def dispatch(self, topics, event):
+        topics = set(topics)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if subscription.topics & topics:
+                subscription.deliver(event)
+
+    def publish(self, topics, event):
+        self.dispatch(topics, event)
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memory', 'subscribers': len(self._subscribers)}
+
+
+class FileBroker(MemoryBroker):
+    """
+    跨 worker：publish 以 flock 互斥附加一行 JSON 到共用檔，
+    每個 worker 的背景執行緒從檔尾讀取新行後分派給本地訂閱者 (包含自己發布的事件)
+    檔案超過上限時改名輪替，讀取端發現 inode 改變就讀完舊檔再換新檔
+    """
+
+    def __init__(self, path=None, queue_size=100, poll_interval=0.2, max_bytes=4 * 1024 * 1024):
+        super().__init__(queue_size)
+        self.path = path or _default_path()
+        self.poll_interval = poll_interval
+        self.max_bytes = max_bytes
+        self._pid = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def subscribe(self, topics):
+        self._ensure_started()
+        return super().subscribe(topics)
+
+    def publish(self, topics, event):
+        line = (json.dumps({'topics': list(topics), 'event': event}, ensure_ascii=False) + '\n').encode('utf8')
+        lock_fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + '.1')
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+                try:
+                    os.write(fd, line)
+                finally:
+                    os.close(fd)
+            finally:
+                fcntl.flock(lock_fd, fcntl.LOCK_UN)
+        finally:
+            os.close(lock_fd)
+
+    def _ensure_started(self):
+        """啟動讀取執行緒；fork 後在子程序重新啟動"""
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='pubsub-reader', daemon=True)
+            self._thread.start()
+
+    def _open_latest(self, from_start):
+        fd = os.open(self.path, os.O_RDONLY | os.O_CREAT, 0o600)
+        if not from_start:
+            os.lseek(fd, 0, os.SEEK_END)  # 只需要訂閱之後的事件
+        return fd
+
+    def _run(self):
+        fd = self._open_latest(from_start=False)
+        pending = b''
+        while True:
+            try:
+                chunk = os.read(fd, 65536)
+                if chunk:
+                    pending += chunk
+                    *lines, pending = pending.split(b'\n')
+                    for line in lines:
+                        self._dispatch_line(line)
+                    continue
+                # 讀到檔尾：檔案被輪替就換到新檔 (從頭讀)
+                try:
+                    rotated = os.stat(self.path).st_ino != os.fstat(fd).st_ino
+                except FileNotFoundError:
+                    rotated = True
+                if rotated:
+                    # 換檔前再讀一次，避免漏掉改名前最後寫入的事件
+                    pending += os.read(fd, 1 << 30)
+                    *lines, pending = pending.split(b'\n')
+                    for line in lines:
+                        self._dispatch_line(line)
+                    # 兩次檢查之間又輪替了一次：中間那個檔 (.1) 還沒讀過，整個讀完
+                    try:
+                        with open(self.path + '.1', 'rb') as skipped:
+                            if os.fstat(skipped.fileno()).st_ino != os.fstat(fd).st_ino:
+                                for line in skipped.read().split(b'\n'):
+                                    self._dispatch_line(line)
+                    except FileNotFoundError:
+                        pass
+                    os.close(fd)
+                    fd = self._open_latest(from_start=True)
+                    pending = b''
+                    continue
+            except Exception as e:
+                print(f"⚠️ 推播讀取失敗: {str(e)}")
+            time.sleep(self.poll_interval)
+
+    def _dispatch_line(self, line):
+        if not line.strip():
+            return
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return
+        self.dispatch(message['topics'], message['event'])
+
+    def stats(self):
+        stats = super().stats()
+        stats['backend'] = 'file'
+        return stats
+
+
+_broker_factories = {
+    'memory': lambda: MemoryBroker(queue_size=PUBSUB_QUEUE_SIZE),
+    'file': lambda: FileBroker(
+        path=os.getenv('PUBSUB_FILE_PATH') or None,
+        queue_size=PUBSUB_QUEUE_SIZE,
+        poll_interval=PUBSUB_POLL_INTERVAL,
+        max_bytes=PUBSUB_FILE_MAX_BYTES,
+    ),
+}
+_broker = None
+_broker_lock = threading.Lock()
+
+def set_broker(broker):
+    """直接指定推播後端 (測試或自訂用)"""
+    global _broker
+    _broker = broker
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                factory = _broker_factories.get(PUBSUB_BACKEND)
+                if factory is None:
+                    print(f"⚠️ 未知的推播後端 {PUBSUB_BACKEND}，改用 memory")
+                    factory = _broker_factories['memory']
+                _broker = factory()
+    return _broker
+
+
+def publish(topics, event):
+    """
+    發布事件到多個主題
+    在 request 中會等交易 commit 之後才送出，rollback 的異動不會推播
+    """
+    topics = list(topics)
+
+    def send():
+        try:
+            get_broker().publish(topics, event)
+        except Exception as e:
+            print(f"⚠️ 推播失敗: {str(e)}")
+    after_commit(send)
+
+def subscribe(topics):
+    return get_broker().subscribe(topics)
+
+def unsubscribe(subscription):
+    get_broker().unsubscribe(subscription)
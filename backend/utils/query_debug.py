@@ -0,0 +1,132 @@
+"""
+開發 / 測試用的 SQL 紀錄工具
+- 開發模式下記錄每個 request 執行的 SQL，偵測 N+1 (同一種查詢執行太多次) 與完全重複的查詢
+- assert_max_queries(): 在測試中限制某段程式碼最多只能執行幾次 SQL
+"""
+import os
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from config.database import add_query_listener
+
+# 開發模式預設開啟；正式環境可用 DB_QUERY_DEBUG=1 手動開啟
+QUERY_DEBUG = os.getenv('DB_QUERY_DEBUG', '1' if os.getenv('FLASK_ENV') == 'development' else '0') == '1'
+# 同一種查詢 (fingerprint 相同) 在一個 request 內執行幾次以上視為 N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv('DB_N_PLUS_ONE_THRESHOLD', 5))
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """SQL 執行次數超過預算"""
+    pass
+
+
+class QueryRecorder:
+    """記錄一段期間內執行過的 SQL"""
+
+    def __init__(self):
+        self.queries = []  # [(fingerprint, sql, args), ...]
+
+    def record(self, fingerprint, sql, args):
+        self.queries.append((fingerprint, sql, args))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    def problems(self, threshold=N_PLUS_ONE_THRESHOLD):
+        """回傳偵測到的問題描述列表"""
+        messages = []
+        by_fingerprint = Counter(fingerprint for fingerprint, _, _ in self.queries)
+        for fingerprint, times in by_fingerprint.items():
+            if times >= threshold:
+                messages.append(f"N+1 疑慮：同一種查詢執行了 {times} 次 -> {fingerprint}")
+
+        identical = Counter((sql, repr(args)) for _, sql, args in self.queries)
+        for (sql, _), times in identical.items():
+            if times > 1:
+                fingerprint = next(fp for fp, s, _ in self.queries if s == sql)
+                messages.append(f"重複查詢：相同 SQL 與參數執行了 {times} 次 -> {fingerprint}")
+        return messages
+
+    def report(self):
+        lines = [f"共執行 {self.count} 次 SQL:"]
+        lines.extend(f"  {index + 1}. {fingerprint}" for index, (fingerprint, _, _) in enumerate(self.queries))
+        return '\n'.join(lines)
+
+
+def _active_recorders():
+    stack = getattr(_local, 'recorders', None)
+    if stack is None:
+        stack = _local.recorders = []
+    return stack
+
+def _on_query(fingerprint, sql, args, elapsed):
+    for recorder in _active_recorders():
+        recorder.record(fingerprint, sql, args)
+    if QUERY_DEBUG and has_request_context():
+        recorder = g.get('_query_recorder')
+        if recorder is not None:
+            recorder.record(fingerprint, sql, args)
+
+add_query_listener(_on_query)
+
+
+@contextmanager
+def track_queries():
+    """
+    記錄區塊內 (同一執行緒) 執行的所有 SQL
+
+    使用方式：
+    with track_queries() as recorder:
+        client.get('/api/designers')
+    print(recorder.count)
+    """
+    recorder = QueryRecorder()
+    stack = _active_recorders()
+    stack.append(recorder)
+    try:
+        yield recorder
+    finally:
+        stack.remove(recorder)
+
+
+@contextmanager
+def assert_max_queries(max_queries, allow_duplicates=False):
+    """
+    斷言區塊內最多執行 max_queries 次 SQL，並且沒有完全重複的查詢
+    超過就拋出 QueryBudgetExceeded，讓 CI 直接失敗
+    """
+    with track_queries() as recorder:
+        yield recorder
+    if recorder.count > max_queries:
+        raise QueryBudgetExceeded(f"SQL 執行次數 {recorder.count} 超過預算 {max_queries}\n{recorder.report()}")
+    if not allow_duplicates:
+        duplicates = [message for message in recorder.problems(threshold=max_queries + 1) if message.startswith('重複查詢')]
+        if duplicates:
+            raise QueryBudgetExceeded('\n'.join(duplicates) + '\n' + recorder.report())
+
+
+def init_query_debug(app):
+    """開發模式：每個 request 結束時檢查 N+1 與重複查詢"""
+    if not QUERY_DEBUG:
+        return
+
+    @app.before_request
+    def _start_recording():
+        g._query_recorder = QueryRecorder()
+
+    @app.after_request
+    def _check_queries(response):
+        recorder = g.pop('_query_recorder', None)
+        if recorder is None:
+            return response
+        problems = recorder.problems()
+        if problems:
+            print(f"⚠️ {request.method} {request.path} 查詢問題:")
+            for message in problems:
+                print(f"  - {message}")
+            response.headers['X-Query-Warnings'] = str(len(problems))
+        return response
@@ -0,0 +1,206 @@
+"""
+RFM 批次評分
+- 一次對整批顧客評分：R / F / M 各自是一欄數值，對門檻向量做 searchsorted 得到 1 ~ 5 分
+- 門檻可用固定值 (LEGACY_THRESHOLDS，與 AnalysisService.segment_customer 相同) 或依目前分布計算的五分位數
+- 分群只依三個分數決定，先算好 125 種組合的對照表，評分後查表
+- 有安裝 numpy 時以陣列運算；沒有時以 bisect 計算，結果相同
+- 門檻模式 (RFM_THRESHOLDS)：legacy (固定門檻，預設) / quantile (五分位數)
+"""
+import os
+from bisect import bisect_left, bisect_right
+
+try:
+    import numpy as np
+except ImportError:  # numpy 為選用套件
+    np = None
+
+RFM_THRESHOLDS = os.getenv('RFM_THRESHOLDS', 'legacy')
+THRESHOLD_MODES = ('legacy', 'quantile')
+# 串流時每累積多少筆評分一次
+SCORE_CHUNK_SIZE = 500
+
+# 每個維度 4 個切點 -> 5 個分數
+# recency 越小越好：r <= 60 為 5 分 ... r > 360 為 1 分
+# frequency / monetary 越大越好：f >= 10 為 5 分 ... f < 2 為 1 分
+LEGACY_THRESHOLDS = {
+    'recency': (60, 120, 180, 360),
+    'frequency': (2, 3, 6, 10),
+    'monetary': (2000, 5000, 10000, 20000),
+}
+
+# 分群規則：依序比對，第一個符合的為準 (與 segment_customer 相同)
+SEGMENT_RULES = (
+    ('超級常客', 'purple', lambda r, f, m: (r >= 4) & (f >= 4) & (m >= 4)),   # 高價值且活躍
+    ('潛力新客', 'green', lambda r, f, m: (r >= 4) & (f <= 2)),               # 剛來過，次數不多
+    ('沈睡顧客', 'orange', lambda r, f, m: (r <= 2) & (f >= 4)),              # 以前常來，最近沒來
+    ('流失大戶', 'red', lambda r, f, m: (r <= 2) & (m >= 4)),                 # 以前花很多錢，但很久沒來
+    ('忠誠熟客', 'blue', lambda r, f, m: f >= 4),                             # 常來，但可能單價普通
+    ('活躍顧客', 'teal', lambda r, f, m: r >= 3),                             # 近期有來
+)
+DEFAULT_SEGMENT = ('一般顧客', 'gray')
+SEGMENTS = tuple(name for name, _, _ in SEGMENT_RULES) + (DEFAULT_SEGMENT[0],)
+
+# 列表可排序的欄位
+SORT_KEYS = ('monetary', 'recency_days', 'frequency', 'r_score', 'f_score', 'm_score')
+
+
+def _quantile(sorted_values, q):
+    """線性內插的分位數 (與 numpy.quantile 預設相同)"""
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def quantile_thresholds(recency, frequency, monetary, buckets=5):
+    """
+    依目前的分布計算切點 (預設五分位數)，每個分數大約各佔 1/buckets 的顧客
+    沒有資料時回傳 LEGACY_THRESHOLDS
+    """
+    if not len(recency):
+        return dict(LEGACY_THRESHOLDS)
+    qs = [index / buckets for index in range(1, buckets)]
+    thresholds = {}
+    # 沒有消費金額 (None) 視為 0
+    monetary = [value or 0 for value in monetary]
+    for name, values in (('recency', recency), ('frequency', frequency), ('monetary', monetary)):
+        if np is not None:
+            cuts = np.quantile(np.asarray(values, dtype=float), qs).tolist()
+        else:
+            ordered = sorted(float(value) for value in values)
+            cuts = [_quantile(ordered, q) for q in qs]
+        thresholds[name] = tuple(round(cut, 2) for cut in cuts)
+    return thresholds
+
+def thresholds_for(mode, recency, frequency, monetary):
+    """依門檻模式 (legacy / quantile) 取得切點"""
+    if mode == 'quantile':
+        return quantile_thresholds(recency, frequency, monetary)
+    return LEGACY_THRESHOLDS
+
+
+def _segment_table(sizes):
+    """所有 (r, f, m) 分數組合 -> (segment, color)，分群只需查表"""
+    r_size, f_size, m_size = sizes
+    table = []
+    for r in range(1, r_size + 1):
+        for f in range(1, f_size + 1):
+            for m in range(1, m_size + 1):
+                table.append(next(
+                    ((name, color) for name, color, rule in SEGMENT_RULES if rule(r, f, m)), DEFAULT_SEGMENT
+                ))
+    return table
+
+def _scores_numpy(recency, frequency, monetary, thresholds):
+    r_cuts = np.asarray(thresholds['recency'], dtype=float)
+    f_cuts = np.asarray(thresholds['frequency'], dtype=float)
+    m_cuts = np.asarray(thresholds['monetary'], dtype=float)
+    r = len(r_cuts) + 1 - np.searchsorted(r_cuts, np.asarray(recency, dtype=float), side='left')
+    f = 1 + np.searchsorted(f_cuts, np.asarray(frequency, dtype=float), side='right')
+    # Decimal 陣列直接 asarray 很慢，先逐一轉成 float；有 None (沒有消費金額) 時視為 0
+    try:
+        amounts = np.fromiter(map(float, monetary), float, len(monetary))
+    except TypeError:
+        amounts = np.fromiter((float(value or 0) for value in monetary), float, len(monetary))
+    m = 1 + np.searchsorted(m_cuts, amounts, side='right')
+    sizes = (len(r_cuts) + 1, len(f_cuts) + 1, len(m_cuts) + 1)
+    table = _segment_table(sizes)
+    index = ((r - 1) * sizes[1] + (f - 1)) * sizes[2] + (m - 1)
+    # 查表在 Python list 上做，比 numpy 字串陣列轉回 str 快
+    segments = [table[position] for position in index.tolist()]
+    return {
+        'r_score': r.tolist(), 'f_score': f.tolist(), 'm_score': m.tolist(),
+        'segment': [name for name, _ in segments], 'color': [color for _, color in segments],
+    }
+
+def _scores_python(recency, frequency, monetary, thresholds):
+    r_cuts, f_cuts, m_cuts = thresholds['recency'], thresholds['frequency'], thresholds['monetary']
+    r_top = len(r_cuts) + 1
+    f_size, m_size = len(f_cuts) + 1, len(m_cuts) + 1
+    table = _segment_table((r_top, f_size, m_size))
+    r_scores = [r_top - bisect_left(r_cuts, value) for value in recency]
+    f_scores = [1 + bisect_right(f_cuts, value) for value in frequency]
+    m_scores = [1 + bisect_right(m_cuts, value or 0) for value in monetary]
+    segments = [
+        table[((r - 1) * f_size + (f - 1)) * m_size + (m - 1)]
+        for r, f, m in zip(r_scores, f_scores, m_scores)
+    ]
+    return {
+        'r_score': r_scores, 'f_score': f_scores, 'm_score': m_scores,
+        'segment': [name for name, _ in segments], 'color': [color for _, color in segments],
+    }
+
+def score_batch(recency, frequency, monetary, thresholds=None):
+    """
+    整批評分，三個參數為等長的數值序列 (monetary 可為 Decimal 或 None，None 視為 0)
+    回傳欄位格式 {'r_score': [...], 'f_score': [...], 'm_score': [...], 'segment': [...], 'color': [...]}
+    """
+    thresholds = thresholds or LEGACY_THRESHOLDS
+    if np is not None and len(recency):
+        return _scores_numpy(recency, frequency, monetary, thresholds)
+    return _scores_python(recency, frequency, monetary, thresholds)
+
+def score_rows(rows, thresholds=None):
+    """
+    對查詢結果 (含 recency_days / frequency / monetary) 整批評分
+    回傳與 rows 同順序、合併評分結果的 [{**row, 'r_score', 'f_score', 'm_score', 'segment', 'color'}, ...]
+    """
+    columns = score_batch(
+        [row['recency_days'] for row in rows],
+        [row['frequency'] for row in rows],
+        [row['monetary'] for row in rows],
+        thresholds
+    )
+    return [
+        {**row, 'r_score': r, 'f_score': f, 'm_score': m, 'segment': segment, 'color': color}
+        for row, r, f, m, segment, color in zip(
+            rows, columns['r_score'], columns['f_score'], columns['m_score'], columns['segment'], columns['color']
+        )
+    ]
+
+def iter_scored(rows, thresholds=None, chunk_size=SCORE_CHUNK_SIZE):
+    """
+    逐批評分 rows (可為 generator)，產生與 score_rows 相同格式的資料列
+    串流時一次只保留 chunk_size 筆
+    """
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield from score_rows(chunk, thresholds)
+            chunk = []
+    if chunk:
+        yield from score_rows(chunk, thresholds)
+
+
+def select(columns, scores, segments=(), score_ranges=None, sort='monetary'):
+    """
+    依分群與分數範圍篩選，再依 (sort 欄位, customer_id) 遞增排序
+    columns 為欄位格式的原始數據 (含 customer_id)，scores 為 score_batch 的結果
+    score_ranges: {'r_score': (最小, 最大), ...}
+    回傳 [(排序值, customer_id, 列索引), ...]
+    """
+    values = columns[sort] if sort in columns else scores[sort]
+    segments = set(segments)
+    ranges = list((score_ranges or {}).items())
+    matched = []
+    for index, customer_id in enumerate(columns['customer_id']):
+        if segments and scores['segment'][index] not in segments:
+            continue
+        if any(not low <= scores[name][index] <= high for name, (low, high) in ranges):
+            continue
+        matched.append((float(values[index]), customer_id, index))
+    matched.sort()
+    return matched
+
+def page_after(ordered, cursor, limit, descending=False):
+    """
+    keyset 分頁：從 select 的結果取 cursor (排序值, customer_id) 之後的 limit 筆
+    descending 時由大到小；回傳 (該頁, 是否還有下一頁)
+    """
+    if descending:
+        # (值, id) 比 (值, id, 索引) 小，bisect_left 停在 cursor 那一筆，前面的都更小
+        end = bisect_left(ordered, tuple(cursor)) if cursor else len(ordered)
+        start = max(end - limit, 0)
+        return ordered[start:end][::-1], start > 0
+    start = bisect_right(ordered, (*cursor, float('inf'))) if cursor else 0
+    return ordered[start:start + limit], start + limit < len(ordered)
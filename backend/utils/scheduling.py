@@ -0,0 +1,252 @@
+"""
+預約時段計算引擎
+- 時間一律換算成「當天第幾分鐘」的整數，避免大量建立 datetime / timedelta
+- 預約先排序、合併成忙碌區間 (前後各加上緩衝時間)，再求出空檔
+- 每個空檔換算成「可以開始服務的範圍」，一次線性掃描就能列出所有可預約時段
+- 多位設計師的可開始範圍以 sweep line 合併：時間軸上依序處理「可開始 / 不可開始」事件，
+  一次掃描就得到每個時段有哪些設計師可以接
+- 衝突檢查：單次直接線性掃描；多次檢查先建好忙碌區間再二分搜尋
+"""
+import os
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+# 營業時間
+SHOP_OPEN = '11:00'
+SHOP_CLOSE = '19:00'
+# 時段間隔 (分鐘)
+SLOT_STEP_MIN = int(os.getenv('BOOKING_SLOT_STEP_MIN', 30))
+# 兩個預約之間至少要空幾分鐘 (整理、清潔)
+BUFFER_MIN = int(os.getenv('BOOKING_BUFFER_MIN', 0))
+# 至少要提前幾分鐘預約
+LEAD_TIME_MIN = int(os.getenv('BOOKING_LEAD_TIME_MIN', 0))
+
+
+def parse_minutes(value):
+    """'HH:MM' -> 當天第幾分鐘"""
+    hour, minute = value.split(':')
+    return int(hour) * 60 + int(minute)
+
+def format_minutes(minutes):
+    """當天第幾分鐘 -> 'HH:MM'"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def minutes_of_day(value, day):
+    """datetime -> 相對於 day 00:00 的分鐘數 (可能為負或超過 1440)"""
+    delta = value - datetime.combine(day, datetime.min.time())
+    return int(delta.total_seconds() // 60)
+
+def default_windows():
+    """沒有設定營業時間 (見 models/calendar.py) 時的工作時段 [(開始, 結束)]，以當天第幾分鐘表示"""
+    return [(parse_minutes(SHOP_OPEN), parse_minutes(SHOP_CLOSE))]
+
+def intersect_windows(first, second):
+    """兩組排序好的時段取交集"""
+    result = []
+    i = j = 0
+    while i < len(first) and j < len(second):
+        start = max(first[i][0], second[j][0])
+        end = min(first[i][1], second[j][1])
+        if start < end:
+            result.append((start, end))
+        if first[i][1] < second[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+def subtract_windows(windows, blocked):
+    """排序好的時段扣掉 blocked 區間 (不需排序)"""
+    if not blocked:
+        return windows
+    busy = busy_intervals_from_pairs(blocked)
+    result = []
+    for start, end in windows:
+        result.extend(free_gaps(start, end, busy))
+    return result
+
+
+def earliest_start(day, now=None, lead_time_min=None):
+    """
+    這一天最早可以開始的分鐘數 (不含)，整天都已經來不及的日期回傳 None
+    今天必須晚於 現在 + 提前時間；未來的日期不限制 (回傳 -1)
+    """
+    now = now or datetime.now()
+    lead_time_min = LEAD_TIME_MIN if lead_time_min is None else lead_time_min
+    limit = minutes_of_day(now + timedelta(minutes=lead_time_min), day)
+    if limit < 0:
+        return -1
+    if limit >= 24 * 60:
+        return None
+    return limit
+
+def window_grid(windows, step_min, limit=-1):
+    """工作時段內所有候選的開始時間 (每個時段從開始時間起每 step_min 一格，且晚於 limit)"""
+    grid = set()
+    for start, end in windows:
+        grid.update(range(first_grid_point(start, step_min, limit + 1), end, step_min))
+    return sorted(grid)
+
+def slot_grid(day, now=None, step_min=None, lead_time_min=None, windows=None):
+    """某一天工作時段內所有候選的開始時間 (分鐘數)"""
+    step_min = step_min or SLOT_STEP_MIN
+    limit = earliest_start(day, now, lead_time_min)
+    if limit is None:
+        return []
+    return window_grid(default_windows() if windows is None else windows, step_min, limit)
+
+def first_grid_point(open_time, step_min, at_least):
+    """open_time + k * step_min 中第一個 >= at_least 的值"""
+    if at_least <= open_time:
+        return open_time
+    return open_time + -(-(at_least - open_time) // step_min) * step_min
+
+
+def busy_intervals(reservations, day, buffer_min=None, exclude_id=None):
+    """
+    預約 -> 依開始時間排序的忙碌區間 [(開始, 結束), ...] (分鐘數)
+    每個預約前後各加 buffer_min，重疊或相連的區間會合併
+    """
+    buffer_min = BUFFER_MIN if buffer_min is None else buffer_min
+    intervals = []
+    for res in reservations:
+        if exclude_id is not None and str(res.get('reservation_id')) == str(exclude_id):
+            continue
+        start = minutes_of_day(res['reserved_time'], day)
+        intervals.append((start - buffer_min, start + res['duration_min'] + buffer_min))
+    return busy_intervals_from_pairs(intervals)
+
+def busy_intervals_from_pairs(intervals):
+    """[(開始, 結束), ...] -> 排序並合併重疊或相連的區間"""
+    intervals = sorted(intervals)
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+def free_gaps(open_time, close_time, busy):
+    """營業時間扣掉 (已合併排序的) 忙碌區間，回傳空檔 [(開始, 結束), ...]"""
+    gaps = []
+    cursor = open_time
+    for start, end in busy:
+        if end <= cursor:
+            continue
+        if start >= close_time:
+            break
+        if start > cursor:
+            gaps.append((cursor, start))
+        cursor = end
+    if cursor < close_time:
+        gaps.append((cursor, close_time))
+    return gaps
+
+def start_windows(gaps, duration_min):
+    """
+    空檔 -> 可以開始服務的範圍 [(最早, 最晚), ...] (兩端都可)
+    服務必須在空檔結束前做完，所以最晚開始時間 = 空檔結束 - 服務時長
+    """
+    return [(start, end - duration_min) for start, end in gaps if end - start >= duration_min]
+
+def available_starts(windows, open_time, step_min, limit=-1):
+    """可開始範圍 -> 對齊時段格線、且晚於 limit 的開始時間 (一次線性掃描)"""
+    starts = []
+    for earliest, latest in windows:
+        first = first_grid_point(open_time, step_min, max(earliest, limit + 1))
+        starts.extend(range(first, latest + 1, step_min))
+    return starts
+
+
+def day_slots(day, duration_min, reservations, now=None, step_min=None, buffer_min=None,
+              lead_time_min=None, windows=None):
+    """
+    計算某一天可預約的時段，回傳 ['11:00', '11:30', ...]
+    reservations 為當天的預約 (reserved_time, duration_min)
+    windows 為當天的工作時段 (None 表示使用預設營業時間，空列表表示休息)
+    """
+    step_min = step_min or SLOT_STEP_MIN
+    limit = earliest_start(day, now, lead_time_min)
+    if limit is None:
+        return []
+    busy = busy_intervals(reservations, day, buffer_min)
+    starts = []
+    for open_time, close_time in (default_windows() if windows is None else windows):
+        gaps = free_gaps(open_time, close_time, busy)
+        starts.extend(available_starts(start_windows(gaps, duration_min), open_time, step_min, limit))
+    return [format_minutes(start) for start in starts]
+
+def day_windows(day, duration_min, reservations, buffer_min=None, windows=None):
+    """某一天 (單一設計師) 的可開始範圍，給 sweep_available 使用"""
+    busy = busy_intervals(reservations, day, buffer_min)
+    result = []
+    for open_time, close_time in (default_windows() if windows is None else windows):
+        result.extend(start_windows(free_gaps(open_time, close_time, busy), duration_min))
+    return result
+
+def sweep_available(windows_by_key, grid):
+    """
+    Sweep line：合併多位設計師 (key) 的可開始範圍
+    windows_by_key = {key: [(最早, 最晚), ...]}，grid 為排序好的候選時段
+    回傳 [(時段, [可接的 key, ...]), ...]，只包含至少一人可接的時段
+    """
+    # 事件：(時間, 種類, key)；種類 0 = 開始可接，2 = 不再可接
+    # 時段本身以種類 1 排在同一時間的兩者之間，所以範圍兩端都算可接
+    events = []
+    for key, windows in windows_by_key.items():
+        for earliest, latest in windows:
+            events.append((earliest, 0, key))
+            events.append((latest, 2, key))
+    events.sort(key=lambda event: (event[0], event[1]))
+
+    active = {}
+    result = []
+    index = 0
+    for slot in grid:
+        while index < len(events) and (events[index][0], events[index][1]) < (slot, 1):
+            _, kind, key = events[index]
+            if kind == 0:
+                active[key] = active.get(key, 0) + 1
+            else:
+                active[key] -= 1
+                if not active[key]:
+                    del active[key]
+            index += 1
+        if active:
+            result.append((slot, sorted(active)))
+    return result
+
+
+def overlaps(busy, start, end):
+    """
+    [start, end) 是否與忙碌區間重疊 (分鐘數)
+    合併後的區間互不重疊且依序排列，以二分搜尋找開始時間 < end 的最後一個即可
+    """
+    index = bisect_right(busy, (end, float('-inf'))) - 1
+    # 判斷重疊邏輯：(新開始 < 舊結束) AND (新結束 > 舊開始)
+    return index >= 0 and busy[index][1] > start
+
+def nearest_slots(slots, target_min, limit=3):
+    """'HH:MM' 時段中離 target_min 最近的幾個 (依時間排序)，給衝突時建議替代時段用"""
+    closest = sorted(slots, key=lambda slot: (abs(parse_minutes(slot) - target_min), slot))[:limit]
+    return sorted(closest)
+
+def has_conflict(start_time, duration_min, reservations, buffer_min=None, exclude_id=None):
+    """
+    start_time 開始、持續 duration_min 的預約是否與 reservations 重疊 (含緩衝時間)
+    只檢查一次時直接線性掃描 (不用排序)；同一天要檢查多次時，先用 busy_intervals 建好區間再呼叫 overlaps
+    """
+    buffer_min = BUFFER_MIN if buffer_min is None else buffer_min
+    day = start_time.date()
+    start = minutes_of_day(start_time, day) - buffer_min
+    end = start + duration_min + buffer_min * 2
+    for res in reservations:
+        if exclude_id is not None and str(res.get('reservation_id')) == str(exclude_id):
+            continue
+        res_start = minutes_of_day(res['reserved_time'], day)
+        # 判斷重疊邏輯：(新開始 < 舊結束) AND (新結束 > 舊開始)
+        if start < res_start + res['duration_min'] and end > res_start:
+            return True
+    return False
@@ -0,0 +1,219 @@
+"""
+跨 gunicorn worker 共用的快取後端 (記憶體映射檔，不需要外部服務)
+
+檔案配置：
+    [header 64 bytes][tag 版本表 n_tags x 8 bytes][slot 0][slot 1]...
+每個 slot：
+    seq (u64) | key 摘要 (16 bytes) | 到期時間 (f64) | 資料長度 (u32) | 保留 | 資料 (pickle)
+
+- 讀取不加鎖 (seqlock)：讀前後 seq 相同且為偶數才算有效，否則視為未命中
+- 寫入以 flock + 執行緒鎖互斥，寫入期間 seq 為奇數
+- tag 版本號也存在共用區，任一 worker 失效後所有 worker 立即看到
+- slot 數量與大小固定，記憶體用量有上限
+- 放不進 slot 的值 (例如上萬位顧客的 RFM 欄位) 改存在 process 內的 LRU (最多 local_entries 筆)：
+  key 含共用區的 tag 版本號，任一 worker 失效後一樣會換 key，只是每個 worker 各自查一次
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from utils.cache import CacheBackend, MemoryBackend
+
+_MAGIC = b'OCHICACH'
+_HEADER = struct.Struct('<8sIII')          # magic, n_tags, n_slots, slot_size
+_HEADER_SIZE = 64
+_U64 = struct.Struct('<Q')
+_SLOT_HEADER = struct.Struct('<Q16sdI4x')  # seq, key 摘要, 到期時間, 資料長度
+_SLOT_HEADER_SIZE = _SLOT_HEADER.size      # 40 bytes
+
+def _default_path():
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, 'ochi_salon_cache')
+
+def _digest(text, size=16):
+    return hashlib.blake2b(text.encode('utf8'), digest_size=size).digest()
+
+
+class SharedMemoryBackend(CacheBackend):
+    """以 mmap 共用的快取，同一台機器上的所有 worker 共用"""
+
+    def __init__(self, path=None, n_slots=1024, slot_size=32768, n_tags=4096, local_entries=64):
+        self.path = path or _default_path()
+        self.n_slots = n_slots
+        self.slot_size = slot_size
+        self.n_tags = n_tags
+        self._tags_offset = _HEADER_SIZE
+        self._slots_offset = _HEADER_SIZE + n_tags * 8
+        self.size = self._slots_offset + n_slots * slot_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._mm = None
+        self._skipped = 0
+        # 放不進 slot 的值 (只有 key 與資料存在這裡，tag 版本號仍以共用區為準)
+        self._local = MemoryBackend(max_entries=local_entries)
+
+    # --- 檔案與鎖 ---
+
+    def _open(self):
+        """開啟 (必要時初始化) 共用檔；fork 後需要重新開啟，flock 才能在 process 之間互斥"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size != self.size or os.pread(fd, _HEADER.size, 0) != self._header_bytes():
+                    # 新檔案或配置不同：清空重建 (ftruncate 會補 0)
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, self.size)
+                    os.pwrite(fd, self._header_bytes(), 0)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            self._mm = mmap.mmap(fd, self.size)
+            self._fd = fd
+            self._pid = os.getpid()
+
+    def _header_bytes(self):
+        return _HEADER.pack(_MAGIC, self.n_tags, self.n_slots, self.slot_size)
+
+    def _write_locked(self):
+        """寫入時的互斥鎖 (執行緒 + process)"""
+        backend = self
+
+        class _Guard:
+            def __enter__(self):
+                backend._lock.acquire()
+                fcntl.flock(backend._fd, fcntl.LOCK_EX)
+
+            def __exit__(self, *exc):
+                fcntl.flock(backend._fd, fcntl.LOCK_UN)
+                backend._lock.release()
+
+        return _Guard()
+
+    # --- slot 操作 ---
+
+    def _candidates(self, digest):
+        value = int.from_bytes(digest[:8], 'little')
+        first = value % self.n_slots
+        second = (value >> 32) % self.n_slots
+        return (first,) if first == second else (first, second)
+
+    def _slot_offset(self, index):
+        return self._slots_offset + index * self.slot_size
+
+    def _read_slot(self, index, digest):
+        """無鎖讀取：回傳 bytes 或 None"""
+        offset = self._slot_offset(index)
+        mm = self._mm
+        seq, key, expires_at, length = _SLOT_HEADER.unpack_from(mm, offset)
+        if seq & 1 or key != digest or length > self.slot_size - _SLOT_HEADER_SIZE:
+            return None
+        data = mm[offset + _SLOT_HEADER_SIZE:offset + _SLOT_HEADER_SIZE + length]
+        if _U64.unpack_from(mm, offset)[0] != seq:
+            return None  # 讀取期間被改寫
+        if expires_at < time.time():
+            return None
+        return data
+
+    def _write_slot(self, index, digest, expires_at, data):
+        offset = self._slot_offset(index)
+        mm = self._mm
+        seq = _U64.unpack_from(mm, offset)[0]
+        _U64.pack_into(mm, offset, seq + 1)  # 奇數：寫入中
+        mm[offset + _SLOT_HEADER_SIZE:offset + _SLOT_HEADER_SIZE + len(data)] = data
+        _SLOT_HEADER.pack_into(mm, offset, seq + 1, digest, expires_at, len(data))
+        _U64.pack_into(mm, offset, seq + 2)
+
+    # --- CacheBackend 介面 ---
+
+    def get(self, key):
+        self._open()
+        digest = _digest(key)
+        for index in self._candidates(digest):
+            data = self._read_slot(index, digest)
+            if data is not None:
+                return data
+        return self._local.get(key)
+
+    def set(self, key, data, ttl):
+        self._open()
+        if len(data) > self.slot_size - _SLOT_HEADER_SIZE:
+            self._skipped += 1  # 太大，改存在 process 內
+            self._local.set(key, data, ttl)
+            return
+        digest = _digest(key)
+        now = time.time()
+        with self._write_locked():
+            target = None
+            oldest = None
+            for index in self._candidates(digest):
+                _, slot_key, expires_at, _ = _SLOT_HEADER.unpack_from(self._mm, self._slot_offset(index))
+                if slot_key == digest or expires_at < now:
+                    target = index
+                    break
+                if oldest is None or expires_at < oldest[1]:
+                    oldest = (index, expires_at)
+            if target is None:
+                target = oldest[0]  # 兩個位置都有效：淘汰較早到期的
+            self._write_slot(target, digest, now + ttl, data)
+
+    def delete(self, key):
+        self._open()
+        self._local.delete(key)  # 只刪得到這個 process 的；跨 worker 請用 tag 失效
+        digest = _digest(key)
+        with self._write_locked():
+            for index in self._candidates(digest):
+                offset = self._slot_offset(index)
+                _, slot_key, _, _ = _SLOT_HEADER.unpack_from(self._mm, offset)
+                if slot_key == digest:
+                    self._write_slot(index, b'\0' * 16, 0.0, b'')
+
+    def _tag_offset(self, tag):
+        index = int.from_bytes(_digest(tag, 8), 'little') % self.n_tags
+        return self._tags_offset + index * 8
+
+    def get_tag_versions(self, tags):
+        # 不同 tag 可能落在同一格，只會多失效一些，不影響正確性
+        self._open()
+        return [_U64.unpack_from(self._mm, self._tag_offset(tag))[0] for tag in tags]
+
+    def bump_tag(self, tag):
+        self._open()
+        offset = self._tag_offset(tag)
+        with self._write_locked():
+            _U64.pack_into(self._mm, offset, _U64.unpack_from(self._mm, offset)[0] + 1)
+
+    def clear(self):
+        self._open()
+        self._local.clear()
+        with self._write_locked():
+            self._mm[self._tags_offset:self.size] = b'\0' * (self.size - self._tags_offset)
+
+    def stats(self):
+        self._open()
+        now = time.time()
+        entries = 0
+        used_bytes = 0
+        for index in range(self.n_slots):
+            _, _, expires_at, length = _SLOT_HEADER.unpack_from(self._mm, self._slot_offset(index))
+            if expires_at >= now:
+                entries += 1
+                used_bytes += length
+        return {
+            'backend': 'shared',
+            'path': self.path,
+            'entries': entries,
+            'max_entries': self.n_slots,
+            'used_bytes': used_bytes,
+            'capacity_bytes': self.size,
+            'skipped_oversize': self._skipped,
+            'local_entries': self._local.stats()['entries'],
+        }
@@ -0,0 +1,87 @@
+import time
+from flask import Response, current_app, request, stream_with_context
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+def wants_stream():
+    """
+    前端是否要求串流回應
+    - Accept: application/x-ndjson -> 一行一筆 JSON
+    - ?stream=1 -> 一般 JSON 陣列，但邊查邊送
+    """
+    if NDJSON_MIMETYPE in request.headers.get('Accept', ''):
+        return True
+    return request.args.get('stream', '').lower() in ('1', 'true')
+
+def stream_ndjson(rows):
+    """把 rows (可為 generator) 以 NDJSON 串流回傳"""
+    dumps = current_app.json.dumps
+
+    def generate():
+        for row in rows:
+            yield dumps(row) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+def stream_json_array(rows, key=None, trailer=None):
+    """
+    把 rows 以 JSON 陣列串流回傳，記憶體用量固定，第一筆資料查到就開始送出
+    - key: 指定時包成物件 {"key": [...]}
+    - trailer: 包成物件時，rows 送完後才呼叫，回傳的 dict 會附加在物件尾端 (例如統計摘要)
+    """
+    dumps = current_app.json.dumps
+
+    def generate():
+        yield ('{' + dumps(key) + ':[') if key else '['
+        first = True
+        for row in rows:
+            yield ('' if first else ',') + dumps(row)
+            first = False
+        if not key:
+            yield ']'
+            return
+        yield ']'
+        if trailer:
+            for name, value in trailer().items():
+                yield ',' + dumps(name) + ':' + dumps(value)
+        yield '}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+def stream_rows(rows, key=None, trailer=None):
+    """依 Accept header 決定回傳 NDJSON 或串流 JSON"""
+    if NDJSON_MIMETYPE in request.headers.get('Accept', ''):
+        return stream_ndjson(rows)
+    return stream_json_array(rows, key=key, trailer=trailer)
+
+def stream_events(subscription, on_close, heartbeat_sec=15, max_seconds=300):
+    """
+    把訂閱 (utils/pubsub.py) 收到的事件以 Server-Sent Events 送出
+    - event: 事件的 type，data: 事件 JSON
+    - 沒有事件時每 heartbeat_sec 送一行註解，避免被 proxy 斷線
+    - 佇列滿而漏掉事件時送 resync，前端應重新查詢一次
+    - 連線最多維持 max_seconds，之後由瀏覽器 EventSource 自動重連 (不長期佔住 worker)
+    """
+    dumps = current_app.json.dumps
+
+    def generate():
+        deadline = time.monotonic() + max_seconds
+        try:
+            yield "retry: 3000\n\n"
+            while time.monotonic() < deadline:
+                event = subscription.get(timeout=min(heartbeat_sec, max(deadline - time.monotonic(), 0)))
+                if subscription.overflowed:
+                    subscription.overflowed = False
+                    yield "event: resync\ndata: {}\n\n"
+                if event is None:
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {event.get('type', 'message')}\ndata: {dumps(event)}\n\n"
+        finally:
+            on_close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
@@ -0,0 +1,36 @@
+from datetime import date, datetime, timedelta
+
+
+def to_date(value):
+    """把 'YYYY-MM-DD' 字串或 datetime 轉成 date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+def day_range(value):
+    """
+    回傳某一天的半開區間 [當天 00:00, 隔天 00:00)
+    用來取代 DATE(reserved_time) = %s，讓查詢可以使用 reserved_time 的索引
+    """
+    start = datetime.combine(to_date(value), datetime.min.time())
+    return start, start + timedelta(days=1)
+
+def days_range(start_value, end_value):
+    """回傳 [start 當天 00:00, end 隔天 00:00) (end 含當天)"""
+    start, _ = day_range(start_value)
+    _, end = day_range(end_value)
+    return start, end
+
+def month_range(reference=None, offset=0):
+    """
+    回傳 reference 所在月份 (加上 offset 個月) 的半開區間 [月初, 下個月初)
+    用來取代 DATE_FORMAT(reserved_time, '%Y-%m') = ...
+    """
+    reference = reference or datetime.now()
+    month_index = reference.year * 12 + (reference.month - 1) + offset
+    start = datetime(month_index // 12, month_index % 12 + 1, 1)
+    next_index = month_index + 1
+    end = datetime(next_index // 12, next_index % 12 + 1, 1)
+    return start, end